@@ -0,0 +1,138 @@
+# Reglas compartidas del modo de agregación de flows. En ese modo los saltos de una
+# conexión después del switch donde se autoriza (el de entrada del alumno para la ida,
+# el del servidor para la vuelta) no llevan una regla por conexión sino una por
+# switch, puerto de entrada y destino, compartida por todas las conexiones que pasan
+# por ahí. El nombre de una regla compartida se deriva del switch y del match, así que
+# el mismo nombre siempre significa la misma regla y el static flow pusher la reemplaza
+# (por nombre) si cambian las acciones.
+#
+# Una regla compartida se instala con el primer usuario y se borra con el último. Los
+# usuarios registrados salen de las conexiones (índice por regla del registro); aquí se
+# llevan las reservas de las conexiones que se están creando o rehubicando y todavía
+# no quedaron registradas con sus flows nuevos
+import hashlib
+import threading
+from concurrent.futures import Future
+
+PREFIJO = 'agregado-'
+
+
+def es_compartido(nombre):
+    return nombre.startswith(PREFIJO)
+
+
+# Nombre de la regla compartida con ese match en ese switch: {campo: valor} sin
+# acciones ni nombre
+def nombre_compartido(switch, match):
+    texto = ';'.join(f"{campo}={match[campo]}" for campo in sorted(match))
+    digest = hashlib.blake2b(f"{str(switch).lower()}|{texto}".encode(), digest_size=10).hexdigest()
+    return PREFIJO + digest
+
+
+def _resuelto(valor):
+    futuro = Future()
+    futuro.set_result(valor)
+    return futuro
+
+
+class ReglasCompartidas:
+    # `en_uso(nombre, handlers)` dice si alguna conexión registrada fuera de `handlers`
+    # usa la regla; `listo` es la respuesta que reciben las altas y bajas que no hace
+    # falta enviar. Con recordar=False cada alta se envía aunque la regla ya se haya
+    # instalado (p. ej. con timeouts, porque el switch puede haberla vencido); si es una
+    # función se consulta en cada alta. `activo` indica si las conexiones nuevas se
+    # compilan con reglas compartidas
+    def __init__(self, en_uso, listo, recordar=True, activo=False):
+        self.activo = activo
+        self.en_uso = en_uso
+        self.listo = listo
+        self.recordar = recordar
+        self.reservas = {}    # nombre -> {handler}
+        self.reservas_de = {} # handler -> {nombre}
+        self.instaladas = {}  # nombre -> (acciones, Future del alta, si se recordaba al enviarla)
+        # Reentrante: al encolar un alta o una baja el planificador puede completar en
+        # este mismo hilo la operación contraria que reemplaza (y su callback lo toma)
+        self.lock = threading.RLock()
+        self.estadisticas = {"altas": 0, "altas_evitadas": 0, "bajas": 0, "bajas_evitadas": 0}
+
+    # Alta de `flow` para la conexión `handler`: `instalar()` encola el POST y devuelve
+    # su Future. Solo se envía si la regla no se conoce, cambió de acciones o el alta
+    # anterior falló; si no, se devuelve el Future de la anterior. Con handler None
+    # (sincronizaciones globales) se envía siempre y no se reserva. Un alta enviada
+    # cuando no se recordaba (la regla pudo llevar timeout) no evita las siguientes
+    def adquirir(self, flow, handler, instalar):
+        nombre = flow['name']
+        recordar = self.recordar() if callable(self.recordar) else self.recordar
+        with self.lock:
+            if handler is not None:
+                self.reservas.setdefault(nombre, set()).add(handler)
+                self.reservas_de.setdefault(handler, set()).add(nombre)
+                previa = self.instaladas.get(nombre)
+                if recordar and previa is not None and previa[2] and previa[0] == flow.get('actions') and \
+                        (not previa[1].done() or getattr(previa[1].result(), 'ok', False)):
+                    self.estadisticas["altas_evitadas"] += 1
+                    return previa[1]
+            futuro = instalar()
+            self.instaladas[nombre] = (flow.get('actions'), futuro, recordar)
+            self.estadisticas["altas"] += 1
+            return futuro
+
+    def _soltar(self, nombre, handler):
+        usuarios = self.reservas.get(nombre)
+        if usuarios is not None:
+            usuarios.discard(handler)
+            if not usuarios:
+                del self.reservas[nombre]
+        nombres = self.reservas_de.get(handler)
+        if nombres is not None:
+            nombres.discard(nombre)
+            if not nombres:
+                del self.reservas_de[handler]
+
+    # Termina las reservas de una conexión (ya registrada con sus flows, o descartada)
+    def soltar(self, handler):
+        with self.lock:
+            for nombre in list(self.reservas_de.get(handler, ())):
+                self._soltar(nombre, handler)
+
+    # Si alguna conexión que se está creando o rehubicando tiene reservada la regla
+    def reservada(self, nombre):
+        with self.lock:
+            return bool(self.reservas.get(nombre))
+
+    def _usada(self, nombre, usuarios):
+        return bool(self.reservas.get(nombre)) or self.en_uso(nombre, usuarios)
+
+    # Baja de la regla para las conexiones `usuarios` (las que dejan de usarla; en una
+    # revocación en lote, todo el lote): `borrar()` encola el DELETE y devuelve su
+    # Future. Solo se envía si ninguna otra conexión la usa. Si mientras esperaba turno
+    # otra conexión la volvió a tomar (el DELETE queda anulado por el POST) la baja
+    # cuenta como hecha. Con usuarios None se borra sin mirar quién la usa
+    def liberar(self, nombre, usuarios, borrar):
+        with self.lock:
+            if usuarios is not None:
+                usuarios = frozenset(usuarios)
+                for handler in usuarios:
+                    self._soltar(nombre, handler)
+                if self._usada(nombre, usuarios):
+                    self.estadisticas["bajas_evitadas"] += 1
+                    return _resuelto(self.listo)
+            self.instaladas.pop(nombre, None)
+            self.estadisticas["bajas"] += 1
+            futuro = borrar()
+        resultado = Future()
+
+        def terminado(_):
+            respuesta = futuro.result()
+            if not getattr(respuesta, 'ok', False):
+                with self.lock:
+                    if self._usada(nombre, usuarios or frozenset()):
+                        respuesta = self.listo
+            resultado.set_result(respuesta)
+
+        futuro.add_done_callback(terminado)
+        return resultado
+
+    def estado(self):
+        with self.lock:
+            return dict(self.estadisticas, reservadas=len(self.reservas), conocidas=len(self.instaladas))
@@ -0,0 +1,206 @@
+# API HTTP/JSON local del modo daemon: un ThreadingHTTPServer (un hilo por conexión,
+# con keep-alive) que despacha por método y expresión regular sobre la ruta. Cada
+# manejador recibe los grupos de la ruta, la query y el cuerpo JSON y devuelve
+# (status, datos). El estado compartido se protege con un cerrojo de lectura/escritura
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+
+class ErrorAPI(Exception):
+    def __init__(self, status, mensaje):
+        super().__init__(mensaje)
+        self.status = status
+
+
+# Excepciones de los manejadores -> status HTTP
+ERRORES = ((ErrorAPI, None), (LookupError, 404), (ValueError, 400), (ConnectionError, 502))
+
+
+# Varios lectores a la vez o un solo escritor. Los escritores tienen preferencia (un
+# escritor esperando frena a los lectores nuevos) para que las altas y bajas no se
+# posterguen con mucha carga de consultas. El hilo que escribe puede volver a tomar
+# el cerrojo (para leer o escribir) y un lector puede volver a leer
+class CerrojoLecturaEscritura:
+    def __init__(self):
+        self.condicion = threading.Condition(threading.Lock())
+        self.lectores = 0
+        self.escritor = None       # hilo que tiene el cerrojo de escritura
+        self.profundidad = 0       # veces que lo tomó ese hilo
+        self.esperando = 0         # escritores esperando
+        self.local = threading.local()
+
+    def adquirir_lectura(self):
+        hilo = threading.get_ident()
+        lecturas = getattr(self.local, 'lecturas', 0)
+        with self.condicion:
+            if self.escritor == hilo:
+                self.profundidad += 1
+                return
+            if not lecturas:
+                while self.escritor is not None or self.esperando:
+                    self.condicion.wait()
+            self.lectores += 1
+        self.local.lecturas = lecturas + 1
+
+    def liberar_lectura(self):
+        with self.condicion:
+            if self.escritor == threading.get_ident():
+                self.profundidad -= 1
+                return
+            self.lectores -= 1
+            if not self.lectores:
+                self.condicion.notify_all()
+        self.local.lecturas -= 1
+
+    def adquirir_escritura(self):
+        hilo = threading.get_ident()
+        if getattr(self.local, 'lecturas', 0):
+            raise RuntimeError("No se puede escribir mientras se tiene el cerrojo de lectura")
+        with self.condicion:
+            if self.escritor == hilo:
+                self.profundidad += 1
+                return
+            self.esperando += 1
+            while self.escritor is not None or self.lectores:
+                self.condicion.wait()
+            self.esperando -= 1
+            self.escritor = hilo
+            self.profundidad = 1
+
+    def liberar_escritura(self):
+        with self.condicion:
+            self.profundidad -= 1
+            if not self.profundidad:
+                self.escritor = None
+                self.condicion.notify_all()
+
+    def lectura(self):
+        return _Seccion(self.adquirir_lectura, self.liberar_lectura)
+
+    def escritura(self):
+        return _Seccion(self.adquirir_escritura, self.liberar_escritura)
+
+
+class _Seccion:
+    __slots__ = ('adquirir', 'liberar')
+
+    def __init__(self, adquirir, liberar):
+        self.adquirir = adquirir
+        self.liberar = liberar
+
+    def __enter__(self):
+        self.adquirir()
+
+    def __exit__(self, *excepcion):
+        self.liberar()
+
+
+# Cola de conexiones pendientes más larga que la de socketserver (5): con muchos
+# clientes a la vez las conexiones que no entran se rechazan
+class _ServidorHTTP(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class ServidorAPI:
+    # `registrar(nombre, segundos, status, enviados, recibidos)` se llama por petición
+    # (p. ej. para las métricas); el nombre es "<método> <patrón>"
+    def __init__(self, host='127.0.0.1', puerto=8081, registrar=None):
+        self.host = host
+        self.puerto = puerto
+        self.registrar = registrar
+        self.rutas = []  # (método, expresión, patrón, función)
+        self.servidor = None
+
+    # Decorador: @api.ruta('GET', r'/alumnos/([^/]+)')
+    def ruta(self, metodo, patron):
+        def decorador(funcion):
+            self.rutas.append((metodo, re.compile(f"^{patron}/?$"), patron, funcion))
+            return funcion
+        return decorador
+
+    # Devuelve (status, datos, nombre de la ruta). Los manejadores reciben siempre un
+    # objeto JSON como cuerpo: una lista o un escalar es un error del cliente (400)
+    def despachar(self, metodo, camino, consulta, cuerpo):
+        metodos = set()
+        for metodo_ruta, expresion, patron, funcion in self.rutas:
+            encontrado = expresion.match(camino)
+            if encontrado is None:
+                continue
+            if metodo_ruta != metodo:
+                metodos.add(metodo_ruta)
+                continue
+            nombre = f"{metodo} {patron}"
+            try:
+                if not isinstance(cuerpo, dict):
+                    raise ValueError("El cuerpo debe ser un objeto JSON")
+                status, datos = funcion(*map(unquote, encontrado.groups()), consulta=consulta, cuerpo=cuerpo)
+            except Exception as e:
+                for tipo, status in ERRORES:
+                    if isinstance(e, tipo):
+                        return status or e.status, {"error": str(e)}, nombre
+                print(f"API: error en {metodo} {camino}: {e!r}")
+                return 500, {"error": "Error interno"}, nombre
+            return status, datos, nombre
+        if metodos:
+            return 405, {"error": f"Método no permitido (use {', '.join(sorted(metodos))})"}, f"{metodo} -"
+        return 404, {"error": f"No existe {camino}"}, f"{metodo} -"
+
+    def iniciar(self):
+        api = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _atender(self):
+                inicio = time.perf_counter()
+                longitud = int(self.headers.get('Content-Length') or 0)
+                crudo = self.rfile.read(longitud) if longitud else b''
+                partes = urlsplit(self.path)
+                try:
+                    cuerpo = json.loads(crudo) if crudo else {}
+                except ValueError:
+                    status, datos, nombre = 400, {"error": "El cuerpo no es JSON válido"}, f"{self.command} -"
+                else:
+                    status, datos, nombre = api.despachar(self.command, partes.path,
+                                                          dict(parse_qsl(partes.query)), cuerpo)
+                if isinstance(datos, str):
+                    respuesta, tipo = datos.encode(), 'text/plain; version=0.0.4; charset=utf-8'
+                else:
+                    respuesta = json.dumps(datos, ensure_ascii=False, default=list).encode()
+                    tipo = 'application/json; charset=utf-8'
+                self.send_response(status)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(respuesta)))
+                self.end_headers()
+                self.wfile.write(respuesta)
+                if api.registrar is not None:
+                    api.registrar(nombre, time.perf_counter() - inicio, status, len(respuesta), len(crudo))
+
+            do_GET = do_POST = do_PUT = do_DELETE = _atender
+
+        self.servidor = _ServidorHTTP((self.host, self.puerto), Manejador)
+        self.puerto = self.servidor.server_address[1]
+        return self.servidor
+
+    # Atiende hasta que se llame a detener() (o Ctrl+C en el hilo principal)
+    def servir(self):
+        if self.servidor is None:
+            self.iniciar()
+        try:
+            self.servidor.serve_forever()
+        finally:
+            self.servidor.server_close()
+
+    def detener(self):
+        if self.servidor is not None:
+            self.servidor.shutdown()
@@ -0,0 +1,619 @@
+# Benchmarks del Network Policy manager contra un Floodlight simulado en el mismo proceso.
+#
+#   python benchmark.py --alumnos 20000 --cursos 200 --switches 8 --latencia 0.002
+#
+# Levanta un servidor HTTP local que imita /wm/device/, /wm/topology/*, /wm/core/* y
+# /wm/staticflowpusher/*, genera un YAML sintético del tamaño pedido y mide importación,
+# autorización, compilación y simulación de políticas, insertar_flows, creación masiva,
+# rastreo de hosts que se mueven, recuperación del estado desde el diario, recolección
+# de uso y expiración de conexiones inactivas, reimportación, auditoría, huella de
+# flows exacta vs. agregada (y recompilación al otro modo) y borrado de conexiones.
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import main
+
+PUERTO_ENLACE_IZQ = 100
+PUERTO_ENLACE_DER = 101
+
+
+def dpid(i):
+    return ':'.join(f"{b:02x}" for b in (i + 1).to_bytes(8, 'big'))
+
+
+def mac_alumno(i):
+    return ':'.join(f"{b:02x}" for b in (0x44, 0x11) + tuple(i.to_bytes(4, 'big')))
+
+
+def ip_servidor(i):
+    return f"10.1.{i // 250}.{i % 250 + 1}"
+
+
+# Estado del controlador simulado: topología lineal de switches, hosts repartidos entre
+# ellos y la tabla de flows estáticos
+class FloodlightFalso:
+    # `dispositivos` permite que varios controladores simulados vean los mismos hosts
+    def __init__(self, hosts=0, servidores=0, switches=4, latencia=0.0, tasa_fallos=0.0, semilla=1,
+                 dispositivos=None):
+        self.switches = [dpid(i) for i in range(switches)]
+        self.latencia = latencia
+        self.tasa_fallos = tasa_fallos
+        self.random = random.Random(semilla)
+        self.flows = {}
+        self.instalados = {} # nombre -> instante de instalación
+        self.paquetes = {}   # nombre -> paquetes que pasaron por el flow
+        self.llamadas = {}
+        self.lock = threading.Lock()
+        self.dispositivos = dispositivos if dispositivos is not None else []
+        for i in range(hosts if dispositivos is None else 0):
+            self.dispositivos.append(self._dispositivo(mac_alumno(i), f"10.2.{i // 250 % 250}.{i % 250 + 1}",
+                                                       self.switches[i % switches], 1 + i // switches))
+        for i in range(servidores if dispositivos is None else 0):
+            self.dispositivos.append(self._dispositivo(f"fa:16:3e:00:{i // 256:02x}:{i % 256:02x}", ip_servidor(i),
+                                                       self.switches[(switches - 1 - i) % switches], 50 + i // switches))
+        self.enlaces = [{"src-switch": self.switches[i], "src-port": PUERTO_ENLACE_DER,
+                         "dst-switch": self.switches[i + 1], "dst-port": PUERTO_ENLACE_IZQ,
+                         "type": "internal", "direction": "bidirectional"}
+                        for i in range(switches - 1)]
+        self.servidor = None
+
+    def _dispositivo(self, mac, ip, switch, puerto):
+        return {"mac": [mac], "ipv4": [ip], "vlan": [], "lastSeen": int(time.time() * 1000),
+                "attachmentPoint": [{"switchDPID": switch, "port": puerto}]}
+
+    # Mueve el host i a otro switch (el siguiente de la topología lineal) y puerto
+    def mover(self, i):
+        with self.lock:
+            dispositivo = self.dispositivos[i]
+            actual = self.switches.index(dispositivo["attachmentPoint"][0]["switchDPID"])
+            dispositivo["attachmentPoint"] = [{"switchDPID": self.switches[(actual + 1) % len(self.switches)],
+                                               "port": dispositivo["attachmentPoint"][0]["port"] + 1}]
+            dispositivo["lastSeen"] = int(time.time() * 1000)
+
+    def contar(self, clave):
+        with self.lock:
+            self.llamadas[clave] = self.llamadas.get(clave, 0) + 1
+
+    def ruta(self, src, src_port, dst, dst_port):
+        i, j = self.switches.index(src), self.switches.index(dst)
+        paso = 1 if j >= i else -1
+        ruta = []
+        entrada = src_port
+        for k in range(i, j + paso, paso):
+            salida = dst_port if k == j else (PUERTO_ENLACE_DER if paso == 1 else PUERTO_ENLACE_IZQ)
+            ruta.append({"switch": self.switches[k], "port": {"shortPortNumber": int(entrada)}})
+            ruta.append({"switch": self.switches[k], "port": {"shortPortNumber": int(salida)}})
+            entrada = PUERTO_ENLACE_IZQ if paso == 1 else PUERTO_ENLACE_DER
+        return ruta
+
+    # /wm/staticflowpusher/list/<dpid>/json: todos los switches o solo `switch`
+    def lista_flows(self, switch=None):
+        salida = {} if switch is None else {switch: []}
+        with self.lock:
+            flows = [flow for flow in self.flows.values() if switch is None or flow['switch'] == switch]
+        for flow in flows:
+            match = {k: v for k, v in flow.items()
+                     if k not in ('switch', 'name', 'actions', 'priority', 'active', 'idle_timeout', 'hard_timeout')}
+            salida.setdefault(flow['switch'], []).append({flow['name']: {
+                "match": match, "priority": flow.get('priority'),
+                "instructions": {"instruction_apply_actions": {"actions": flow.get('actions', '')}}}})
+        return salida
+
+    # Desordena la tabla como lo haría una sesión que se cortó o un switch que perdió
+    # entradas: borra, modifica (otra salida) y agrega (flows de handlers sin conexión)
+    # `cantidad` flows de cada tipo
+    def desordenar(self, cantidad):
+        with self.lock:
+            nombres = sorted(self.flows)
+            elegidos = self.random.sample(nombres, min(len(nombres), 2 * cantidad))
+            for nombre in elegidos[:cantidad]:
+                del self.flows[nombre]
+            for nombre in elegidos[cantidad:]:
+                self.flows[nombre] = dict(self.flows[nombre], actions="output=99")
+            for i in range(cantidad):
+                nombre = f"{29000000 + i}-Servidor 0-ssh.0.ida"
+                self.flows[nombre] = {"switch": self.switches[i % len(self.switches)], "name": nombre,
+                                      "eth_src": mac_alumno(90000 + i), "actions": "output=1"}
+
+    # Tráfico en los flows indicados (paquetes de 100 bytes)
+    def trafico(self, nombres, paquetes=10):
+        with self.lock:
+            for nombre in nombres:
+                if nombre in self.flows:
+                    self.paquetes[nombre] = self.paquetes.get(nombre, 0) + paquetes
+
+    # /wm/core/switch/all/flow/json con el formato de Floodlight 1.2
+    def estadisticas_flows(self):
+        salida = {}
+        ahora = time.time()
+        with self.lock:
+            flows = [(flow, self.paquetes.get(nombre, 0), self.instalados.get(nombre, ahora))
+                     for nombre, flow in self.flows.items()]
+        for flow, paquetes, instalado in flows:
+            match = {k: v for k, v in flow.items()
+                     if k not in ('switch', 'name', 'actions', 'priority', 'active', 'idle_timeout', 'hard_timeout')}
+            salida.setdefault(flow['switch'], {"flows": []})["flows"].append({
+                "cookie": "45035996273704960", "packet_count": str(paquetes), "byte_count": str(paquetes * 100),
+                "duration_sec": str(int(ahora - instalado)), "priority": flow.get('priority'), "match": match,
+                "instructions": {"instruction_apply_actions": {"actions": flow.get('actions', '')}}})
+        return salida
+
+    def iniciar(self, puerto=0):
+        estado = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Cabeceras y cuerpo en un solo segmento: evita la espera del ACK retardado
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, codigo, datos):
+                cuerpo = json.dumps(datos).encode()
+                self.send_response(codigo)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def _leer(self):
+                longitud = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(longitud) or b'null')
+
+            def _simular(self, metodo):
+                ruta = re.sub(r'/[0-9a-f:]{23}', '/<dpid>', self.path)
+                estado.contar(f"{metodo} {ruta}")
+                if estado.latencia:
+                    time.sleep(estado.latencia)
+                if estado.tasa_fallos and estado.random.random() < estado.tasa_fallos:
+                    self._responder(500, {"status": "fallo simulado"})
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self._simular('GET'):
+                    return
+                partes = self.path.strip('/').split('/')
+                if self.path.startswith('/wm/device'):
+                    return self._responder(200, estado.dispositivos)
+                if self.path.startswith('/wm/topology/route/'):
+                    src, src_port, dst, dst_port = partes[3:7]
+                    return self._responder(200, estado.ruta(src, src_port, dst, dst_port))
+                if self.path.startswith('/wm/topology/links'):
+                    return self._responder(200, estado.enlaces)
+                if self.path.startswith('/wm/core/controller/switches'):
+                    return self._responder(200, [{"switchDPID": s} for s in estado.switches])
+                if self.path.startswith('/wm/staticflowpusher/list'):
+                    return self._responder(200, estado.lista_flows(partes[3] if partes[3] != 'all' else None))
+                if self.path.startswith('/wm/core/switch/all/flow'):
+                    return self._responder(200, estado.estadisticas_flows())
+                self._responder(404, {"status": "no encontrado"})
+
+            # El cuerpo se lee siempre, también cuando se simula un fallo: si quedara sin
+            # leer se interpretaría como la siguiente petición de la conexión keep-alive
+            def do_POST(self):
+                flow = self._leer()
+                if not self._simular('POST'):
+                    return
+                with estado.lock:
+                    estado.flows[flow['name']] = flow
+                    estado.instalados[flow['name']] = time.time()
+                    estado.paquetes.pop(flow['name'], None)
+                self._responder(200, {"status": "Entry pushed"})
+
+            def do_DELETE(self):
+                datos = self._leer()
+                if not self._simular('DELETE'):
+                    return
+                with estado.lock:
+                    estado.flows.pop(datos.get('name'), None)
+                    estado.instalados.pop(datos.get('name'), None)
+                    estado.paquetes.pop(datos.get('name'), None)
+                self._responder(200, {"status": "Entry " + datos.get('name', '') + " deleted"})
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', puerto), Manejador)
+        self.servidor.daemon_threads = True
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.servidor.server_address[1]}"
+
+    def detener(self):
+        if self.servidor:
+            self.servidor.shutdown()
+            self.servidor.server_close()
+
+
+# YAML sintético con el mismo esquema que datos.yaml (mitad de los cursos DICTANDO).
+# Con `cambios` > 0 genera el mismo archivo con esa cantidad de cambios repartidos en
+# partes iguales entre alumnos quitados, MACs nuevas (de los hosts que siguen a los
+# `alumnos` en el controlador simulado), altas, bajas y cambios de estado de cursos
+def generar_yaml(ruta, alumnos=1000, cursos=20, servidores=4, alumnos_por_curso=50, semilla=1, cambios=0):
+    aleatorio = random.Random(semilla)
+    variante = random.Random(semilla + 1)
+    por_tipo = cambios // 5
+    elegidos = variante.sample(range(alumnos), 2 * por_tipo)
+    quitados = set(elegidos[:por_tipo])
+    macs = {i: alumnos + k for k, i in enumerate(elegidos[por_tipo:])}
+    altas, bajas = {}, {}
+    for _ in range(por_tipo):
+        altas.setdefault(variante.randrange(cursos), []).append(variante.choice(elegidos[por_tipo:]))
+        curso = variante.randrange(cursos)
+        bajas[curso] = bajas.get(curso, 0) + 1
+    estados = set(variante.sample(range(cursos), min(cursos, cambios - 4 * por_tipo)))
+    with open(ruta, 'w') as archivo:
+        archivo.write("alumnos:\n")
+        for i in range(alumnos):
+            if i not in quitados:
+                archivo.write(f"  - nombre: Alumno {i}\n    codigo: {20000000 + i}\n"
+                              f"    mac: \"{mac_alumno(macs.get(i, i))}\"\n")
+        archivo.write("cursos:\n")
+        for c in range(cursos):
+            dictando = (c % 2 == 0) != (c in estados)
+            archivo.write(f"  - codigo: CUR{c:04d}\n    estado: {'DICTANDO' if dictando else 'INACTIVO'}\n"
+                          f"    nombre: Curso {c}\n    alumnos:\n")
+            miembros = aleatorio.sample(range(alumnos), min(alumnos_por_curso, alumnos))[bajas.get(c, 0):]
+            miembros += [i for i in altas.get(c, ()) if i not in miembros]
+            for i in miembros:
+                if i not in quitados:
+                    archivo.write(f"      - {20000000 + i}\n")
+            archivo.write("    servidores:\n")
+            for k in aleatorio.sample(range(servidores), min(2, servidores)):
+                archivo.write(f"      - nombre: Servidor {k}\n        servicios_permitidos:\n"
+                              f"          - ssh\n          - web\n")
+        archivo.write("servidores:\n")
+        for k in range(servidores):
+            archivo.write(f"  - nombre: \"Servidor {k}\"\n    ip: {ip_servidor(k)}\n    servicios:\n"
+                          f"      - nombre: ssh\n        protocolo: TCP\n        puerto: 22\n"
+                          f"      - nombre: web\n        protocolo: TCP\n        puerto: 80\n")
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+def resumen(nombre, latencias, total_segundos, operaciones=None):
+    operaciones = operaciones if operaciones is not None else len(latencias)
+    return {
+        "benchmark": nombre,
+        "operaciones": operaciones,
+        "segundos": total_segundos,
+        "ops_por_segundo": operaciones / total_segundos if total_segundos > 0 else 0.0,
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p95_ms": percentil(latencias, 95) * 1000,
+        "p99_ms": percentil(latencias, 99) * 1000,
+    }
+
+
+@contextlib.contextmanager
+def silencio():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def medir(funcion, repeticiones):
+    latencias = []
+    inicio = time.perf_counter()
+    for i in range(repeticiones):
+        t = time.perf_counter()
+        funcion(i)
+        latencias.append(time.perf_counter() - t)
+    return latencias, time.perf_counter() - inicio
+
+
+def bench_importar(ruta, repeticiones):
+    with silencio():
+        latencias, total = medir(lambda _: main.cargar_datos(ruta), repeticiones)
+    return resumen("importar_datos", latencias, total)
+
+
+def bench_autorizacion(muestras, semilla=1):
+    aleatorio = random.Random(semilla)
+    lista_alumnos = list(main.alumnos)
+    lista_servidores = list(main.servidores)
+    consultas = [(aleatorio.choice(lista_alumnos), aleatorio.choice(lista_servidores).nombre,
+                  aleatorio.choice(('ssh', 'web'))) for _ in range(muestras)]
+    latencias, total = medir(lambda i: main.autorizar(*consultas[i]), muestras)
+    return resumen("autorizacion", latencias, total)
+
+
+# Compilación completa de la matriz de políticas y simulación de cambiar el estado de un curso
+def bench_politicas(repeticiones):
+    latencias, total = medir(lambda _: main.compilar_politicas(), repeticiones)
+    filas = [resumen("compilar_politicas", latencias, total)]
+    matriz = main.politicas_vigentes()
+    curso = next(iter(main.cursos))
+    estado = "INACTIVO" if curso.estado == "DICTANDO" else "DICTANDO"
+    latencias, total = medir(lambda _: main.simular_politicas({curso.codigo: estado}, matriz=matriz), repeticiones)
+    filas.append(resumen("simular_politicas", latencias, total))
+    return filas
+
+
+def bench_insertar_flows(muestras):
+    solicitudes = main.solicitudes_de_cursos()[:muestras]
+    datos = []
+    for solicitud in solicitudes:
+        alumno, servidor, servicio, _ = main.resolver_conexion(*solicitud)
+        datos.append((alumno.mac, servidor.direccion_ip, servicio.protocolo, servicio.puerto,
+                      f"bench-{alumno.codigo}-{servicio.nombre}"))
+    instalados = []
+    with silencio():
+        latencias, total = medir(lambda i: instalados.extend(main.insertar_flows(*datos[i]) or []), len(datos))
+        handlers = {handler for *_, handler in datos}
+        for handler in handlers:
+            main.liberar_handler(handler)
+        main.eliminar_flows(instalados, usuarios=handlers)
+    return resumen("insertar_flows", latencias, total)
+
+
+def bench_creacion_masiva(limite, workers):
+    solicitudes = main.solicitudes_de_cursos()[:limite]
+    with silencio():
+        inicio = time.perf_counter()
+        resultados, datos = main.crear_conexiones_masivas(solicitudes, workers=workers)
+        total = time.perf_counter() - inicio
+    fila = resumen("creacion_masiva", [], total, datos["exitosas"])
+    fila["fallidas"] = datos["fallidas"]
+    return fila
+
+
+# Sondeo del rastreador sin cambios (costo de base) y tras mover hosts con conexiones
+def bench_rastreador(falso, movimientos, repeticiones):
+    rastreador = main.RastreadorDispositivos()
+    with silencio():
+        rastreador.sondear()
+        latencias, total = medir(lambda _: rastreador.sondear(), repeticiones)
+    filas = [resumen("rastreo_sin_cambios", latencias, total)]
+
+    macs = {c.alumno.mac for c in main.conexiones}
+    indices = [i for i, d in enumerate(falso.dispositivos) if d["mac"][0] in macs][:movimientos]
+    for i in indices:
+        falso.mover(i)
+    with silencio():
+        inicio = time.perf_counter()
+        rehubicadas, fallidas = rastreador.sondear()
+        total = time.perf_counter() - inicio
+    fila = resumen("rastreo_movimientos", [], total, len(rehubicadas))
+    fila["fallidas"] = len(fallidas)
+    filas.append(fila)
+    return filas
+
+
+# Recuperación sin consultar al controlador: snapshot sin conexiones más un diario con
+# un registro por conexión
+def bench_recuperacion(directorio, repeticiones):
+    ruta = os.path.join(directorio, 'estado.snap')
+    existentes = list(main.conexiones)
+    with silencio():
+        main.conexiones.limpiar()
+        main.guardar_datos(ruta, 'snap')
+        main.conexiones.reemplazar(existentes)
+    diario = main.Diario(main.ruta_diario(ruta))
+    for conexion in existentes:
+        diario.anotar(('conexion',) + main.tupla_conexion(conexion))
+    diario.cerrar()
+
+    with silencio():
+        latencias, total = medir(lambda _: main.recuperar_estado(ruta), repeticiones)
+        main.cerrar_diario()
+    fila = resumen("recuperacion_diario", latencias, total, len(existentes) * repeticiones)
+    fila["recuperadas"] = len(main.conexiones)
+    return fila
+
+
+# Recolección de contadores (una referencia y luego con tráfico en la mitad de las
+# conexiones) y expiración de la otra mitad, que quedó sin tráfico
+def bench_uso(falsos, repeticiones):
+    recolector = main.RecolectorUso()
+    with silencio():
+        recolector.recolectar()
+    activas = [c for i, c in enumerate(main.conexiones) if i % 2 == 0]
+    for falso in falsos:
+        falso.trafico([nombre for c in activas for nombre in c.flows])
+    with silencio():
+        inicio = time.perf_counter()
+        latencias, total = medir(lambda _: recolector.recolectar(), repeticiones)
+    filas = [resumen("recoleccion_uso", latencias, total, recolector.estadisticas["flows_contados"] * repeticiones)]
+
+    # Las activas tuvieron actividad durante las recolecciones medidas; las demás, antes
+    umbral = time.perf_counter() - inicio
+    with silencio():
+        t = time.perf_counter()
+        revocadas, fallidas = recolector.expirar(umbral)
+        total = time.perf_counter() - t
+    fila = resumen("expiracion_inactivas", [], total, len(revocadas))
+    fila["fallidas"] = len(fallidas)
+    filas.append(fila)
+    return filas
+
+
+# Reimportación incremental de un archivo con `cambios` cambios sobre el estado actual
+# (con las conexiones de la creación masiva): diferencia, aplicación y llamadas al
+# controlador solo para las conexiones afectadas
+def bench_reimportacion(ruta):
+    with silencio():
+        inicio = time.perf_counter()
+        resultado = main.reimportar_datos(ruta)
+        total = time.perf_counter() - inicio
+    cambios = sum(resultado[clave] for clave in ('alumnos_quitados', 'macs', 'altas', 'bajas', 'estados'))
+    fila = resumen("reimportacion", [], total, cambios)
+    fila["aplicacion_ms"] = resultado["aplicacion"] * 1000
+    fila["revocadas"] = len(resultado["conexiones_revocadas"])
+    fila["reinstaladas"] = len(resultado["conexiones_reinstaladas"])
+    fila["fallidas"] = len(resultado["revocaciones_fallidas"]) + len(resultado["reinstalaciones_fallidas"])
+    return fila
+
+
+# Auditoría de las tablas de todos los switches tras desordenar `cantidad` flows de cada
+# tipo (faltantes, distintos y sobrantes), y reparación en lotes
+def bench_auditoria(falsos, cantidad, workers):
+    for falso in falsos:
+        falso.desordenar(cantidad)
+    with silencio():
+        inicio = time.perf_counter()
+        resultado = main.auditar_flows(workers=workers)
+        total = time.perf_counter() - inicio
+    fila = resumen("auditoria", [], total, resultado["flows"])
+    fila["encontrados"] = resultado["faltantes"] + resultado["distintos"] + resultado["sobrantes"]
+    filas = [fila]
+    with silencio():
+        inicio = time.perf_counter()
+        resultado = main.auditar_flows(reparar=True, workers=workers)
+        total = time.perf_counter() - inicio
+        pendientes = main.auditar_flows(workers=workers)
+    fila = resumen("auditoria_reparacion", [], total, resultado["reinstalados"] + resultado["borrados"])
+    fila["fallidas"] = len(resultado["fallidos"])
+    fila["pendientes"] = pendientes["faltantes"] + pendientes["distintos"] + pendientes["sobrantes"]
+    filas.append(fila)
+    return filas
+
+
+# Reglas que necesitan las conexiones registradas con y sin agregación, y recompilación
+# de todas al otro modo: reglas en las tablas antes y después, y auditoría posterior
+def bench_agregacion(falsos, workers):
+    with silencio():
+        inicio = time.perf_counter()
+        huella = main.huella_flows()
+        total = time.perf_counter() - inicio
+    fila = resumen("huella_flows", [], total, huella["conexiones"])
+    fila["exacto"], fila["agregado"], fila["compartidas"] = huella["exacto"], huella["agregado"], huella["compartidas"]
+    filas = [fila]
+
+    antes = sum(len(falso.flows) for falso in falsos)
+    main.reglas_compartidas.activo = not main.reglas_compartidas.activo
+    with silencio():
+        inicio = time.perf_counter()
+        rehubicadas, fallidas = main.rehubicar(list(main.conexiones))
+        total = time.perf_counter() - inicio
+        pendientes = main.auditar_flows(workers=workers)
+    fila = resumen("recompilacion_" + ("agregada" if main.reglas_compartidas.activo else "exacta"), [], total,
+                   len(rehubicadas))
+    fila["fallidas"] = len(fallidas)
+    fila["reglas_antes"], fila["reglas_despues"] = antes, sum(len(falso.flows) for falso in falsos)
+    fila["pendientes"] = pendientes["faltantes"] + pendientes["distintos"] + pendientes["sobrantes"]
+    filas.append(fila)
+    return filas
+
+
+def bench_borrado(workers):
+    handlers = [c.handler for c in main.conexiones]
+    latencias = []
+    lock = threading.Lock()
+
+    def borrar(handler):
+        t = time.perf_counter()
+        main.desconectar(handler)
+        with lock:
+            latencias.append(time.perf_counter() - t)
+
+    with silencio():
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(borrar, handlers))
+        total = time.perf_counter() - inicio
+    return resumen("borrado_conexiones", latencias, total)
+
+
+def imprimir(filas):
+    columnas = ["benchmark", "operaciones", "segundos", "ops_por_segundo", "p50_ms", "p95_ms", "p99_ms"]
+    print(" | ".join(f"{c:>18}" for c in columnas))
+    for fila in filas:
+        print(" | ".join(f"{fila[c]:>18.3f}" if isinstance(fila[c], float) else f"{fila[c]:>18}" for c in columnas))
+
+
+def ejecutar(args):
+    falso = FloodlightFalso(hosts=args.alumnos + args.cambios, servidores=args.servidores, switches=args.switches,
+                            latencia=args.latencia, tasa_fallos=args.fallos)
+    falsos = [falso] + [FloodlightFalso(switches=args.switches, latencia=args.latencia, tasa_fallos=args.fallos,
+                                        semilla=i + 1, dispositivos=falso.dispositivos)
+                        for i in range(1, args.controladores)]
+    urls = [f.iniciar() for f in falsos]
+    # Con pocos switches el hashing consistente reparte desparejo: se asignan en ronda
+    asignados = {switch: urls[i % len(urls)] for i, switch in enumerate(falso.switches)} if len(urls) > 1 else None
+    main.configurar_controlador(','.join(urls), timeout=10, asignados=asignados)
+    main.escrituras.tasa = args.escrituras_por_segundo
+    main.reglas_compartidas.activo = args.agregar
+    filas = []
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'bench.yaml')
+        generar_yaml(ruta, args.alumnos, args.cursos, args.servidores, args.alumnos_por_curso)
+        filas.append(bench_importar(ruta, args.repeticiones))
+        filas.append(bench_autorizacion(args.muestras))
+        filas.extend(bench_politicas(args.repeticiones))
+        filas.append(bench_insertar_flows(args.flows))
+        filas.append(bench_creacion_masiva(args.conexiones, args.workers))
+        filas.extend(bench_rastreador(falso, args.movimientos, args.repeticiones))
+        filas.append(bench_recuperacion(directorio, args.repeticiones))
+        filas.extend(bench_uso(falsos, args.repeticiones))
+        ruta_cambios = os.path.join(directorio, 'cambios.yaml')
+        generar_yaml(ruta_cambios, args.alumnos, args.cursos, args.servidores, args.alumnos_por_curso,
+                     cambios=args.cambios)
+        filas.append(bench_reimportacion(ruta_cambios))
+        filas.extend(bench_auditoria(falsos, args.desordenados, args.workers))
+        filas.extend(bench_agregacion(falsos, args.workers))
+        filas.append(bench_borrado(args.workers))
+        # Con reglas compartidas, la última conexión que se borra se lleva las suyas
+        filas[-1]["reglas_restantes"] = sum(len(falso.flows) for falso in falsos)
+    llamadas = {}
+    for f in falsos:
+        f.detener()
+        for clave, cantidad in f.llamadas.items():
+            llamadas[clave] = llamadas.get(clave, 0) + cantidad
+    return filas, llamadas
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks contra un Floodlight simulado")
+    parser.add_argument('--alumnos', type=int, default=2000)
+    parser.add_argument('--cursos', type=int, default=40)
+    parser.add_argument('--servidores', type=int, default=4)
+    parser.add_argument('--alumnos-por-curso', type=int, default=50)
+    parser.add_argument('--switches', type=int, default=4)
+    parser.add_argument('--controladores', type=int, default=1,
+                        help="controladores simulados; los switches se reparten entre ellos")
+    parser.add_argument('--latencia', type=float, default=0.0, help="latencia simulada por llamada (s)")
+    parser.add_argument('--fallos', type=float, default=0.0, help="fracción de llamadas que fallan (0-1)")
+    parser.add_argument('--repeticiones', type=int, default=3, help="importaciones a medir")
+    parser.add_argument('--muestras', type=int, default=100000, help="consultas de autorización")
+    parser.add_argument('--flows', type=int, default=200, help="llamadas a insertar_flows")
+    parser.add_argument('--conexiones', type=int, default=2000, help="conexiones en la creación masiva")
+    parser.add_argument('--workers', type=int, default=main.BULK_WORKERS)
+    parser.add_argument('--escrituras-por-segundo', type=float, default=0.0,
+                        help="tope de escrituras al controlador (0 = sin tope)")
+    parser.add_argument('--movimientos', type=int, default=100, help="hosts con conexiones que se mueven")
+    parser.add_argument('--desordenados', type=int, default=50,
+                        help="flows faltantes, distintos y sobrantes antes de la auditoría")
+    parser.add_argument('--cambios', type=int, default=50, help="cambios del archivo reimportado")
+    parser.add_argument('--agregar', action='store_true',
+                        help="crear las conexiones con reglas compartidas (y recompilarlas después sin agregación)")
+    parser.add_argument('--json', action='store_true', help="salida JSON")
+    return parser
+
+
+if __name__ == '__main__':
+    argumentos = crear_parser().parse_args()
+    resultado, llamadas = ejecutar(argumentos)
+    escrituras = main.escrituras.estado()
+    if argumentos.json:
+        print(json.dumps({"resultados": resultado, "llamadas": llamadas, "escrituras": escrituras}, indent=2))
+    else:
+        imprimir(resultado)
+        print("\nLlamadas al controlador:")
+        for clave, cantidad in sorted(llamadas.items()):
+            print(f"  {clave}: {cantidad}")
+        print("\nEscrituras: " + ", ".join(f"{clave} {escrituras[clave]}" for clave in
+                                          ('enviadas', 'completadas', 'fallidas', 'reintentos', 'combinadas')))
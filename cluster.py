@@ -0,0 +1,104 @@
+# Varios controladores, cada uno dueño de un conjunto de switches. Un switch se asigna
+# por el mapa explícito DPID -> controlador o, si no figura, por hashing consistente
+# (anillo con nodos virtuales: agregar o quitar un controlador solo mueve los switches
+# de su tramo). También se combinan aquí las lecturas que se reparten entre todos
+import bisect
+import hashlib
+import json
+
+NODOS_VIRTUALES = 160
+
+
+def _hash(valor):
+    return int.from_bytes(hashlib.blake2b(str(valor).encode(), digest_size=8).digest(), 'big')
+
+
+def normalizar_dpid(dpid):
+    return str(dpid).lower()
+
+
+# Los puntos del anillo dependen de la identidad del miembro (su URL), no de su
+# posición en la lista: quitar un controlador del medio no mueve los de los demás
+def _identidad(miembro):
+    return getattr(miembro, 'base_url', miembro)
+
+
+class MapaSwitches:
+    def __init__(self, miembros, asignados=None, nodos_virtuales=NODOS_VIRTUALES):
+        self.miembros = list(miembros)
+        self.asignados = {normalizar_dpid(dpid): miembro for dpid, miembro in (asignados or {}).items()}
+        anillo = sorted((_hash(f"{_identidad(miembro)}#{v}"), i) for i, miembro in enumerate(self.miembros)
+                        for v in range(nodos_virtuales))
+        self.puntos = [punto for punto, _ in anillo]
+        self.duenos = [self.miembros[i] for _, i in anillo]
+        self.cache = {}
+
+    def dueno(self, dpid):
+        dpid = normalizar_dpid(dpid)
+        miembro = self.asignados.get(dpid) or self.cache.get(dpid)
+        if miembro is None:
+            i = bisect.bisect(self.puntos, _hash(dpid)) % len(self.puntos)
+            miembro = self.cache[dpid] = self.duenos[i]
+        return miembro
+
+
+def _dispositivos(datos):
+    # Floodlight >= 1.2 devuelve {"devices": [...]}
+    if isinstance(datos, dict):
+        return datos.get('devices') or []
+    return datos or []
+
+
+# Un dispositivo visto por un controlador conserva solo los puntos de conexión en
+# switches de ese controlador. Si no le queda ninguno lo informa otro controlador y se
+# descarta (None); los que no tienen punto de conexión se dejan pasar
+def filtrar_dispositivo(dispositivo, miembro, mapa):
+    puntos = dispositivo.get('attachmentPoint') or []
+    if not puntos:
+        return dispositivo
+    propios = [p for p in puntos if mapa.dueno(p.get('switchDPID')) is miembro]
+    if not propios:
+        return None
+    if len(propios) == len(puntos):
+        return dispositivo
+    return dict(dispositivo, attachmentPoint=propios)
+
+
+def _sin_repetidos(listas):
+    vistos = set()
+    resultado = []
+    for lista in listas:
+        for elemento in lista or []:
+            firma = json.dumps(elemento, sort_keys=True)
+            if firma not in vistos:
+                vistos.add(firma)
+                resultado.append(elemento)
+    return resultado
+
+
+# Combina las respuestas de una lectura repartida: [(miembro, datos)]
+def combinar(ruta, respuestas, mapa):
+    if ruta.startswith('/wm/device'):
+        resultado, vistos = [], set()
+        for miembro, datos in respuestas:
+            for dispositivo in _dispositivos(datos):
+                dispositivo = filtrar_dispositivo(dispositivo, miembro, mapa)
+                if dispositivo is None:
+                    continue
+                macs = tuple(dispositivo.get('mac') or ())
+                if macs and macs in vistos:
+                    continue
+                vistos.add(macs)
+                resultado.append(dispositivo)
+        return resultado
+    if all(isinstance(datos, dict) for _, datos in respuestas):
+        # p. ej. /wm/staticflowpusher/list/all/json: {dpid: [flows]}
+        resultado = {}
+        for _, datos in respuestas:
+            for clave, valor in datos.items():
+                if isinstance(valor, list) and isinstance(resultado.get(clave), list):
+                    resultado[clave] = resultado[clave] + valor
+                else:
+                    resultado.setdefault(clave, valor)
+        return resultado
+    return _sin_repetidos(datos for _, datos in respuestas if isinstance(datos, list))
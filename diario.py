@@ -0,0 +1,147 @@
+# Diario (write-ahead log) de las mutaciones del estado: registros serializados con
+# marshal, precedidos de su longitud y CRC32, que se agregan al final del archivo.
+# Los fsync se agrupan: un hilo escribe lo pendiente como mucho `intervalo` segundos
+# después del primer registro, o antes si se juntan `lote` registros. Si una escritura
+# falla los registros vuelven a la cola (no se pierden), el hilo reintenta cada
+# `REINTENTO` segundos y el error se informa en `anotar` y `cerrar` hasta que una
+# escritura funcione
+import marshal
+import os
+import struct
+import threading
+import time
+import zlib
+
+_REGISTRO = struct.Struct('<II')    # longitud, crc32
+REINTENTO = 1.0
+
+
+# Lee los registros válidos del diario. Devuelve (registros, bytes válidos); una cola
+# incompleta o corrupta (caída a mitad de una escritura) se descarta
+def leer_diario(ruta):
+    try:
+        with open(ruta, 'rb') as archivo:
+            datos = archivo.read()
+    except FileNotFoundError:
+        return [], 0
+    registros = []
+    offset = 0
+    while offset + _REGISTRO.size <= len(datos):
+        longitud, crc = _REGISTRO.unpack_from(datos, offset)
+        inicio = offset + _REGISTRO.size
+        cuerpo = datos[inicio:inicio + longitud]
+        if len(cuerpo) != longitud or zlib.crc32(cuerpo) != crc:
+            break
+        try:
+            registros.append(marshal.loads(cuerpo))
+        except (EOFError, ValueError, TypeError):
+            break
+        offset = inicio + longitud
+    return registros, offset
+
+
+class Diario:
+    def __init__(self, ruta, lote=256, intervalo=0.05, registros=0, validos=None):
+        self.ruta = ruta
+        self.lote = lote
+        self.intervalo = intervalo
+        self.fd = os.open(ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if validos is not None and validos < os.fstat(self.fd).st_size:
+            os.ftruncate(self.fd, validos)
+        self.tamano = os.fstat(self.fd).st_size
+        self.registros = registros # registros desde la última compactación
+        self.pendientes = []       # registros codificados aún no escritos
+        self.lock = threading.Lock()
+        self.lock_escritura = threading.Lock()
+        self.hay_pendientes = threading.Event()
+        self.cerrado = False
+        self.error = None          # OSError de la última escritura, si falló
+        self.hilo = threading.Thread(target=self._bucle, name='diario', daemon=True)
+        self.hilo.start()
+
+    def anotar(self, registro):
+        cuerpo = marshal.dumps(registro)
+        with self.lock:
+            if self.cerrado:
+                raise ValueError(f"{self.ruta}: diario cerrado")
+            self.pendientes.append(_REGISTRO.pack(len(cuerpo), zlib.crc32(cuerpo)) + cuerpo)
+            self.registros += 1
+            lleno = len(self.pendientes) >= self.lote
+        # Con una escritura fallida pendiente se reintenta aquí mismo para informar si
+        # sigue fallando (el registro ya quedó en la cola)
+        if lleno or self.error is not None:
+            self.sincronizar()
+        else:
+            self.hay_pendientes.set()
+
+    def _bucle(self):
+        while True:
+            self.hay_pendientes.wait()
+            self.hay_pendientes.clear()
+            if self.cerrado:
+                break
+            # Ventana para que se junten más registros en el mismo fsync
+            time.sleep(self.intervalo)
+            try:
+                self.sincronizar()
+            except OSError:
+                # Queda en self.error; se reintenta más tarde
+                time.sleep(REINTENTO)
+                self.hay_pendientes.set()
+
+    # Escribe y hace fsync de todo lo pendiente. Si falla, lo escrito a medias se recorta
+    # (para no dejar basura entre registros), lo pendiente vuelve al frente de la cola y
+    # se lanza un OSError que también queda en self.error
+    def sincronizar(self):
+        with self.lock_escritura:
+            with self.lock:
+                pendientes, self.pendientes = self.pendientes, []
+            if not pendientes:
+                return
+            try:
+                datos = memoryview(b''.join(pendientes))
+                while datos:
+                    datos = datos[os.write(self.fd, datos):]
+                os.fsync(self.fd)
+            except OSError as e:
+                try:
+                    os.ftruncate(self.fd, self.tamano)
+                except OSError:
+                    pass
+                with self.lock:
+                    self.pendientes[:0] = pendientes
+                    self.error = OSError(e.errno, f"{self.ruta}: no se pudo escribir el diario "
+                                                  f"({e.strerror or e}); {len(self.pendientes)} registros pendientes")
+                raise self.error from e
+            self.tamano += sum(len(p) for p in pendientes)
+            self.error = None
+
+    # Escribe el estado completo con `escribir` (p. ej. un snapshot atómico) y vacía el
+    # diario. Mientras tanto no se aceptan registros nuevos, así que cualquier mutación
+    # posterior al snapshot queda anotada después del truncado
+    def compactar(self, escribir):
+        with self.lock_escritura:
+            with self.lock:
+                resultado = escribir()
+                if resultado is False:
+                    return False
+                self.pendientes = []
+                os.ftruncate(self.fd, 0)
+                os.fsync(self.fd)
+                self.tamano = 0
+                self.registros = 0
+                self.error = None
+        return resultado
+
+    # Lanza OSError si lo pendiente no se pudo escribir (el archivo se cierra igual)
+    def cerrar(self):
+        if self.cerrado:
+            return
+        with self.lock:
+            self.cerrado = True
+        self.hay_pendientes.set()
+        self.hilo.join()
+        try:
+            self.sincronizar()
+        finally:
+            os.close(self.fd)
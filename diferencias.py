@@ -0,0 +1,145 @@
+# Diferencia estructural entre el estado vigente y un archivo nuevo. Trabaja sobre las
+# secciones del snapshot (tuplas de tipos básicos, con referencias por código/nombre)
+# y devuelve los registros del diario que llevan de uno al otro: cada registro fija el
+# valor completo de un alumno, servidor o curso, o lo quita. Junto con los registros
+# se arma lo necesario para seguir los efectos sobre las conexiones: qué accesos
+# pueden perderse (alumnos y servicios a revisar) y qué conexiones hay que reinstalar
+# porque cambió la MAC del alumno, la IP del servidor o el protocolo/puerto del servicio
+
+
+def _minusculas(nombre):
+    return str(nombre).lower()
+
+
+class Diferencia:
+    def __init__(self):
+        self.registros = []
+        self.alumnos_nuevos, self.alumnos_quitados, self.macs, self.renombrados = [], [], [], []
+        self.servidores_nuevos, self.servidores_quitados, self.ips = [], [], []
+        self.servicios_nuevos, self.servicios_quitados, self.servicios_cambiados = [], [], []
+        self.cursos_nuevos, self.cursos_quitados, self.estados, self.cursos_cambiados = [], [], [], []
+        self.altas, self.bajas = [], []
+        self.revisar_alumnos = set()   # códigos que pueden haber perdido accesos
+        self.revisar_servicios = set() # (servidor, servicio) que pueden haber desaparecido
+
+    def __bool__(self):
+        return bool(self.registros)
+
+    # Cantidad de cambios por tipo
+    def resumen(self):
+        return {
+            "alumnos_nuevos": len(self.alumnos_nuevos), "alumnos_quitados": len(self.alumnos_quitados),
+            "macs": len(self.macs), "alumnos_renombrados": len(self.renombrados),
+            "servidores_nuevos": len(self.servidores_nuevos), "servidores_quitados": len(self.servidores_quitados),
+            "ips": len(self.ips), "servicios_nuevos": len(self.servicios_nuevos),
+            "servicios_quitados": len(self.servicios_quitados), "servicios_cambiados": len(self.servicios_cambiados),
+            "cursos_nuevos": len(self.cursos_nuevos), "cursos_quitados": len(self.cursos_quitados),
+            "estados": len(self.estados), "cursos_cambiados": len(self.cursos_cambiados),
+            "altas": len(self.altas), "bajas": len(self.bajas),
+        }
+
+
+def _por_clave(filas, clave):
+    return {clave(fila): fila for fila in filas}
+
+
+def _servicios(servidor):
+    return {_minusculas(nombre): (nombre, protocolo, puerto) for nombre, protocolo, puerto in servidor[2]}
+
+
+def _servidores_curso(curso):
+    return {_minusculas(nombre): frozenset(permitidos) for nombre, permitidos in curso[4]}
+
+
+# `actual` y `nuevo`: {'alumnos': ..., 'servidores': ..., 'cursos': ...} con el esquema
+# de secciones_estado(). Los registros quedan en un orden aplicable: primero se fijan
+# servidores, alumnos y cursos (los cursos los referencian) y después se quitan cursos,
+# alumnos y servidores
+def diferencia(actual, nuevo):
+    resultado = Diferencia()
+    registros = resultado.registros
+
+    servidores_antes = _por_clave(actual['servidores'], lambda s: _minusculas(s[0]))
+    servidores_despues = _por_clave(nuevo['servidores'], lambda s: _minusculas(s[0]))
+    for clave, servidor in servidores_despues.items():
+        anterior = servidores_antes.get(clave)
+        if anterior is None:
+            resultado.servidores_nuevos.append(servidor[0])
+            registros.append(('servidor',) + tuple(servidor))
+            continue
+        if tuple(anterior) == tuple(servidor):
+            continue
+        if anterior[1] != servidor[1]:
+            resultado.ips.append(servidor[0])
+        servicios_antes, servicios_despues = _servicios(anterior), _servicios(servidor)
+        for svc, servicio in servicios_despues.items():
+            previo = servicios_antes.get(svc)
+            if previo is None:
+                resultado.servicios_nuevos.append((servidor[0], servicio[0]))
+            elif previo[1:] != servicio[1:]:
+                resultado.servicios_cambiados.append((servidor[0], servicio[0]))
+        for svc, servicio in servicios_antes.items():
+            if svc not in servicios_despues:
+                resultado.servicios_quitados.append((anterior[0], servicio[0]))
+                resultado.revisar_servicios.add((anterior[0], servicio[0]))
+        registros.append(('servidor',) + tuple(servidor))
+
+    alumnos_antes = _por_clave(actual['alumnos'], lambda a: str(a[1]))
+    alumnos_despues = _por_clave(nuevo['alumnos'], lambda a: str(a[1]))
+    for codigo, alumno in alumnos_despues.items():
+        anterior = alumnos_antes.get(codigo)
+        if anterior is None:
+            resultado.alumnos_nuevos.append(alumno[1])
+        elif tuple(anterior) == tuple(alumno):
+            continue
+        else:
+            if anterior[2] != alumno[2]:
+                resultado.macs.append(alumno[1])
+            if anterior[0] != alumno[0]:
+                resultado.renombrados.append(alumno[1])
+        registros.append(('alumno',) + tuple(alumno))
+
+    cursos_antes = _por_clave(actual['cursos'], lambda c: str(c[0]))
+    cursos_despues = _por_clave(nuevo['cursos'], lambda c: str(c[0]))
+    for codigo, curso in cursos_despues.items():
+        anterior = cursos_antes.get(codigo)
+        if anterior is None:
+            resultado.cursos_nuevos.append(curso[0])
+            registros.append(('curso',) + tuple(curso))
+            continue
+        if tuple(anterior) == tuple(curso):
+            continue
+        miembros_antes = {str(c) for c in anterior[3]}
+        miembros_despues = {str(c) for c in curso[3]}
+        servidores_antes_curso, servidores_despues_curso = _servidores_curso(anterior), _servidores_curso(curso)
+        cambio_servidores = servidores_antes_curso != servidores_despues_curso
+        if anterior[1:3] == curso[1:3] and miembros_antes == miembros_despues and not cambio_servidores:
+            continue
+        if anterior[2] != curso[2]:
+            resultado.estados.append((curso[0], anterior[2], curso[2]))
+            if anterior[2] == "DICTANDO":
+                resultado.revisar_alumnos.update(miembros_antes)
+        if cambio_servidores:
+            resultado.cursos_cambiados.append(curso[0])
+            resultado.revisar_alumnos.update(miembros_antes)
+        bajas = miembros_antes - miembros_despues
+        resultado.altas.extend((curso[0], c) for c in sorted(miembros_despues - miembros_antes))
+        resultado.bajas.extend((curso[0], c) for c in sorted(bajas))
+        resultado.revisar_alumnos.update(bajas)
+        registros.append(('curso',) + tuple(curso))
+    for codigo, curso in cursos_antes.items():
+        if codigo not in cursos_despues:
+            resultado.cursos_quitados.append(curso[0])
+            resultado.revisar_alumnos.update(str(c) for c in curso[3])
+            registros.append(('sin_curso', curso[0]))
+    for codigo, alumno in alumnos_antes.items():
+        if codigo not in alumnos_despues:
+            resultado.alumnos_quitados.append(alumno[1])
+            resultado.revisar_alumnos.add(codigo)
+            registros.append(('sin_alumno', alumno[1]))
+    for clave, servidor in servidores_antes.items():
+        if clave not in servidores_despues:
+            resultado.servidores_quitados.append(servidor[0])
+            resultado.revisar_servicios.update((servidor[0], nombre) for nombre, _, _ in servidor[2])
+            registros.append(('sin_servidor', servidor[0]))
+    return resultado
@@ -0,0 +1,78 @@
+# Listados grandes: las filas se generan de forma perezosa, ya filtradas y ordenadas, y
+# se muestran por páginas. La tabla (PrettyTable) se arma solo con las filas de cada
+# página; las salidas plana y CSV escriben fila por fila sin calcular anchos
+import csv
+import itertools
+import shlex
+import sys
+
+FORMATOS = ('tabla', 'plano', 'csv')
+
+
+# Páginas de `tamano` filas: (filas, hay_mas). Sin tamaño todo va en páginas de 1000
+# filas y sin pausas
+def paginas(filas, tamano=None):
+    iterador = iter(filas)
+    pagina = list(itertools.islice(iterador, tamano or 1000))
+    while pagina:
+        siguiente = list(itertools.islice(iterador, tamano or 1000))
+        yield pagina, bool(siguiente)
+        pagina = siguiente
+
+
+# Escribe las filas en el formato pedido. `continuar(pagina, mostradas)` se llama antes
+# de cada página nueva (cuando hay más filas); si devuelve False se corta el listado.
+# Devuelve la cantidad de filas mostradas
+def mostrar(columnas, filas, formato='tabla', tamano=None, continuar=None, salida=None):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no válido: {formato} (opciones: {', '.join(FORMATOS)})")
+    salida = salida or sys.stdout
+    escritor = csv.writer(salida) if formato == 'csv' else None
+    if formato == 'csv':
+        escritor.writerow(columnas)
+    elif formato == 'plano':
+        salida.write('\t'.join(columnas) + '\n')
+
+    mostradas = 0
+    for numero, (pagina, hay_mas) in enumerate(paginas(filas, tamano), 1):
+        if formato == 'tabla':
+            from prettytable import PrettyTable
+            tabla = PrettyTable(columnas)
+            tabla.add_rows(pagina)
+            salida.write(tabla.get_string() + '\n')
+        elif formato == 'csv':
+            escritor.writerows(pagina)
+        else:
+            salida.writelines('\t'.join(map(str, fila)) + '\n' for fila in pagina)
+        mostradas += len(pagina)
+        if hay_mas and tamano and continuar is not None and not continuar(numero, mostradas):
+            break
+    return mostradas
+
+
+# Pausa interactiva entre páginas
+def pausa(numero, mostradas):
+    respuesta = input(f"-- página {numero} ({mostradas} filas) -- Enter: siguiente | q: terminar ")
+    return respuesta.strip().lower() != 'q'
+
+
+# Ordena por una clave de `claves` ({nombre: función}); '-nombre' invierte el orden
+def ordenar(items, orden, claves):
+    if not orden:
+        return items
+    inverso = orden.startswith('-')
+    nombre = orden.lstrip('-')
+    if nombre not in claves:
+        raise ValueError(f"No se puede ordenar por {nombre} (opciones: {', '.join(claves)})")
+    return sorted(items, key=claves[nombre], reverse=inverso)
+
+
+# Lee opciones clave=valor separadas por espacios (admite comillas: servidor="Servidor 1")
+def leer_opciones(texto, permitidas):
+    opciones = {}
+    for parte in shlex.split(texto):
+        clave, separador, valor = parte.partition('=')
+        if not separador or clave not in permitidas:
+            raise ValueError(f"Opción no válida: {parte} (opciones: {', '.join(permitidas)})")
+        opciones[clave] = valor
+    return opciones
@@ -1,142 +1,1089 @@
 # David Alonso Escobedo Cerrón - 20210850
-import requests
-import yaml
-from prettytable import PrettyTable
+import csv
+import itertools
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-controller_ip = '10.20.12.65'
+# requests, yaml y prettytable se importan bajo demanda (solo cuando una operación los
+# necesita) para que los comandos de la línea de comandos arranquen rápido
+import listados
+import snapshot
+from agregacion import ReglasCompartidas, es_compartido, nombre_compartido
+from api import CerrojoLecturaEscritura, ErrorAPI, ServidorAPI
+from diario import Diario, leer_diario
+from diferencias import diferencia
+from cluster import MapaSwitches, combinar as combinar_lecturas, filtrar_dispositivo, normalizar_dpid
+from metricas import Metricas, endpoint
+from planificador import PRIORIDAD_CONCESION, PRIORIDAD_REVOCACION, EscriturasPorDestino, combinar_futuros
+from politicas import MatrizPoliticas
+from topologia import Topologia
+
+# URL base del controlador Floodlight (configurable con la variable CONTROLLER_URL). Con
+# varias URLs separadas por comas se trabaja con un cluster de controladores
+CONTROLLER_URL = os.environ.get('CONTROLLER_URL', 'http://10.20.12.65:8080')
+# Archivo con los controladores del cluster y los switches de cada uno (UPSM_CLUSTER)
+CONTROLLER_CLUSTER_FILE = os.environ.get('UPSM_CLUSTER')
+# Timeout por defecto (segundos) de cada llamada REST al controlador
+CONTROLLER_TIMEOUT = 5
+# Conexiones keep-alive que se mantienen abiertas hacia el controlador
+CONTROLLER_POOL_SIZE = 32
+# Workers concurrentes al crear conexiones en lote
+BULK_WORKERS = 16
+# Instrumentación activa por defecto (UPSM_METRICAS=0 la apaga)
+METRICAS_ACTIVAS = os.environ.get('UPSM_METRICAS', '1') != '0'
+# Archivo por defecto donde se exportan las métricas en formato Prometheus
+METRICAS_ARCHIVO = 'metricas.prom'
+
+metricas = Metricas(activo=METRICAS_ACTIVAS)
+
+# Segundos que se reutiliza la tabla de dispositivos antes de volver a pedirla
+DEVICE_CACHE_TTL = 30
+# Antigüedad mínima de la tabla para volver a pedirla cuando una MAC/IP no aparece
+DEVICE_CACHE_MISS_REFRESH = 2
+# Cada cuántos segundos se comprueba si cambiaron los enlaces para invalidar las rutas
+ROUTE_CACHE_TOPOLOGY_CHECK = 10
+# Calcular las rutas localmente con la topología en memoria en lugar de /wm/topology/route
+ROUTE_LOCAL = True
+# Segundos entre refrescos incrementales de los enlaces de la topología local
+TOPOLOGY_REFRESH = 10
+# Escrituras simultáneas al static flow pusher (altas y bajas de flows)
+FLOW_PUSH_WORKERS = 16
+# Tope de escrituras por segundo al static flow pusher (0 = sin tope), reintentos de las
+# que fallan de forma transitoria y espera base/máxima del backoff exponencial (s)
+CONTROLLER_WRITE_RATE = float(os.environ.get('UPSM_ESCRITURAS_POR_SEGUNDO', '200'))
+CONTROLLER_WRITE_RETRIES = 4
+CONTROLLER_WRITE_BACKOFF = 0.1
+CONTROLLER_WRITE_BACKOFF_MAX = 5.0
+# Segundos entre consultas del rastreador de dispositivos (cota de la latencia de detección)
+DEVICE_TRACKER_INTERVAL = float(os.environ.get('UPSM_RASTREADOR_INTERVALO', '5'))
+# Iniciar el rastreador junto con el menú (UPSM_RASTREADOR=1)
+DEVICE_TRACKER = os.environ.get('UPSM_RASTREADOR', '0') == '1'
+# Segundos entre recolecciones de contadores de los flows, inactividad (s) a partir de
+# la cual una conexión se expira (0 = no expirar) y conexiones revocadas por lote
+FLOW_STATS_INTERVAL = float(os.environ.get('UPSM_USO_INTERVALO', '60'))
+FLOW_IDLE_EXPIRY = float(os.environ.get('UPSM_INACTIVIDAD', '0'))
+FLOW_EXPIRY_BATCH = 200
+# idle_timeout / hard_timeout (s) de los flows nuevos; 0 = sin timeout (el switch no
+# los vence nunca)
+FLOW_IDLE_TIMEOUT = int(os.environ.get('UPSM_FLOW_IDLE_TIMEOUT', '0'))
+FLOW_HARD_TIMEOUT = int(os.environ.get('UPSM_FLOW_HARD_TIMEOUT', '0'))
+# Modo de agregación (UPSM_AGREGAR_FLOWS=1): los saltos de tránsito usan reglas
+# compartidas entre conexiones en lugar de una regla por conexión (ver agregacion.py)
+FLOW_AGGREGATION = os.environ.get('UPSM_AGREGAR_FLOWS', '0') == '1'
+# Descargas simultáneas de listados de flows (una por switch) en la auditoría, y altas o
+# bajas por lote al reparar
+AUDIT_WORKERS = int(os.environ.get('UPSM_AUDITORIA_WORKERS', '8'))
+AUDIT_REPAIR_BATCH = 500
+# Diario de mutaciones: registros por fsync, espera máxima antes del fsync (s) y
+# registros acumulados a partir de los cuales se compacta en el snapshot de estado
+JOURNAL_BATCH = 256
+JOURNAL_FLUSH_INTERVAL = 0.05
+JOURNAL_COMPACT_RECORDS = 10000
+# Filas por página de los listados del menú y formato por defecto (tabla, plano o csv)
+LISTING_PAGE_SIZE = 50
+LISTING_FORMAT = os.environ.get('UPSM_FORMATO', 'tabla')
 
 # Clases
+
+# Registro de objetos indexados por clave: mantiene el orden de inserción y permite
+# búsqueda, alta, baja y pertenencia en O(1)
+class Registro:
+    __slots__ = ('_items', '_clave', '_normalizar')
+
+    def __init__(self, clave, normalizar=str, items=()):
+        self._items = {}
+        self._clave = clave
+        self._normalizar = normalizar
+        for item in items:
+            self.agregar(item)
+
+    def clave(self, item):
+        return self._normalizar(self._clave(item))
+
+    def get(self, clave, defecto=None):
+        return self._items.get(self._normalizar(clave), defecto)
+
+    def tiene(self, clave):
+        return self._normalizar(clave) in self._items
+
+    def agregar(self, item):
+        self._items[self.clave(item)] = item
+
+    def quitar(self, item):
+        clave = self.clave(item)
+        if self._items.get(clave) is item:
+            del self._items[clave]
+            return True
+        return False
+
+    def quitar_clave(self, clave):
+        return self._items.pop(self._normalizar(clave), None)
+
+    def reemplazar(self, items):
+        self._items = {}
+        for item in items:
+            self.agregar(item)
+
+    def limpiar(self):
+        self._items = {}
+
+    def __contains__(self, item):
+        return self._items.get(self.clave(item)) is item
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _minusculas(nombre):
+    return str(nombre).lower()
+
+
 class Alumno:
+    __slots__ = ('nombre', 'codigo', 'mac')
+
     def __init__(self, nombre, codigo, mac):
         self.nombre = nombre
         self.codigo = codigo
-        self.mac = mac
+        self.mac = normalizar_mac(mac)
 
 class Curso:
+    __slots__ = ('nombre', 'estado', 'codigo', 'alumnos', 'servidores', 'servicios_permitidos', 'indice')
+
     def __init__(self, nombre, estado, codigo):
         self.nombre = nombre
         self.estado = estado
         self.codigo = codigo
-        self.alumnos = []
-        self.servidores = []
+        self.alumnos = Registro(lambda a: a.codigo)
+        self.servidores = Registro(lambda s: s.nombre, _minusculas)
+        self.servicios_permitidos = {} # nombre de servidor -> nombres de servicios permitidos
+        self.indice = None # IndiceAutorizacion que se mantiene al día con las altas/bajas
 
     def add_alumno(self, alumno):
-        self.alumnos.append(alumno)
+        self.alumnos.agregar(alumno)
+        if self.indice is not None:
+            self.indice.agregar_alumno(self, alumno)
 
     def del_alumno(self, alumno):
-        self.alumnos = [a for a in self.alumnos if a != alumno]
+        if self.alumnos.quitar(alumno) and self.indice is not None:
+            self.indice.quitar_alumno(self, alumno)
+
+    def add_servidor(self, servidor, servicios_permitidos=None):
+        self.servidores.agregar(servidor)
+        if servicios_permitidos is None:
+            servicios_permitidos = [servicio.nombre for servicio in servidor.servicios]
+        self.servicios_permitidos[servidor.nombre] = set(servicios_permitidos)
 
-    def add_servidor(self, servidor):
-        self.servidores.append(servidor)
+    # Servicios del servidor que el curso permite usar
+    def servicios_de(self, servidor):
+        permitidos = self.servicios_permitidos.get(servidor.nombre, ())
+        return [servicio for servicio in servidor.servicios if servicio.nombre in permitidos]
 
 class Servicio:
+    __slots__ = ('nombre', 'protocolo', 'puerto')
+
     def __init__(self, nombre, protocolo, puerto):
         self.nombre = nombre
         self.protocolo = protocolo
         self.puerto = puerto
 
 class Servidor:
+    __slots__ = ('nombre', 'direccion_ip', 'servicios')
+
     def __init__(self, nombre, direccion_ip, servicios=None):
         self.nombre = nombre
         self.direccion_ip = direccion_ip
-        self.servicios = servicios if servicios is not None else []
+        self.servicios = Registro(lambda s: s.nombre, _minusculas, servicios or ())
 
     def add_servicio(self, servicio):
-        self.servicios.append(servicio)
+        self.servicios.agregar(servicio)
 
     def del_servicio(self, servicio):
-        self.servicios = [s for s in self.servicios if s != servicio]
+        self.servicios.quitar(servicio)
 
 class Conexion:
-    def __init__(self, handler, alumno, servidor, servicio):
+    __slots__ = ('handler', 'alumno', 'servidor', 'servicio', 'flows')
+
+    def __init__(self, handler, alumno, servidor, servicio, flows=None):
         self.handler = handler
         self.alumno = alumno
         self.servidor = servidor
         self.servicio = servicio
+        self.flows = flows if flows is not None else [] # nombres de los flows instalados en cada salto
+
+# Registro de conexiones con índices inversos alumno/servidor/servicio -> handlers, para
+# encontrar sin recorrer todo el registro las conexiones afectadas por un cambio. También
+# indexa qué conexiones usan cada regla compartida (modo de agregación, ver agregacion.py)
+class RegistroConexiones(Registro):
+    __slots__ = ('por_alumno', 'por_servidor', 'por_servicio', 'por_regla', 'reglas_de')
+
+    def __init__(self, items=()):
+        self.por_alumno = {}   # código -> {handler}
+        self.por_servidor = {} # servidor (minúsculas) -> {handler}
+        self.por_servicio = {} # (servidor, servicio) en minúsculas -> {handler}
+        self.por_regla = {}    # nombre de regla compartida -> {handler}
+        self.reglas_de = {}    # handler -> reglas compartidas indexadas
+        super().__init__(lambda c: c.handler, str, items)
+
+    def _claves_indice(self, conexion):
+        servidor = _minusculas(conexion.servidor.nombre)
+        return ((self.por_alumno, str(conexion.alumno.codigo)),
+                (self.por_servidor, servidor),
+                (self.por_servicio, (servidor, _minusculas(conexion.servicio.nombre))))
+
+    def _indexar(self, conexion):
+        handler = conexion.handler
+        servidor = _minusculas(conexion.servidor.nombre)
+        self.por_alumno.setdefault(str(conexion.alumno.codigo), set()).add(handler)
+        self.por_servidor.setdefault(servidor, set()).add(handler)
+        self.por_servicio.setdefault((servidor, _minusculas(conexion.servicio.nombre)), set()).add(handler)
+        self._indexar_reglas(conexion)
+
+    def _indexar_reglas(self, conexion):
+        reglas = tuple(nombre for nombre in conexion.flows if es_compartido(nombre))
+        if reglas:
+            self.reglas_de[conexion.handler] = reglas
+            for nombre in reglas:
+                self.por_regla.setdefault(nombre, set()).add(conexion.handler)
 
-# Definir las listas globales
-alumnos = []
-cursos = []
-servidores = []
-conexiones = []
+    def _desindexar_reglas(self, handler):
+        for nombre in self.reglas_de.pop(handler, ()):
+            handlers = self.por_regla.get(nombre)
+            if handlers is not None:
+                handlers.discard(handler)
+                if not handlers:
+                    del self.por_regla[nombre]
 
+    def _desindexar(self, conexion):
+        for indice, clave in self._claves_indice(conexion):
+            handlers = indice.get(clave)
+            if handlers is not None:
+                handlers.discard(conexion.handler)
+                if not handlers:
+                    del indice[clave]
+        self._desindexar_reglas(conexion.handler)
 
-def get_list_devices(controller_ip):
-    target_api = '/wm/device/'
-    headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
-    url = f'http://{controller_ip}:8080{target_api}'
-    response = requests.get(url=url, headers=headers)
+    def agregar(self, conexion):
+        anterior = self.get(self.clave(conexion))
+        if anterior is not None:
+            self._desindexar(anterior)
+        super().agregar(conexion)
+        self._indexar(conexion)
+        anotar_conexion(conexion)
 
-    if response.status_code == 200:
-        print('SUCCESSFUL REQUEST | STATUS: 200')
-        data = response.json()
-        if not data:
-            print("No se encontraron dispositivos.")
+    # Anota los cambios (p. ej. de flows) de una conexión que sigue registrada
+    def actualizar(self, conexion):
+        if conexion in self:
+            self._desindexar_reglas(conexion.handler)
+            self._indexar_reglas(conexion)
+            anotar_conexion(conexion)
+
+    def quitar(self, conexion):
+        if super().quitar(conexion):
+            self._desindexar(conexion)
+            anotar('desconexion', conexion.handler)
+            return True
+        return False
+
+    def quitar_clave(self, clave):
+        conexion = super().quitar_clave(clave)
+        if conexion is not None:
+            self._desindexar(conexion)
+            anotar('desconexion', conexion.handler)
+        return conexion
+
+    def reemplazar(self, conexiones):
+        self.por_alumno, self.por_servidor, self.por_servicio = {}, {}, {}
+        self.por_regla, self.reglas_de = {}, {}
+        items = self._items = {}
+        for conexion in conexiones:
+            items[conexion.handler] = conexion
+            self._indexar(conexion)
+        if diario is not None:
+            anotar('conexiones', tuple(tupla_conexion(c) for c in self))
+
+    def limpiar(self):
+        self.por_alumno, self.por_servidor, self.por_servicio = {}, {}, {}
+        self.por_regla, self.reglas_de = {}, {}
+        super().limpiar()
+        anotar('conexiones', ())
+
+    # Conexiones que cumplen todos los filtros dados (None = cualquiera)
+    def buscar(self, codigo=None, servidor=None, servicio=None):
+        conjuntos = []
+        if codigo is not None:
+            conjuntos.append(self.por_alumno.get(str(codigo), set()))
+        if servidor is not None and servicio is not None:
+            conjuntos.append(self.por_servicio.get((_minusculas(servidor), _minusculas(servicio)), set()))
+        elif servidor is not None:
+            conjuntos.append(self.por_servidor.get(_minusculas(servidor), set()))
+        elif servicio is not None:
+            servicio = _minusculas(servicio)
+            conjuntos.append(set().union(*(handlers for (_, svc), handlers in self.por_servicio.items()
+                                           if svc == servicio)))
+        if not conjuntos:
+            return list(self)
+        conjuntos.sort(key=len)
+        handlers = conjuntos[0].intersection(*conjuntos[1:])
+        return [self.get(handler) for handler in sorted(handlers)]
+
+    # ¿Alguna conexión registrada, fuera de las de `excluidos`, usa la regla compartida?
+    def usa_regla(self, nombre, excluidos=frozenset()):
+        handlers = self.por_regla.get(nombre)
+        return bool(handlers) and not handlers <= excluidos
+
+    # Conexiones que un curso justifica: de sus alumnos a los servicios que permite
+    def de_curso(self, curso, alumnos_curso=None):
+        resultado = []
+        for alumno in alumnos_curso if alumnos_curso is not None else curso.alumnos:
+            for handler in sorted(self.por_alumno.get(str(alumno.codigo), ())):
+                conexion = self.get(handler)
+                if conexion.servicio.nombre in curso.servicios_permitidos.get(conexion.servidor.nombre, ()):
+                    resultado.append(conexion)
+        return resultado
+
+# Índice de autorización: (código de alumno, servidor, servicio) -> cursos DICTANDO que dan el acceso
+class IndiceAutorizacion:
+    def __init__(self):
+        self.permisos = {}
+        self.por_alumno = {}   # código -> {(servidor, servicio)}
+        self.por_servidor = {} # servidor -> {(código, servicio)}
+        self.version = 0       # cambia con cada alta/baja/curso; invalida la matriz de políticas
+        self.lock = threading.Lock()
+
+    def _agregar(self, codigo, servidor, servicio, curso):
+        with self.lock:
+            self.permisos.setdefault((codigo, servidor, servicio), set()).add(curso)
+            self.por_alumno.setdefault(codigo, set()).add((servidor, servicio))
+            self.por_servidor.setdefault(servidor, set()).add((codigo, servicio))
+
+    def _quitar(self, codigo, servidor, servicio, curso):
+        with self.lock:
+            clave = (codigo, servidor, servicio)
+            cursos_clave = self.permisos.get(clave)
+            if cursos_clave is None:
+                return
+            cursos_clave.discard(curso)
+            if cursos_clave:
+                return
+            del self.permisos[clave]
+            self.por_alumno[codigo].discard((servidor, servicio))
+            if not self.por_alumno[codigo]:
+                del self.por_alumno[codigo]
+            self.por_servidor[servidor].discard((codigo, servicio))
+            if not self.por_servidor[servidor]:
+                del self.por_servidor[servidor]
+
+    def _servicios_curso(self, curso):
+        for servidor in curso.servidores:
+            for servicio in curso.servicios_de(servidor):
+                yield servidor.nombre, servicio.nombre
+
+    def agregar_alumno(self, curso, alumno, servicios=None):
+        self.version += 1
+        if curso.estado != "DICTANDO":
             return
-        
-        table = PrettyTable(["MAC", "IPv4", "Switch DPID", "Puerto"])
-        for device in data:
-            if device.get("attachmentPoint"):
-                mac = device["mac"][0] if device.get("mac") else "-"
-                ipv4 = device["ipv4"][0] if device.get("ipv4") else "-"
-                ap = device["attachmentPoint"][0]
-                dpid = ap.get("switchDPID", "-")
-                port = ap.get("port", "-")
-                if ap.get("port", -2) >= 0: # No muestra switches
-                    table.add_row([mac, ipv4, dpid, port])
-        print(table)
-    else:
-        print(f'FAILED REQUEST | STATUS: {response.status_code}')
+        for servidor, servicio in servicios if servicios is not None else self._servicios_curso(curso):
+            self._agregar(str(alumno.codigo), servidor, servicio, curso.codigo)
+
+    def quitar_alumno(self, curso, alumno):
+        self.version += 1
+        for servidor, servicio in self._servicios_curso(curso):
+            self._quitar(str(alumno.codigo), servidor, servicio, curso.codigo)
+
+    def agregar_curso(self, curso):
+        self.version += 1
+        curso.indice = self
+        servicios = list(self._servicios_curso(curso))
+        for alumno in curso.alumnos:
+            self.agregar_alumno(curso, alumno, servicios)
+
+    def quitar_curso(self, curso):
+        self.version += 1
+        for alumno in curso.alumnos:
+            self.quitar_alumno(curso, alumno)
+
+    def construir(self, cursos):
+        with self.lock:
+            self.permisos = {}
+            self.por_alumno = {}
+            self.por_servidor = {}
+            self.version += 1
+        for curso in cursos:
+            self.agregar_curso(curso)
+
+    def cursos_que_autorizan(self, codigo, servidor, servicio):
+        return set(self.permisos.get((str(codigo), servidor, servicio), ()))
+
+    def autorizado(self, codigo, servidor, servicio):
+        return (str(codigo), servidor, servicio) in self.permisos
+
+    # Todos los accesos de un alumno: [(servidor, servicio, {cursos})]
+    def permisos_de_alumno(self, codigo):
+        codigo = str(codigo)
+        with self.lock:
+            return [(servidor, servicio, set(self.permisos[(codigo, servidor, servicio)]))
+                    for servidor, servicio in sorted(self.por_alumno.get(codigo, ()))]
+
+    # Todos los accesos a un servidor: [(código, servicio, {cursos})]
+    def permisos_de_servidor(self, servidor):
+        with self.lock:
+            return [(codigo, servicio, set(self.permisos[(codigo, servidor, servicio)]))
+                    for codigo, servicio in sorted(self.por_servidor.get(servidor, ()))]
+
+
+# Respuesta de una llamada al controlador: status HTTP (0 si no hubo respuesta) y JSON decodificado
+class Respuesta(namedtuple('Respuesta', ['status', 'datos'])):
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.status == 200
+
+
+# Cliente HTTP del controlador: una sesión con pool de conexiones keep-alive
+# compartida por todas las llamadas REST
+class ClienteControlador:
+    def __init__(self, base_url=CONTROLLER_URL, timeout=CONTROLLER_TIMEOUT, pool=CONTROLLER_POOL_SIZE):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.pool = pool
+        self._sesion = None
+        self.lock = threading.Lock()
+
+    # La sesión (y requests) se crea con la primera llamada
+    @property
+    def sesion(self):
+        if self._sesion is None:
+            with self.lock:
+                if self._sesion is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    sesion = requests.Session()
+                    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool)
+                    sesion.mount('http://', adaptador)
+                    sesion.mount('https://', adaptador)
+                    sesion.headers.update({'Content-type': 'application/json', 'Accept': 'application/json'})
+                    self._sesion = sesion
+        return self._sesion
+
+    def peticion(self, metodo, ruta, datos=None, timeout=None):
+        import requests
+        cuerpo = json.dumps(datos) if datos is not None else None
+        medir = metricas.activo
+        inicio = time.perf_counter() if medir else 0.0
+        try:
+            response = self.sesion.request(metodo, self.base_url + ruta, data=cuerpo,
+                                           timeout=timeout if timeout is not None else self.timeout)
+        except requests.RequestException as e:
+            if medir:
+                metricas.registrar('controlador', endpoint(metodo, ruta), time.perf_counter() - inicio, 0,
+                                   len(cuerpo or ''))
+            print(f"Error de conexión con el controlador ({metodo} {ruta}): {e}")
+            return Respuesta(0, None)
+        if medir:
+            metricas.registrar('controlador', endpoint(metodo, ruta), time.perf_counter() - inicio,
+                               None if response.status_code == 200 else response.status_code,
+                               len(cuerpo or ''), len(response.content))
+        try:
+            datos_respuesta = response.json() if response.content else None
+        except ValueError:
+            datos_respuesta = None
+        return Respuesta(response.status_code, datos_respuesta)
+
+    # Recorre los elementos de un arreglo JSON de objetos (o del arreglo `clave` de un
+    # objeto, p. ej. {"devices": [...]}) a medida que llega la respuesta, sin cargarla
+    # entera. Al terminar devuelve True si se leyó el arreglo completo
+    def elementos(self, ruta, clave=None, timeout=None):
+        import codecs
+        import requests
+        inicio = time.perf_counter()
+        status = 0
+        recibidos = 0
+        decodificador = codecs.getincrementaldecoder('utf-8')()
+        decodificador_json = json.JSONDecoder()
+        texto, pos, dentro = '', 0, False
+        try:
+            with self.sesion.get(self.base_url + ruta, stream=True,
+                                 timeout=timeout if timeout is not None else self.timeout) as response:
+                status = response.status_code
+                if status != 200:
+                    print(f'FAILED REQUEST | STATUS: {status}')
+                    return False
+                for bloque in response.iter_content(65536):
+                    recibidos += len(bloque)
+                    texto = texto[pos:] + decodificador.decode(bloque)
+                    pos = 0
+                    if not dentro:
+                        contenido = texto.lstrip()
+                        if contenido.startswith('{') and clave:
+                            marca = texto.find(f'"{clave}"')
+                            apertura = texto.find('[', marca) if marca >= 0 else -1
+                        else:
+                            apertura = texto.find('[') if contenido.startswith('[') else -1
+                        if apertura < 0:
+                            if contenido and contenido[0] not in '{[':
+                                break
+                            continue
+                        pos, dentro = apertura + 1, True
+                    while True:
+                        while pos < len(texto) and texto[pos] in ' \t\r\n,':
+                            pos += 1
+                        if pos >= len(texto):
+                            break
+                        if texto[pos] == ']':
+                            return True
+                        try:
+                            elemento, pos_fin = decodificador_json.raw_decode(texto, pos)
+                        except ValueError:
+                            break # elemento incompleto: falta el resto de la respuesta
+                        pos = pos_fin
+                        yield elemento
+        except requests.RequestException as e:
+            status = 0
+            print(f"Error de conexión con el controlador (GET {ruta}): {e}")
+            return False
+        finally:
+            if metricas.activo:
+                metricas.registrar('controlador', endpoint('GET', ruta), time.perf_counter() - inicio,
+                                   None if status == 200 else status, 0, recibidos)
+        print(f"Respuesta incompleta o inválida de {ruta}")
+        return False
+
+    def get(self, ruta, timeout=None):
+        return self.peticion('GET', ruta, timeout=timeout)
+
+    def post(self, ruta, datos, timeout=None):
+        return self.peticion('POST', ruta, datos, timeout=timeout)
+
+    def delete(self, ruta, datos, timeout=None):
+        return self.peticion('DELETE', ruta, datos, timeout=timeout)
+
+    # Controlador al que se envía el alta de un flow y, si el flow estaba en otro
+    # controlador, ese otro (None con un solo controlador)
+    def destino_flow(self, flow):
+        return self, None
+
+    # Controladores donde hay que borrar un flow
+    def destinos_borrado(self, nombre):
+        return [self]
+
+    def cerrar(self):
+        if self._sesion is not None:
+            self._sesion.close()
+
+
+# Varios controladores Floodlight, cada uno dueño de un conjunto de switches (ver
+# cluster.py), con la misma interfaz que ClienteControlador. Las altas de flows van al
+# dueño del switch; las bajas, al controlador donde se instaló el flow (o a todos si no
+# se sabe); las lecturas se reparten entre todos en paralelo y se combinan
+class ClusterControladores:
+    def __init__(self, urls, timeout=CONTROLLER_TIMEOUT, asignados=None, pool=CONTROLLER_POOL_SIZE):
+        self.miembros = [ClienteControlador(url, timeout, pool) for url in urls]
+        por_url = {miembro.base_url: miembro for miembro in self.miembros}
+        self.asignados = dict(asignados or {}) # dpid -> URL del controlador dueño
+        self.mapa = MapaSwitches(self.miembros, {dpid: por_url[url.rstrip('/')]
+                                                 for dpid, url in self.asignados.items()})
+        self.base_url = ','.join(por_url)
+        self.timeout = timeout
+        self.ubicaciones = {} # nombre de flow -> miembro donde se instaló
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=len(self.miembros))
+
+    def destino_flow(self, flow):
+        miembro = self.mapa.dueno(flow['switch'])
+        with self.lock:
+            anterior = self.ubicaciones.get(flow['name'])
+            self.ubicaciones[flow['name']] = miembro
+        return miembro, anterior if anterior is not miembro else None
+
+    def destinos_borrado(self, nombre):
+        with self.lock:
+            miembro = self.ubicaciones.pop(nombre, None)
+        return [miembro] if miembro is not None else list(self.miembros)
+
+    def _aprender_ubicaciones(self, respuestas):
+        with self.lock:
+            for miembro, respuesta in respuestas:
+                for entradas in (respuesta.datos or {}).values():
+                    for entrada in entradas or []:
+                        for nombre in entrada:
+                            self.ubicaciones[nombre] = miembro
+
+    def get(self, ruta, timeout=None):
+        # Una ruta la calcula el dueño del switch de origen
+        if ruta.startswith('/wm/topology/route/'):
+            return self.mapa.dueno(ruta.split('/')[4]).get(ruta, timeout)
+        respuestas = list(self.pool.map(lambda miembro: (miembro, miembro.get(ruta, timeout)), self.miembros))
+        for _, respuesta in respuestas:
+            if not respuesta.ok:
+                return respuesta
+        if ruta.startswith('/wm/staticflowpusher/list'):
+            self._aprender_ubicaciones(respuestas)
+        return Respuesta(200, combinar_lecturas(ruta, [(m, r.datos) for m, r in respuestas], self.mapa))
+
+    def post(self, ruta, datos, timeout=None):
+        if not isinstance(datos, dict) or 'switch' not in datos:
+            return self.miembros[0].post(ruta, datos, timeout)
+        miembro, anterior = self.destino_flow(datos)
+        if anterior is not None:
+            anterior.delete(ruta, {"name": datos['name']}, timeout)
+        return miembro.post(ruta, datos, timeout)
+
+    def delete(self, ruta, datos, timeout=None):
+        destinos = self.destinos_borrado(datos.get('name')) if isinstance(datos, dict) else self.miembros
+        respuestas = [destino.delete(ruta, datos, timeout) for destino in destinos]
+        return next((respuesta for respuesta in respuestas if not respuesta.ok), respuestas[0])
+
+    def peticion(self, metodo, ruta, datos=None, timeout=None):
+        if metodo == 'GET':
+            return self.get(ruta, timeout)
+        if metodo == 'POST':
+            return self.post(ruta, datos, timeout)
+        if metodo == 'DELETE':
+            return self.delete(ruta, datos, timeout)
+        return self.miembros[0].peticion(metodo, ruta, datos, timeout)
+
+    # Lee en paralelo el arreglo de todos los controladores y entrega los elementos a
+    # medida que llegan. Al terminar devuelve True si todas las lecturas fueron completas
+    def elementos(self, ruta, clave=None, timeout=None):
+        import queue
+        cola = queue.Queue()
+        dispositivos = ruta.startswith('/wm/device')
+
+        def leer(miembro):
+            completo = False
+            try:
+                generador = miembro.elementos(ruta, clave, timeout)
+                while True:
+                    try:
+                        cola.put((miembro, next(generador), None))
+                    except StopIteration as fin:
+                        completo = bool(fin.value)
+                        break
+            finally:
+                cola.put((miembro, None, completo))
+
+        for miembro in self.miembros:
+            threading.Thread(target=leer, args=(miembro,), name='cluster-lectura', daemon=True).start()
+        restantes, completo, vistos = len(self.miembros), True, set()
+        while restantes:
+            miembro, elemento, fin = cola.get()
+            if fin is not None:
+                restantes -= 1
+                completo = completo and fin
+                continue
+            if dispositivos:
+                elemento = filtrar_dispositivo(elemento, miembro, self.mapa)
+                macs = tuple(elemento.get('mac') or ()) if elemento is not None else ()
+                if elemento is None or (macs and macs in vistos):
+                    continue
+                vistos.add(macs)
+            yield elemento
+        return completo
+
+    def cerrar(self):
+        for miembro in self.miembros:
+            miembro.cerrar()
+        self.pool.shutdown(wait=False)
+
+
+# Un controlador o, con varias URLs separadas por comas (o switches asignados), un cluster
+def crear_controlador(base_url=CONTROLLER_URL, timeout=CONTROLLER_TIMEOUT, asignados=None):
+    urls = [url.strip() for url in base_url.split(',') if url.strip()]
+    if len(urls) > 1 or asignados:
+        return ClusterControladores(urls, timeout, asignados)
+    return ClienteControlador(urls[0], timeout)
+
+
+controlador = crear_controlador()
+
+
+# Cambia la URL base (o las URLs del cluster), el timeout y/o los switches asignados a
+# cada controlador usados por todas las funciones REST
+def configurar_controlador(base_url=None, timeout=None, asignados=None):
+    global controlador
+    anterior = controlador
+    if base_url is None and asignados is None:
+        asignados = getattr(anterior, 'asignados', None)
+    controlador = crear_controlador(base_url or anterior.base_url,
+                                    timeout if timeout is not None else anterior.timeout, asignados)
+    anterior.cerrar()
+    tabla_dispositivos.invalidar()
+    cache_rutas.invalidar()
+    topologia_local.invalidar()
+    return controlador
+
+
+# Registros globales (alumnos por código, cursos por código, servidores por nombre
+# sin distinguir mayúsculas y conexiones por handler)
+alumnos = Registro(lambda a: a.codigo)
+cursos = Registro(lambda c: c.codigo)
+servidores = Registro(lambda s: s.nombre, _minusculas)
+conexiones = RegistroConexiones()
+
+indice_autorizacion = IndiceAutorizacion()
+
+# Cerrojo de lectura/escritura sobre alumnos, cursos, servidores, conexiones y el
+# índice. Las llamadas al controlador se hacen fuera del cerrojo: solo se toma para
+# leer el estado o registrar el resultado
+estado_lock = CerrojoLecturaEscritura()
+
+# Diario de mutaciones del estado guardado en ruta_estado (None = sin persistencia)
+diario = None
+ruta_estado = None
+
+
+# Si el diario no se puede escribir el registro queda en su cola (se reintenta) y se
+# avisa, pero la operación que lo anota sigue: el estado en memoria ya cambió
+def anotar(*registro):
+    if diario is not None:
+        try:
+            diario.anotar(registro)
+        except OSError as e:
+            print(f"Aviso: {e}")
+
+
+def anotar_conexion(conexion):
+    anotar('conexion', *tupla_conexion(conexion))
+
+
+def tupla_conexion(conexion):
+    return (conexion.handler, conexion.alumno.codigo, conexion.servidor.nombre, conexion.servicio.nombre,
+            tuple(conexion.flows))
+
+
+# Normaliza una MAC a minúsculas separadas por ':' (formato que usa Floodlight)
+def normalizar_mac(mac):
+    if isinstance(mac, int):
+        # YAML 1.1 lee como entero sexagesimal una MAC sin comillas cuyos grupos son
+        # todos decimales menores que 60 (p. ej. 44:11:22:44:37:25): se reconstruye
+        grupos = []
+        while mac:
+            mac, grupo = divmod(mac, 60)
+            grupos.append(f"{grupo:02d}")
+        return ':'.join(reversed(grupos))
+    return str(mac).strip().lower().replace('-', ':')
+
+
+# Tabla de dispositivos del controlador (/wm/device/) con TTL e índices por MAC e IPv4
+class TablaDispositivos:
+    def __init__(self, ttl=DEVICE_CACHE_TTL):
+        self.ttl = ttl
+        self.dispositivos = []
+        self.por_mac = {}
+        self.por_ip = {}
+        self.actualizado = None
+        self.lock = threading.Lock()
+
+    def invalidar(self):
+        with self.lock:
+            self.actualizado = None
+
+    def vigente(self):
+        return self.actualizado is not None and time.monotonic() - self.actualizado < self.ttl
+
+    def _indexar(self, dispositivos):
+        por_mac = {}
+        por_ip = {}
+        for dispositivo in dispositivos:
+            for mac in dispositivo.get('mac') or []:
+                por_mac.setdefault(normalizar_mac(mac), dispositivo)
+            for ip in dispositivo.get('ipv4') or []:
+                por_ip.setdefault(ip, dispositivo)
+        self.dispositivos = dispositivos
+        self.por_mac = por_mac
+        self.por_ip = por_ip
+        self.actualizado = time.monotonic()
+
+    # Devuelve la lista de dispositivos; solo consulta al controlador si venció el TTL
+    def obtener(self, cliente=None, forzar=False):
+        with self.lock:
+            if forzar or not self.vigente():
+                response = (cliente or controlador).get('/wm/device/')
+                if not response.ok:
+                    print(f'FAILED REQUEST | STATUS: {response.status}')
+                    return None
+                data = response.datos or []
+                # Floodlight >= 1.2 devuelve {"devices": [...]}
+                if isinstance(data, dict):
+                    data = data.get('devices', [])
+                self._indexar(data)
+            return self.dispositivos
+
+    # Recorre los dispositivos: los de la tabla si está vigente o, si no, a medida que
+    # llegan del controlador; si la respuesta se leyó completa la tabla se actualiza
+    def recorrer(self, cliente=None):
+        if self.vigente():
+            yield from self.dispositivos
+            return
+        recibidos = []
+        elementos = (cliente or controlador).elementos('/wm/device/', 'devices')
+        while True:
+            try:
+                dispositivo = next(elementos)
+            except StopIteration as fin:
+                completa = fin.value
+                break
+            recibidos.append(dispositivo)
+            yield dispositivo
+        if completa:
+            with self.lock:
+                self._indexar(recibidos)
+
+    def _buscar_local(self, clave):
+        return self.por_mac.get(normalizar_mac(clave)) or self.por_ip.get(clave)
+
+    def buscar(self, mac_or_ip, cliente=None):
+        if self.obtener(cliente) is None:
+            return None
+        clave = str(mac_or_ip)
+        dispositivo = self._buscar_local(clave)
+        # Un host recién conectado puede no estar aún en la tabla: se refresca,
+        # como mucho una vez cada DEVICE_CACHE_MISS_REFRESH segundos
+        actualizado = self.actualizado
+        if dispositivo is None and (actualizado is None or time.monotonic() - actualizado >= DEVICE_CACHE_MISS_REFRESH):
+            if self.obtener(cliente, forzar=True) is None:
+                return None
+            dispositivo = self._buscar_local(clave)
+        return dispositivo
+
+
+tabla_dispositivos = TablaDispositivos()
+
+
+# Filas (MAC, IPv4, DPID, puerto) de los hosts, filtradas por prefijo de MAC y switch
+def filas_dispositivos(dispositivos, mac=None, switch=None):
+    prefijo = normalizar_mac(mac) if mac else None
+    for device in dispositivos:
+        if device.get("attachmentPoint"):
+            mac_host = normalizar_mac(device["mac"][0]) if device.get("mac") else "-"
+            ipv4 = device["ipv4"][0] if device.get("ipv4") else "-"
+            ap = device["attachmentPoint"][0]
+            dpid = ap.get("switchDPID", "-")
+            port = ap.get("port", "-")
+            if ap.get("port", -2) < 0: # No muestra switches
+                continue
+            if prefijo and not mac_host.startswith(prefijo):
+                continue
+            if switch and dpid != switch:
+                continue
+            yield mac_host, ipv4, dpid, port
+
+
+def get_list_devices(cliente=None, mac=None, switch=None, formato=None, pagina=None):
+    inicio = time.perf_counter()
+    filas = medir_listado('get_list_devices', filas_dispositivos(tabla_dispositivos.recorrer(cliente), mac, switch),
+                          inicio)
+    if not mostrar_listado(["MAC", "IPv4", "Switch DPID", "Puerto"], filas, formato, pagina):
+        print("No se encontraron dispositivos.")
 
 
 # Función que obtiene el punto de conexión (DPID y puerto) para una MAC o IP dada
-def get_attachment_points(mac_or_ip, controller_ip):
-    target_api = '/wm/device/'
-    headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
-    url = f'http://{controller_ip}:8080{target_api}'
-    response = requests.get(url=url, headers=headers)
-
-    if response.status_code != 200:
-        print("Error en la consulta")
+def get_attachment_points(mac_or_ip, cliente=None):
+    dispositivo = tabla_dispositivos.buscar(mac_or_ip, cliente)
+    if dispositivo is None:
         return None, None
-    
-    dispositivos = response.json()
-    for dispositivo in dispositivos:
-        # Buscar por MAC
-        if dispositivo.get('mac') and dispositivo['mac'][0].lower() == mac_or_ip.lower():
-            puntos = dispositivo.get('attachmentPoint', [])
-            if puntos:
-                punto = puntos[0] # Tomamos el primero si hay varios
-                return punto['switchDPID'], punto['port']
-        # Buscar por IP
-        if dispositivo.get('ipv4') and dispositivo['ipv4'][0] == mac_or_ip:
-            puntos = dispositivo.get('attachmentPoint', [])
-            if puntos:
-                punto = puntos[0] # Tomamos el primero si hay varios
-                return punto['switchDPID'], punto['port']
+
+    puntos = dispositivo.get('attachmentPoint', [])
+    if puntos:
+        punto = puntos[0] # Tomamos el primero si hay varios
+        return punto['switchDPID'], punto['port']
     return None, None
 
 # Función que obtiene la ruta entre dos puntos de conexión (switch y puerto)
-def get_route(src_dpid, src_port, dst_dpid, dst_port, controller_ip):
+def get_route(src_dpid, src_port, dst_dpid, dst_port, cliente=None):
     target_api = f'/wm/topology/route/{src_dpid}/{src_port}/{dst_dpid}/{dst_port}/json'
-    headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
-    url = f'http://{controller_ip}:8080{target_api}'
-    response = requests.get(url=url, headers=headers)
-    if response.status_code != 200:
+    response = (cliente or controlador).get(target_api)
+    if not response.ok:
         print("Error al consultar ruta")
         return None
     
-    return response.json()
+    return response.datos
 
 
 
 
-def insertar_flows(mac_src, ip_dst, protocolo, puerto, handler, controller_ip):
-    dpid, port = get_attachment_points(mac_src, controller_ip)
-    if not dpid:
-        print("No se pudo determinar el punto de conexión.")
-        return False
+# Saltos de una ruta de Floodlight: la ruta es una lista de pares (switch, puerto de
+# entrada), (switch, puerto de salida). Devuelve [(dpid, puerto_entrada, puerto_salida)]
+def saltos_de_ruta(ruta):
+    saltos = []
+    for i in range(0, len(ruta) - 1, 2):
+        entrada, salida = ruta[i], ruta[i + 1]
+        saltos.append((entrada['switch'], _numero_puerto(entrada['port']), _numero_puerto(salida['port'])))
+    return saltos
+
+
+def _numero_puerto(puerto):
+    if isinstance(puerto, dict):
+        puerto = puerto.get('shortPortNumber', puerto.get('portNumber'))
+    return int(puerto)
 
+
+# Caché de rutas por (dpid origen, puerto origen, dpid destino, puerto destino).
+# Además guarda la ruta entre cada par de switches, de modo que alumnos en otros puertos
+# del mismo switch reutilizan la consulta. Se invalida cuando cambian los enlaces.
+class CacheRutas:
+    def __init__(self, intervalo_topologia=ROUTE_CACHE_TOPOLOGY_CHECK):
+        self.intervalo_topologia = intervalo_topologia
+        self.rutas = {}
+        self.por_switches = {}
+        self.en_curso = {}
+        self.huella_enlaces = None
+        self.ultima_verificacion = None
+        self.consultas = 0
+        self.lock = threading.Lock()
+
+    def invalidar(self):
+        with self.lock:
+            self.rutas.clear()
+            self.por_switches.clear()
+
+    # Invalida la caché si la lista de enlaces cambió (como mucho una consulta por intervalo)
+    def verificar_topologia(self, cliente=None, forzar=False):
+        with self.lock:
+            ahora = time.monotonic()
+            if not forzar and self.ultima_verificacion is not None and ahora - self.ultima_verificacion < self.intervalo_topologia:
+                return
+            self.ultima_verificacion = ahora
+        response = (cliente or controlador).get('/wm/topology/links/json')
+        if not response.ok:
+            return
+        huella = frozenset((e.get('src-switch'), e.get('src-port'), e.get('dst-switch'), e.get('dst-port'))
+                           for e in response.datos or [])
+        with self.lock:
+            if self.huella_enlaces is not None and huella != self.huella_enlaces:
+                self.rutas.clear()
+                self.por_switches.clear()
+            self.huella_enlaces = huella
+
+    def _adaptar(self, ruta, src_port, dst_port):
+        ruta = [dict(paso) for paso in ruta]
+        ruta[0]['port'] = {'shortPortNumber': int(src_port)}
+        ruta[-1]['port'] = {'shortPortNumber': int(dst_port)}
+        return ruta
+
+    def obtener(self, src_dpid, src_port, dst_dpid, dst_port, cliente=None):
+        self.verificar_topologia(cliente)
+        clave = (src_dpid, int(src_port), dst_dpid, int(dst_port))
+        par = (src_dpid, dst_dpid)
+        while True:
+            with self.lock:
+                if clave in self.rutas:
+                    return self.rutas[clave]
+                if par in self.por_switches:
+                    ruta = self._adaptar(self.por_switches[par], src_port, dst_port)
+                    self.rutas[clave] = ruta
+                    return ruta
+                evento = self.en_curso.get(par)
+                if evento is None:
+                    # Este hilo consulta; los demás que piden el mismo par esperan su resultado
+                    evento = self.en_curso[par] = threading.Event()
+                    break
+            evento.wait()
+            with self.lock:
+                if par not in self.por_switches:
+                    # La consulta del otro hilo falló: no se reintenta en bucle
+                    return None
+
+        try:
+            self.consultas += 1
+            ruta = get_route(src_dpid, src_port, dst_dpid, dst_port, cliente)
+            with self.lock:
+                if ruta:
+                    self.rutas[clave] = ruta
+                    self.por_switches[par] = ruta
+            return ruta or None
+        finally:
+            with self.lock:
+                del self.en_curso[par]
+            evento.set()
+
+
+cache_rutas = CacheRutas()
+topologia_local = Topologia(TOPOLOGY_REFRESH)
+
+
+# Ruta entre dos puntos de conexión: se calcula con la topología local y, si no está
+# disponible o no conoce alguno de los switches, se consulta al controlador (con caché)
+def obtener_ruta(src_dpid, src_port, dst_dpid, dst_port, cliente=None):
+    if ROUTE_LOCAL:
+        topologia_local.asegurar(cliente or controlador)
+        ruta = topologia_local.ruta(src_dpid, src_port, dst_dpid, dst_port)
+        if ruta:
+            return ruta
+    return cache_rutas.obtener(src_dpid, src_port, dst_dpid, dst_port, cliente)
+
+
+# Fallos transitorios: sin respuesta, controlador saturado (429) o error del servidor
+def respuesta_reintentable(respuesta):
+    return respuesta.status == 0 or respuesta.status == 429 or respuesta.status >= 500
+
+
+# Todas las escrituras al static flow pusher pasan por el planificador (ver
+# planificador.py); con un cluster hay uno por controlador, con su propio tope
+escrituras = EscriturasPorDestino(concurrencia=FLOW_PUSH_WORKERS, tasa=CONTROLLER_WRITE_RATE,
+                                  reintentos=CONTROLLER_WRITE_RETRIES, espera_base=CONTROLLER_WRITE_BACKOFF,
+                                  espera_maxima=CONTROLLER_WRITE_BACKOFF_MAX, reintentable=respuesta_reintentable,
+                                  anulada=Respuesta(0, None))
+metricas.indicador('upsm_escrituras_pendientes', 'Escrituras al controlador encoladas o en curso',
+                   lambda: sum(escrituras.estado()[clave] for clave in ('pendientes', 'en_curso')))
+metricas.indicador('upsm_escrituras_drenaje_segundos', 'Tiempo estimado para vaciar la cola de escrituras',
+                   lambda: escrituras.estado()["drenaje"])
+
+# Usuarios de las reglas compartidas: las registradas salen del índice de conexiones.
+# Con timeouts el switch puede vencer una regla por su cuenta, así que no se da por
+# instalada y cada conexión nueva la vuelve a enviar. Los timeouts se pueden cambiar
+# desde el menú de uso, así que se miran en cada alta
+reglas_compartidas = ReglasCompartidas(lambda nombre, excluidos: conexiones.usa_regla(nombre, excluidos),
+                                       Respuesta(200, None),
+                                       recordar=lambda: not (FLOW_IDLE_TIMEOUT or FLOW_HARD_TIMEOUT),
+                                       activo=FLOW_AGGREGATION)
+metricas.indicador('upsm_reglas_compartidas', 'Reglas compartidas en uso (modo de agregación)',
+                   lambda: len(conexiones.por_regla))
+
+
+# Alta de un flow en el controlador dueño de su switch; las operaciones pendientes
+# sobre el mismo nombre se combinan. Si el flow estaba en otro controlador (el host se
+# movió a un switch de otro controlador) se borra de ahí. Las reglas compartidas se
+# cuentan por `handler` (la conexión que la usa): solo se envían si hace falta
+def enviar_flow(flow, cliente=None, prioridad=PRIORIDAD_CONCESION, handler=None):
+    if es_compartido(flow['name']):
+        return reglas_compartidas.adquirir(flow, handler, lambda: _enviar_flow(flow, cliente, prioridad))
+    return _enviar_flow(flow, cliente, prioridad)
+
+
+def _enviar_flow(flow, cliente, prioridad):
+    destino, anterior = (cliente or controlador).destino_flow(flow)
+    if anterior is not None:
+        escrituras.enviar(anterior, 'DELETE', '/wm/staticflowpusher/json', {"name": flow['name']},
+                          (anterior, flow['name']), prioridad)
+    return escrituras.enviar(destino, 'POST', '/wm/staticflowpusher/json', flow, (destino, flow['name']), prioridad)
+
+
+# Una regla compartida solo se borra cuando la sueltan (`usuarios`: handlers de las
+# conexiones que dejan de usarla) sus últimos usuarios; con usuarios None
+# (sincronizaciones globales) se borra sin mirar quién la usa
+def borrar_flow(nombre, cliente=None, prioridad=PRIORIDAD_REVOCACION, usuarios=None):
+    if es_compartido(nombre):
+        return reglas_compartidas.liberar(nombre, usuarios, lambda: _borrar_flow(nombre, cliente, prioridad))
+    return _borrar_flow(nombre, cliente, prioridad)
+
+
+def _borrar_flow(nombre, cliente, prioridad):
+    return combinar_futuros([escrituras.enviar(destino, 'DELETE', '/wm/staticflowpusher/json', {"name": nombre},
+                                               (destino, nombre), prioridad)
+                             for destino in (cliente or controlador).destinos_borrado(nombre)])
+
+
+def construir_flow(mac_src, ip_dst, protocolo, puerto, handler, dpid, port, in_port=None):
     flow = {
         "switch": dpid,
         "name": handler,
@@ -149,23 +1096,235 @@ def insertar_flows(mac_src, ip_dst, protocolo, puerto, handler, controller_ip):
         "active": "true",
         "actions": f"output={port}"  
     }
-    response = requests.post(f"http://{controller_ip}:8080/wm/staticflowpusher/json", json=flow)
-    return response.status_code == 200
+    if in_port is not None:
+        flow["in_port"] = str(in_port)
+    return con_timeouts(flow)
+
+
+# Flow de retorno (servidor -> alumno) de un salto
+def construir_flow_retorno(mac_dst, ip_src, protocolo, puerto, nombre, dpid, port, in_port):
+    return con_timeouts({
+        "switch": dpid,
+        "name": nombre,
+        "priority": "32768",
+        "eth_type": "0x0800",
+        "in_port": str(in_port),
+        "ipv4_src": ip_src,
+        "eth_dst": mac_dst,
+        "ip_proto": "0x06" if protocolo.lower() == "tcp" else "0x11",
+        "tp_src": str(puerto),
+        "active": "true",
+        "actions": f"output={port}"
+    })
+
+
+# Regla compartida de un salto de tránsito (modo de agregación): match por puerto de
+# entrada más `campos`; el nombre se deriva del switch y del match
+def construir_flow_compartido(dpid, in_port, campos, port, prioridad="32768"):
+    match = dict({"priority": prioridad, "eth_type": "0x0800", "in_port": str(in_port)}, **campos)
+    return con_timeouts(dict(match, switch=dpid, name=nombre_compartido(dpid, match), active="true",
+                             actions=f"output={port}"))
+
+
+# Con timeouts configurados el switch vence los flows por su cuenta (y Floodlight los
+# quita del static flow pusher al recibir el FLOW_REMOVED)
+def con_timeouts(flow):
+    if FLOW_IDLE_TIMEOUT:
+        flow["idle_timeout"] = str(FLOW_IDLE_TIMEOUT)
+    if FLOW_HARD_TIMEOUT:
+        flow["hard_timeout"] = str(FLOW_HARD_TIMEOUT)
+    return flow
+
+
+# Nombre del flow de un salto de la conexión: <handler>.<salto>.ida / .vuelta
+def nombre_flow(handler, salto, sentido):
+    return f"{handler}.{salto}.{sentido}"
+
+
+def handler_de_flow(nombre):
+    base, _, sentido = nombre.rpartition('.')
+    if sentido in ('ida', 'vuelta'):
+        handler, _, salto = base.rpartition('.')
+        if handler and salto.isdigit():
+            return handler
+    return nombre
+
+
+# Flows de ida y vuelta en cada salto de la ruta entre el alumno y el servidor: {nombre: flow}.
+# None si no se conoce el punto de conexión de alguno de los extremos o no hay ruta.
+#
+# Con agregar=True (por defecto, según el modo activo) solo el switch que autoriza cada
+# sentido lleva la regla exacta de la conexión: el del alumno para la ida y el del
+# servidor para la vuelta. En los demás saltos el tráfico ya pasó esa regla, así que
+# basta una regla por puerto de entrada y destino, compartida por todas las conexiones:
+# (servidor, servicio) para la ida y (alumno, servidor) para la vuelta. El puerto de
+# entrada las separa de las reglas exactas de los hosts del mismo switch, y las de
+# vuelta van con menor prioridad para que un paquete que coincida con las dos (p. ej.
+# con la MAC de destino cambiada) siga hacia el servidor. Las rutas salen del árbol de
+# caminos más cortos de cada destino, así que todas las conexiones que comparten una
+# regla esperan la misma salida
+def flows_ruta(mac_src, ip_dst, protocolo, puerto, handler, cliente=None, agregar=None):
+    if agregar is None:
+        agregar = reglas_compartidas.activo
+    dpid, port = get_attachment_points(mac_src, cliente)
+    if not dpid:
+        print("No se pudo determinar el punto de conexión.")
+        return None
+    dpid_srv, port_srv = get_attachment_points(ip_dst, cliente)
+    if not dpid_srv:
+        print(f"No se pudo determinar el punto de conexión del servidor {ip_dst}.")
+        return None
+
+    ruta = obtener_ruta(dpid, port, dpid_srv, port_srv, cliente)
+    if not ruta:
+        return None
+
+    flows = {}
+    saltos = saltos_de_ruta(ruta)
+    ultimo = len(saltos) - 1
+    for salto, (switch, entrada, salida) in enumerate(saltos):
+        if agregar and salto > 0:
+            ida = construir_flow_compartido(switch, entrada, {
+                "ipv4_dst": ip_dst, "ip_proto": "0x06" if protocolo.lower() == "tcp" else "0x11",
+                "tp_dst": str(puerto)}, salida)
+        else:
+            nombre = nombre_flow(handler, salto, 'ida')
+            ida = construir_flow(mac_src, ip_dst, protocolo, puerto, nombre, switch, salida, in_port=entrada)
+        if agregar and salto < ultimo:
+            vuelta = construir_flow_compartido(switch, salida, {"ipv4_src": ip_dst, "eth_dst": mac_src}, entrada,
+                                               "32767")
+        else:
+            nombre = nombre_flow(handler, salto, 'vuelta')
+            vuelta = construir_flow_retorno(mac_src, ip_dst, protocolo, puerto, nombre, switch, entrada, salida)
+        flows[ida['name']] = ida
+        flows[vuelta['name']] = vuelta
+    return flows
+
+
+def flows_de_conexion(alumno, servidor, servicio, handler, cliente=None, agregar=None):
+    return flows_ruta(alumno.mac, servidor.direccion_ip, servicio.protocolo, servicio.puerto, handler, cliente,
+                      agregar)
+
+
+# Instala los flows de todos los saltos en paralelo. Devuelve la lista de nombres
+# instalados, o None si falló (en ese caso se retiran los que sí se instalaron). Las
+# reglas compartidas quedan reservadas para `handler` hasta liberar_handler()
+def insertar_flows(mac_src, ip_dst, protocolo, puerto, handler, cliente=None):
+    cliente = cliente or controlador
+    flows = flows_ruta(mac_src, ip_dst, protocolo, puerto, handler, cliente)
+    if not flows:
+        return None
+
+    futuros = [(nombre, enviar_flow(flow, cliente, handler=handler)) for nombre, flow in flows.items()]
+    instalados = [nombre for nombre, futuro in futuros if futuro.result().ok]
+    if len(instalados) != len(flows):
+        eliminar_flows([nombre for nombre, futuro in futuros if futuro.result().ok or es_compartido(nombre)],
+                       cliente, {handler})
+        return None
+    return list(flows)
+
+
+# Borra flows por nombre (las reglas compartidas, solo si `usuarios` eran sus últimos
+# usuarios). Devuelve los nombres que no se pudieron borrar
+def eliminar_flows(nombres, cliente=None, usuarios=None):
+    futuros = [(nombre, borrar_flow(nombre, cliente, usuarios=usuarios)) for nombre in nombres]
+    return [nombre for nombre, futuro in futuros if not futuro.result().ok]
+
+
+# (flows propios de la conexión, reglas compartidas). Al dar de baja una conexión
+# registrada las compartidas se sueltan después de sacarla del registro: así, entre
+# varias que se borran a la vez, la última siempre ve que ya nadie más las usa
+def separar_compartidas(nombres):
+    propios, compartidas = [], []
+    for nombre in nombres:
+        (compartidas if es_compartido(nombre) else propios).append(nombre)
+    return propios, compartidas
+
 
+# Campos de match que se comparan al reconciliar (Floodlight devuelve tp_* como tcp_*/udp_*)
+CAMPOS_MATCH = ('in_port', 'eth_src', 'eth_dst', 'ipv4_src', 'ipv4_dst', 'ip_proto', 'tp_src', 'tp_dst')
+CAMPOS_NUMERICOS = ('in_port', 'ip_proto', 'tp_src', 'tp_dst')
 
 
-def main():
+def _valor_match(match, campo):
+    if campo in ('tp_src', 'tp_dst'):
+        sufijo = campo[2:]
+        for alias in (campo, 'tcp' + sufijo, 'udp' + sufijo):
+            if match.get(alias) not in (None, ''):
+                return match[alias]
+        return None
+    return match.get(campo)
+
+
+# Representación comparable de un flow: (switch, campos de match normalizados, acciones)
+def firma_flow(switch, match, acciones):
+    campos = []
+    for campo in CAMPOS_MATCH:
+        valor = _valor_match(match, campo)
+        if valor is None or valor == '':
+            continue
+        if campo in CAMPOS_NUMERICOS:
+            try:
+                valor = int(str(valor), 0)
+            except ValueError:
+                valor = str(valor)
+        elif campo in ('eth_src', 'eth_dst'):
+            valor = normalizar_mac(valor)
+        else:
+            valor = str(valor)
+        campos.append((campo, valor))
+    return str(switch).lower(), tuple(campos), str(acciones or '').replace(' ', '').lower()
+
+
+# Flows estáticos que tiene el controlador, en una sola llamada: {nombre: firma}
+def flows_en_controlador(cliente=None):
+    response = (cliente or controlador).get('/wm/staticflowpusher/list/all/json')
+    if not response.ok:
+        print(f"Error al consultar los flows del controlador | STATUS: {response.status}")
+        return None
+    flows = {}
+    for switch, entradas in (response.datos or {}).items():
+        for entrada in entradas or []:
+            for nombre, datos in entrada.items():
+                flows[nombre] = firma_entrada(switch, datos)
+    return flows
+
+
+# Firma de una entrada del listado del static flow pusher
+def firma_entrada(switch, datos):
+    instrucciones = datos.get('instructions') or {}
+    acciones = (instrucciones.get('instruction_apply_actions') or {}).get('actions', datos.get('actions'))
+    return firma_flow(switch, datos.get('match') or {}, acciones)
+
+
+
+def main(estado=None):
     global alumnos, cursos, servidores
 
+    recuperar_estado(estado or ESTADO_CLI)
+    recolector_uso.cargar(ruta_uso(estado or ESTADO_CLI))
+    if DEVICE_TRACKER:
+        rastreador.iniciar()
+    # Con una política de inactividad la recolección de uso arranca sola
+    if FLOW_IDLE_EXPIRY:
+        recolector_uso.iniciar()
+
     while True:
         menu()
         opcion = input()
         
         if opcion == "8":
             print("Saliendo...")
+            rastreador.detener()
+            recolector_uso.detener()
+            if recolector_uso.ultima_recoleccion is not None:
+                recolector_uso.guardar(ruta_uso(estado or ESTADO_CLI))
+            compactar_estado()
+            cerrar_diario()
             break
         
         execute(opcion)
+        compactar_si_hace_falta()
 
 def menu():
     print("\n")
@@ -181,6 +1340,7 @@ def menu():
     print("6) Políticas")
     print("7) Conexiones")
     print("8) Salir")
+    print("9) Métricas")
     print("\n>>> ", end="")
 
 def execute(opcion):
@@ -189,6 +1349,7 @@ def execute(opcion):
         importar_datos()
     elif opcion == "2":
         print("Opción 2 seleccionada: Exportar")
+        exportar_datos()
     elif opcion == "3":
         print("Opción 3 seleccionada: Cursos")
         opcion_cursos()
@@ -200,271 +1361,2586 @@ def execute(opcion):
         opcion_servidores()
     elif opcion == "6":
         print("Opción 6 seleccionada: Políticas")
+        opcion_politicas()
     elif opcion == "7":
         print("Opción 7 seleccionada: Conexiones")
         opcion_conexiones()
     elif opcion == "8":
         print("Opción 8 seleccionada: Salir")
+    elif opcion == "9":
+        print("Opción 9 seleccionada: Métricas")
+        opcion_metricas()
     else:
         print("Opción no válida.")
 
 
-def importar_datos():
-    global alumnos, cursos, servidores
-
-    nombre_archivo = input("\nIngrese el nombre del archivo (sin extensión): ")
-    ruta = nombre_archivo + '.yaml'
-    
-    try:
-        with open(ruta, 'r') as archivo:
-            datos = yaml.safe_load(archivo)
-        print("Archivo cargado correctamente")
-    except:
-        print("Error al cargar el archivo")
-    
-    
-    alumnos_dict = {alumno['codigo']: Alumno(alumno['nombre'], alumno['codigo'], alumno['mac']) for alumno in datos['alumnos']}
-    
-    cursos = []
-    for curso_data in datos.get('cursos', []):
-        curso = Curso(curso_data['nombre'], curso_data['estado'], curso_data['codigo'])
-        
-        for alumno_codigo in curso_data.get('alumnos', []):
-            alumno = alumnos_dict.get(alumno_codigo)
-            if alumno:
-                curso.add_alumno(alumno)
-            else:
-                print(f"Alumno con código {alumno_codigo} no encontrado.")
-        
-        for servidor_data in datos.get('servidores', []):
-            servidor = Servidor(servidor_data['nombre'], servidor_data['ip'])
-            for servicio_data in servidor_data.get('servicios', []):
-                servicio = Servicio(servicio_data['nombre'], servicio_data['protocolo'], servicio_data['puerto'])
-                servidor.add_servicio(servicio)
-            
-            curso.add_servidor(servidor)
-        
-        cursos.append(curso)
-    
-    alumnos = list(alumnos_dict.values())
-
-    servidores = []
-    for servidor_data in datos.get('servidores', []):
-        servidor = Servidor(servidor_data['nombre'], servidor_data['ip'])
-        for servicio_data in servidor_data.get('servicios', []):
-            servicio = Servicio(servicio_data['nombre'], servicio_data['protocolo'], servicio_data['puerto'])
-            servidor.add_servicio(servicio)
-        servidores.append(servidor)
-
-
-def opcion_cursos():
+def opcion_metricas():
 
     while True:
         print("\n")
         print("\nSelecciona una opción:")
-        print("1) Listar")
-        print("2) Mostrar propiedades")
-        print("3) Actualizar")
-        print("4) Regresar")
-        print("\n>>> ", end="")        
-        
+        print("1) Ver métricas")
+        print("2) Exportar (formato Prometheus)")
+        print(f"3) {'Desactivar' if metricas.activo else 'Activar'} instrumentación")
+        print("4) Reiniciar")
+        print("5) Tope de escrituras al controlador")
+        print("6) Regresar")
+        print("\n>>> ", end="")
+
         opcion = input()
-        
-        if opcion == "4":
+
+        if opcion == "6":
             print("Volviendo al menú principal...")
             break
-        
+
         if opcion == "1":
-            print("Opción 1 seleccionada: Listar")
-            mostrar_cursos()
+            mostrar_metricas()
         elif opcion == "2":
-            print("Opción 2 seleccionada: Mostrar propiedades")
-            mostrar_detalles_cursos()
+            ruta = input(f"Archivo de salida [{METRICAS_ARCHIVO}]: ").strip() or METRICAS_ARCHIVO
+            try:
+                metricas.exportar(ruta)
+                print(f"Métricas exportadas a {ruta}")
+            except OSError as e:
+                print(f"Error al exportar: {e}")
         elif opcion == "3":
-            print("Opción 3 seleccionada: Actualizar")
-            actualizar_alumnos_curso()
+            metricas.activo = not metricas.activo
+            print(f"Instrumentación {'activada' if metricas.activo else 'desactivada'}.")
         elif opcion == "4":
-            print("Opción 4 seleccionada: Regresar")
+            metricas.reiniciar()
+            print("Métricas reiniciadas.")
+        elif opcion == "5":
+            valor = input(f"Escrituras por segundo (actual: {escrituras.tasa:g}, 0 = sin tope): ").strip()
+            try:
+                tasa = float(valor)
+            except ValueError:
+                print("Valor no válido.")
+                continue
+            if tasa < 0:
+                print("Valor no válido.")
+                continue
+            escrituras.tasa = tasa
+            print(f"Tope de escrituras: {f'{tasa:g}/s' if tasa else 'sin tope'}.")
         else:
             print("Opción no válida.")
 
-    
-def opcion_alumnos():
+
+def mostrar_metricas():
+    from prettytable import PrettyTable
+    mostrar_escrituras()
+    filas = metricas.filas()
+    if not filas:
+        print("No hay métricas registradas" + ("" if metricas.activo else " (instrumentación desactivada)") + ".")
+        return
+
+    table = PrettyTable()
+    table.field_names = ["Tipo", "Nombre", "Llamadas", "Errores", "Enviado (B)", "Recibido (B)",
+                         "Media (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)"]
+    for tipo, nombre, llamadas, errores, enviados, recibidos, media, p50, p95, p99 in filas:
+        detalle_errores = ", ".join(f"{codigo}: {cantidad}" for codigo, cantidad in errores.items()) or "-"
+        table.add_row([tipo, nombre, llamadas, detalle_errores, enviados, recibidos, f"{media * 1000:.2f}",
+                       f"≤{p50 * 1000:g}", f"≤{p95 * 1000:g}", f"≤{p99 * 1000:g}"])
+    print(table)
+
+
+# Estado del planificador de escrituras al static flow pusher
+def mostrar_escrituras():
+    por_destino = escrituras.por_destino()
+    if len(por_destino) > 1:
+        for destino, estado in por_destino.items():
+            print(f"  {destino}: {estado['pendientes']} en cola, {estado['en_curso']} en curso, "
+                  f"{estado['completadas']} completadas, vaciado en {estado['drenaje']:.1f} s")
+    estado = escrituras.estado()
+    tope = f"{escrituras.tasa:g}/s por controlador" if escrituras.tasa else "sin tope"
+    print(f"Escrituras: {estado['pendientes']} en cola ({estado['diferidas']} esperando reintento), "
+          f"{estado['en_curso']} en curso | tope {tope}, {escrituras.concurrencia} simultáneas | "
+          f"vaciado estimado en {estado['drenaje']:.1f} s")
+    print(f"  enviadas {estado['enviadas']}, completadas {estado['completadas']}, fallidas {estado['fallidas']}, "
+          f"reintentos {estado['reintentos']}, combinadas {estado['combinadas']}, anuladas {estado['anuladas']}")
+
+
+def importar_datos():
+    nombre_archivo = input("\nIngrese el nombre del archivo (sin extensión): ")
+    ruta = resolver_archivo(nombre_archivo)
+    # Con datos ya cargados se ofrece aplicar solo los cambios: las conexiones existentes
+    # se conservan y solo se tocan las afectadas
+    if len(alumnos) or len(cursos):
+        respuesta = input("¿Aplicar solo los cambios sobre el estado actual? (s/n) [s]: ").strip().lower()
+        if respuesta in ('', 's'):
+            resultado = reimportar_datos(ruta)
+            if resultado is not None:
+                imprimir_reimportacion(resultado)
+                compactar_si_hace_falta()
+            return
+    if cargar_datos(ruta):
+        compactar_estado()
+
+
+# Acepta el nombre con o sin extensión: prueba tal cual, luego .yaml y .snap
+def resolver_archivo(nombre_archivo):
+    for ruta in (nombre_archivo, nombre_archivo + '.yaml', nombre_archivo + '.snap'):
+        if os.path.isfile(ruta):
+            return ruta
+    return nombre_archivo + '.yaml'
+
+
+# PyYAML se importa con importar_yaml(), que también prepara el loader en C (libyaml)
+# si está disponible y el resolver/constructor usados por el parser en streaming
+yaml = None
+YamlLoader = None
+YamlDumper = None
+_resolver_yaml = None
+_constructor_yaml = None
+
+
+def importar_yaml():
+    global yaml, YamlLoader, YamlDumper, _resolver_yaml, _constructor_yaml
+    if yaml is None:
+        import yaml as modulo
+        YamlLoader = getattr(modulo, 'CSafeLoader', modulo.SafeLoader)
+        YamlDumper = getattr(modulo, 'CSafeDumper', modulo.SafeDumper)
+        _resolver_yaml = modulo.resolver.Resolver()
+        _constructor_yaml = modulo.constructor.SafeConstructor()
+        yaml = modulo
+    return yaml
+
+
+# Archivo del cluster (YAML o JSON):
+#   controladores:
+#     - url: http://10.20.12.65:8080
+#       switches: ["00:00:00:00:00:00:00:01", ...]   # opcional; el resto por hashing
+# Devuelve (URLs, {dpid: URL})
+def leer_cluster(ruta):
+    importar_yaml()
+    with open(ruta) as archivo:
+        datos = yaml.load(archivo, Loader=YamlLoader) or {}
+    urls, asignados = [], {}
+    for entrada in datos.get('controladores') or []:
+        url = str(entrada['url']).rstrip('/')
+        urls.append(url)
+        for dpid in entrada.get('switches') or []:
+            asignados[normalizar_dpid(dpid)] = url
+    if not urls:
+        raise ValueError(f"{ruta}: no define controladores")
+    return urls, asignados
+
+
+def configurar_cluster(ruta):
+    urls, asignados = leer_cluster(ruta)
+    configurar_controlador(','.join(urls), asignados=asignados)
+    print(f"Cluster de {len(urls)} controladores ({len(asignados)} switches asignados) desde {ruta}")
+
+
+_TAG_STR = 'tag:yaml.org,2002:str'
+_TAG_INT = 'tag:yaml.org,2002:int'
+
+
+def _escalar_yaml(evento):
+    tag = evento.tag
+    if tag is None or tag == '!':
+        tag = _resolver_yaml.resolve(yaml.ScalarNode, evento.value, evento.implicit)
+    if tag == _TAG_STR:
+        return evento.value
+    if tag == _TAG_INT and evento.value.isdigit():
+        return int(evento.value)
+    constructor = _constructor_yaml.yaml_constructors.get(tag)
+    if constructor is None:
+        return evento.value
+    return constructor(_constructor_yaml, yaml.ScalarNode(tag, evento.value, style=evento.style))
+
+
+# Construye el objeto Python que empieza en 'evento' consumiendo los eventos del parser
+def _objeto_yaml(eventos, evento, anclas):
+    if isinstance(evento, yaml.AliasEvent):
+        return anclas[evento.anchor]
+    if isinstance(evento, yaml.ScalarEvent):
+        valor = _escalar_yaml(evento)
+    elif isinstance(evento, yaml.SequenceStartEvent):
+        valor = []
+        for siguiente in eventos:
+            if isinstance(siguiente, yaml.SequenceEndEvent):
+                break
+            valor.append(_objeto_yaml(eventos, siguiente, anclas))
+    elif isinstance(evento, yaml.MappingStartEvent):
+        valor = {}
+        for siguiente in eventos:
+            if isinstance(siguiente, yaml.MappingEndEvent):
+                break
+            clave = _objeto_yaml(eventos, siguiente, anclas)
+            valor[clave] = _objeto_yaml(eventos, next(eventos), anclas)
+    else:
+        raise yaml.YAMLError(f"Evento YAML inesperado: {evento}")
+    if getattr(evento, 'anchor', None):
+        anclas[evento.anchor] = valor
+    return valor
+
+
+# Recorre el documento en streaming y devuelve (bloque, elemento) por cada elemento de
+# los bloques de primer nivel, sin construir el documento completo en memoria
+def leer_bloques_yaml(archivo):
+    importar_yaml()
+    eventos = yaml.parse(archivo, Loader=YamlLoader)
+    anclas = {}
+    for evento in eventos:
+        if isinstance(evento, yaml.MappingStartEvent):
+            break
+        if isinstance(evento, yaml.StreamEndEvent):
+            return
+    for evento in eventos:
+        if isinstance(evento, yaml.MappingEndEvent):
+            return
+        bloque = _objeto_yaml(eventos, evento, anclas)
+        valor = next(eventos)
+        if isinstance(valor, yaml.SequenceStartEvent):
+            for elemento in eventos:
+                if isinstance(elemento, yaml.SequenceEndEvent):
+                    break
+                yield bloque, _objeto_yaml(eventos, elemento, anclas)
+        else:
+            _objeto_yaml(eventos, valor, anclas)
+
+
+# Construye alumnos, cursos y servidores de un YAML. Cada servidor y servicio se crea una
+# sola vez y los cursos se enlazan por nombre a los objetos compartidos
+def leer_datos_yaml(archivo):
+    nuevos_alumnos = {}
+    datos_cursos = []
+    datos_conexiones = []
+    nuevos_servidores = Registro(lambda s: s.nombre, _minusculas)
+
+    for bloque, datos in leer_bloques_yaml(archivo):
+        if bloque == 'alumnos':
+            alumno = Alumno(datos['nombre'], datos['codigo'], datos['mac'])
+            nuevos_alumnos[str(alumno.codigo)] = alumno
+        elif bloque == 'cursos':
+            # Los servidores pueden venir después de los cursos: se enlazan al final
+            datos_cursos.append(datos)
+        elif bloque == 'conexiones':
+            datos_conexiones.append(datos)
+        elif bloque == 'servidores':
+            servidor = Servidor(datos['nombre'], datos['ip'])
+            for servicio_data in datos.get('servicios') or []:
+                servidor.add_servicio(Servicio(servicio_data['nombre'], servicio_data['protocolo'], servicio_data['puerto']))
+            nuevos_servidores.agregar(servidor)
+
+    nuevos_cursos = []
+    for curso_data in datos_cursos:
+        curso = Curso(curso_data['nombre'], curso_data['estado'], curso_data['codigo'])
+
+        for alumno_codigo in curso_data.get('alumnos') or []:
+            alumno = nuevos_alumnos.get(str(alumno_codigo))
+            if alumno:
+                curso.add_alumno(alumno)
+            else:
+                print(f"Alumno con código {alumno_codigo} no encontrado.")
+
+        for servidor_data in curso_data.get('servidores') or []:
+            servidor = nuevos_servidores.get(servidor_data['nombre'])
+            if servidor:
+                curso.add_servidor(servidor, servidor_data.get('servicios_permitidos'))
+            else:
+                print(f"Servidor {servidor_data['nombre']} del curso {curso.codigo} no encontrado.")
+
+        nuevos_cursos.append(curso)
+
+    nuevas_conexiones = None
+    if datos_conexiones:
+        nuevas_conexiones = [(c['handler'], c['alumno'], c['servidor'], c['servicio'], c.get('flows') or [])
+                             for c in datos_conexiones]
+
+    return list(nuevos_alumnos.values()), nuevos_cursos, list(nuevos_servidores), nuevas_conexiones
+
+
+# Reconstruye alumnos, cursos y servidores desde un snapshot binario
+def leer_datos_snapshot(snap):
+    nuevos_alumnos = {}
+    for nombre, codigo, mac in snap.seccion('alumnos'):
+        nuevos_alumnos[str(codigo)] = Alumno(nombre, codigo, mac)
+
+    nuevos_servidores = Registro(lambda s: s.nombre, _minusculas)
+    for nombre, ip, servicios in snap.seccion('servidores'):
+        nuevos_servidores.agregar(Servidor(nombre, ip, [Servicio(*servicio) for servicio in servicios]))
+
+    nuevos_cursos = []
+    for codigo, nombre, estado, codigos_alumnos, servidores_curso in snap.seccion('cursos'):
+        curso = Curso(nombre, estado, codigo)
+        for codigo_alumno in codigos_alumnos:
+            alumno = nuevos_alumnos.get(str(codigo_alumno))
+            if alumno is None:
+                raise snapshot.ErrorSnapshot(f"{snap.ruta}: snapshot corrupto (el curso {codigo} tiene al alumno "
+                                             f"{codigo_alumno}, que no está)")
+            curso.add_alumno(alumno)
+        for nombre_servidor, permitidos in servidores_curso:
+            servidor = nuevos_servidores.get(nombre_servidor)
+            if servidor is None:
+                raise snapshot.ErrorSnapshot(f"{snap.ruta}: snapshot corrupto (el curso {codigo} tiene al servidor "
+                                             f"{nombre_servidor}, que no está)")
+            curso.add_servidor(servidor, permitidos)
+        nuevos_cursos.append(curso)
+
+    nuevas_conexiones = None
+    if 'conexiones' in snap.nombres():
+        nuevas_conexiones = list(snap.seccion('conexiones'))
+
+    return list(nuevos_alumnos.values()), nuevos_cursos, list(nuevos_servidores), nuevas_conexiones
+
+
+# Lee un YAML o snapshot (con solo_yaml=True, siempre YAML): (alumnos, cursos,
+# servidores, conexiones o None), o None si el archivo no se pudo leer
+def leer_archivo_datos(ruta, solo_yaml=False):
+    try:
+        if not solo_yaml and snapshot.es_snapshot(ruta):
+            with snapshot.Snapshot(ruta) as snap:
+                datos = leer_datos_snapshot(snap)
+        else:
+            importar_yaml()
+            with open(ruta, 'rb') as archivo:
+                datos = leer_datos_yaml(archivo)
+        print("Archivo cargado correctamente")
+        return datos
+    except (OSError, snapshot.ErrorSnapshot, KeyError, TypeError, ValueError) as e:
+        print(f"Error al cargar el archivo: {e}")
+        return None
+    except Exception as e:
+        if yaml is None or not isinstance(e, yaml.YAMLError):
+            raise
+        print(f"Error al cargar el archivo: {e}")
+        return None
+
+
+@metricas.medir('importar_datos')
+def cargar_datos(ruta):
+    inicio = time.perf_counter()
+    datos = leer_archivo_datos(ruta)
+    if datos is None:
+        return False
+    nuevos_alumnos, nuevos_cursos, nuevos_servidores, nuevas_conexiones = datos
+
+    alumnos.reemplazar(nuevos_alumnos)
+    cursos.reemplazar(nuevos_cursos)
+    servidores.reemplazar(nuevos_servidores)
+    indice_autorizacion.construir(cursos)
+
+    # Si el archivo trae conexiones se restauran tal cual, sin consultar al controlador
+    if nuevas_conexiones is not None:
+        conexiones.reemplazar(restaurar_conexiones(nuevas_conexiones))
+
+    duracion = time.perf_counter() - inicio
+    total_servicios = sum(len(servidor.servicios) for servidor in servidores)
+    print(f"Importados {len(alumnos)} alumnos, {len(cursos)} cursos, {len(servidores)} servidores, "
+          f"{total_servicios} servicios y {len(conexiones)} conexiones en {duracion:.2f} s")
+    return True
+
+
+# Conexión a partir de (handler, código, servidor, servicio, flows). None si alguna
+# referencia no existe. `destinos` cachea (servidor, servicio) al restaurar en lote
+def restaurar_conexion(datos, destinos=None):
+    handler, codigo, nombre_servidor, nombre_servicio, flows = datos
+    destino = destinos.get((nombre_servidor, nombre_servicio)) if destinos is not None else None
+    if destino is None:
+        servidor = servidores.get(nombre_servidor)
+        destino = (servidor, servidor.servicios.get(nombre_servicio) if servidor else None)
+        if destinos is not None:
+            destinos[(nombre_servidor, nombre_servicio)] = destino
+    alumno = alumnos.get(codigo)
+    if not alumno or not destino[1]:
+        print(f"Conexión {handler} ignorada: referencia a datos inexistentes.")
+        return None
+    return Conexion(handler, alumno, destino[0], destino[1], list(flows))
+
+
+def restaurar_conexiones(lista):
+    destinos = {}
+    return [c for c in (restaurar_conexion(datos, destinos) for datos in lista) if c]
+
+
+# Aplica un registro del diario. Todos son idempotentes (fijan un valor), así que
+# repetir registros ya incluidos en el snapshot no cambia el resultado
+def aplicar_registro(registro, destinos=None):
+    tipo = registro[0]
+    if tipo == 'conexion':
+        conexion = restaurar_conexion(registro[1:], destinos)
+        if conexion:
+            conexiones.agregar(conexion)
+    elif tipo == 'desconexion':
+        conexiones.quitar_clave(registro[1])
+    elif tipo == 'conexiones':
+        conexiones.reemplazar(restaurar_conexiones(registro[1]))
+    elif tipo in REGISTROS_MODELO:
+        REGISTROS_MODELO[tipo](*registro[1:])
+    elif tipo in ('alta', 'baja', 'estado'):
+        curso = cursos.get(registro[1])
+        if curso is None:
+            return
+        if tipo == 'estado':
+            fijar_estado_curso(curso, registro[2])
+            return
+        alumno = alumnos.get(registro[2])
+        if alumno is None:
+            return
+        if tipo == 'alta' and alumno not in curso.alumnos:
+            curso.add_alumno(alumno)
+        elif tipo == 'baja':
+            curso.del_alumno(alumno)
+
+
+# Reproduce los registros en orden. Las altas/bajas de conexiones solo fijan el valor
+# final de cada handler, así que se acumulan y se aplican al final en un solo lote
+def reproducir_diario(registros):
+    destinos = {}
+    cambios = {} # handler -> datos de la conexión, o None si se borró
+    for registro in registros:
+        tipo = registro[0]
+        if tipo == 'conexion':
+            cambios[registro[1]] = registro[1:]
+        elif tipo == 'desconexion':
+            cambios[registro[1]] = None
+        else:
+            if tipo == 'conexiones':
+                cambios = {}
+            aplicar_registro(registro, destinos)
+    if cambios:
+        finales = {conexion.handler: conexion for conexion in conexiones}
+        for handler, datos in cambios.items():
+            conexion = restaurar_conexion(datos, destinos) if datos is not None else None
+            if conexion is None:
+                finales.pop(handler, None)
+            else:
+                finales[handler] = conexion
+        conexiones.reemplazar(finales.values())
+
+
+def ruta_diario(ruta):
+    return f"{ruta}.diario"
+
+
+# Recupera el estado persistido: snapshot más los registros del diario posteriores, sin
+# consultar al controlador. Deja el diario abierto para anotar las mutaciones siguientes
+def recuperar_estado(ruta):
+    global diario, ruta_estado
+    cerrar_diario()
+    inicio = time.perf_counter()
+    if os.path.isfile(ruta):
+        cargar_datos(ruta)
+    registros, validos = leer_diario(ruta_diario(ruta))
+    reproducir_diario(registros)
+    diario = Diario(ruta_diario(ruta), JOURNAL_BATCH, JOURNAL_FLUSH_INTERVAL, len(registros), validos)
+    ruta_estado = ruta
+    if registros:
+        print(f"Estado recuperado de {ruta}: {len(conexiones)} conexiones ({len(registros)} registros del "
+              f"diario) en {time.perf_counter() - inicio:.2f} s")
+    return len(registros)
+
+
+# Vuelca el estado completo al snapshot y vacía el diario
+def compactar_estado():
+    if ruta_estado is None:
+        return False
+    if diario is None:
+        return guardar_datos(ruta_estado, 'snap')
+    return diario.compactar(lambda: guardar_datos(ruta_estado, 'snap'))
+
+
+def compactar_si_hace_falta():
+    if diario is not None and diario.registros >= JOURNAL_COMPACT_RECORDS:
+        compactar_estado()
+
+
+def cerrar_diario():
+    global diario
+    if diario is not None:
+        try:
+            diario.cerrar()
+        except OSError as e:
+            print(f"Error al cerrar el diario: {e}")
+        diario = None
+
+
+# Secciones del snapshot: tuplas de tipos básicos, con referencias por código/nombre
+def secciones_estado():
+    return dict(secciones_modelo(alumnos, servidores, cursos),
+                conexiones=tuple(tupla_conexion(c) for c in conexiones))
+
+
+def secciones_modelo(lista_alumnos, lista_servidores, lista_cursos):
+    return {
+        'alumnos': tuple((a.nombre, a.codigo, a.mac) for a in lista_alumnos),
+        'servidores': tuple((s.nombre, s.direccion_ip, tuple((x.nombre, x.protocolo, x.puerto) for x in s.servicios))
+                            for s in lista_servidores),
+        'cursos': tuple((c.codigo, c.nombre, c.estado, tuple(a.codigo for a in c.alumnos),
+                         tuple((s.nombre, tuple(sorted(c.servicios_permitidos.get(s.nombre, ())))) for s in c.servidores))
+                        for c in lista_cursos),
+    }
+
+
+# Mismo esquema que el archivo de importación, más el bloque de conexiones
+def datos_estado_yaml():
+    return {
+        'alumnos': [{'nombre': a.nombre, 'codigo': a.codigo, 'mac': a.mac} for a in alumnos],
+        'cursos': [{'codigo': c.codigo, 'estado': c.estado, 'nombre': c.nombre,
+                    'alumnos': [a.codigo for a in c.alumnos],
+                    'servidores': [{'nombre': s.nombre,
+                                    'servicios_permitidos': sorted(c.servicios_permitidos.get(s.nombre, ()))}
+                                   for s in c.servidores]}
+                   for c in cursos],
+        'servidores': [{'nombre': s.nombre, 'ip': s.direccion_ip,
+                        'servicios': [{'nombre': x.nombre, 'protocolo': x.protocolo, 'puerto': x.puerto}
+                                      for x in s.servicios]}
+                       for s in servidores],
+        'conexiones': [{'handler': c.handler, 'alumno': c.alumno.codigo, 'servidor': c.servidor.nombre,
+                        'servicio': c.servicio.nombre, 'flows': list(c.flows)}
+                       for c in conexiones],
+    }
+
+
+def guardar_datos(ruta, formato='yaml'):
+    inicio = time.perf_counter()
+    try:
+        if formato == 'snap':
+            snapshot.escribir_snapshot(ruta, secciones_estado())
+        else:
+            importar_yaml()
+            with open(ruta, 'w', encoding='utf-8') as archivo:
+                yaml.dump(datos_estado_yaml(), archivo, Dumper=YamlDumper, sort_keys=False, allow_unicode=True)
+    except OSError as e:
+        print(f"Error al exportar: {e}")
+        return False
+    print(f"Exportados {len(alumnos)} alumnos, {len(cursos)} cursos, {len(servidores)} servidores y "
+          f"{len(conexiones)} conexiones a {ruta} en {time.perf_counter() - inicio:.2f} s")
+    return True
+
+
+def exportar_datos():
+    nombre_archivo = input("\nIngrese el nombre del archivo (sin extensión): ")
+    formato = input("Formato (yaml/snap) [yaml]: ").strip().lower() or 'yaml'
+    if formato not in ('yaml', 'snap'):
+        print("Formato no válido.")
+        return
+    guardar_datos(f"{nombre_archivo}.{formato}", formato)
+
+
+def opcion_cursos():
+
+    while True:
+        print("\n")
+        print("\nSelecciona una opción:")
+        print("1) Listar")
+        print("2) Mostrar propiedades")
+        print("3) Actualizar")
+        print("4) Cambiar estado")
+        print("5) Regresar")
+        print("\n>>> ", end="")        
+        
+        opcion = input()
+        
+        if opcion == "5":
+            print("Volviendo al menú principal...")
+            break
+        
+        if opcion == "1":
+            print("Opción 1 seleccionada: Listar")
+            listar_con_opciones(mostrar_cursos, ('estado', 'nombre'))
+        elif opcion == "2":
+            print("Opción 2 seleccionada: Mostrar propiedades")
+            mostrar_detalles_cursos()
+        elif opcion == "3":
+            print("Opción 3 seleccionada: Actualizar")
+            actualizar_alumnos_curso()
+        elif opcion == "4":
+            print("Opción 4 seleccionada: Cambiar estado")
+            cambiar_estado()
+        elif opcion == "5":
+            print("Opción 5 seleccionada: Regresar")
+        else:
+            print("Opción no válida.")
+
+    
+def opcion_alumnos():
+
+    while True:
+        print("\n")
+        print("\nSelecciona una opción:")
+        print("1) Listar")
+        print("2) Mostrar detalles")
+        print("3) Regresar")
+        print("\n>>> ", end="")        
+        
+        opcion = input()
+        
+        if opcion == "3":
+            print("Volviendo al menú principal...")
+            break
+        
+        if opcion == "1":
+            print("Opción 1 seleccionada: Listar")
+            listar_alumnos()
+        elif opcion == "2":
+            print("Opción 2 seleccionada: Mostrar detalles")
+            mostrar_alumnos()
+        elif opcion == "3":
+            print("Opción 3 seleccionada: Regresar")
+        else:
+            print("Opción no válida.")
+
+
+def opcion_servidores():
+
+    while True:
+        print("\n")
+        print("\nSelecciona una opción:")
+        print("1) Listar")
+        print("2) Mostrar detalles")
+        print("3) Regresar")
+        print("\n>>> ", end="")        
+        
+        opcion = input()
+        
+        if opcion == "3":
+            print("Volviendo al menú principal...")
+            break
+        
+        if opcion == "1":
+            print("Opción 1 seleccionada: Listar")
+            listar_servidores()
+        elif opcion == "2":
+            print("Opción 2 seleccionada: Mostrar detalles")
+            mostrar_servidores()
+        elif opcion == "3":
+            print("Opción 3 seleccionada: Regresar")
+        else:
+            print("Opción no válida.")
+
+
+
+
+def opcion_conexiones():
+    global conexiones 
+    while True:
+        print("\nSelecciona una opción:")
+        print("1) Crear conexión")
+        print("2) Listar conexiones")
+        print("3) Borrar conexión")
+        print("4) Crear conexiones masivas")
+        print("5) Reconciliar con el controlador")
+        print("6) Borrar conexiones por alumno/servidor/servicio")
+        print("7) Rastreador de dispositivos")
+        print("8) Uso de los flows y expiración de inactivas")
+        print("9) Auditar las tablas de flows de los switches")
+        print("10) Huella de flows y modo de agregación")
+        print("11) Regresar")
+        print("\n>>> ", end="")        
+
+        opcion = input()
+        
+        if opcion == "11":
+            print("Volviendo al menú principal...")
+            break
+        
+        if opcion == "1":
+            print("Opción 1 seleccionada: Crear conexión")
+            crear_conexion()
+        
+        elif opcion == "2":
+            print("Opción 2 seleccionada: Listar conexiones")
+            listar_con_opciones(listar_conexiones, ('alumno', 'servidor', 'servicio', 'curso', 'handler'))
+        
+        elif opcion == "3":
+            print("Opción 3 seleccionada: Borrar conexión")
+            borrar_conexion()
+
+        elif opcion == "4":
+            print("Opción 4 seleccionada: Crear conexiones masivas")
+            crear_conexiones_archivo()
+
+        elif opcion == "5":
+            print("Opción 5 seleccionada: Reconciliar con el controlador")
+            reconciliar_conexiones()
+
+        elif opcion == "6":
+            print("Opción 6 seleccionada: Borrar conexiones por filtro")
+            borrar_conexiones_filtro()
+
+        elif opcion == "7":
+            print("Opción 7 seleccionada: Rastreador de dispositivos")
+            opcion_rastreador()
+
+        elif opcion == "8":
+            print("Opción 8 seleccionada: Uso de los flows")
+            opcion_uso()
+
+        elif opcion == "9":
+            print("Opción 9 seleccionada: Auditar las tablas de flows")
+            auditar_conexiones()
+
+        elif opcion == "10":
+            print("Opción 10 seleccionada: Huella de flows")
+            opcion_huella()
+
+        else:
+            print("Opción no válida.")
+
+
+def crear_conexion():
+    cod_alumno = input("Ingrese el código del alumno: ")
+    nombre_servidor = input("Ingrese el servidor: ")
+    nombre_servicio = input("Ingrese el servicio: ").lower()
+
+    conexion, error = conectar(cod_alumno, nombre_servidor, nombre_servicio)
+    if error:
+        print(error)
+    else:
+        print(f"Conexión creada con handler: {conexion.handler}")
+
+
+# Verifica si el alumno pertenece a un curso DICTANDO que permite el servicio en el servidor
+def autorizar(alumno, nombre_servidor, nombre_servicio):
+    return indice_autorizacion.autorizado(alumno.codigo, nombre_servidor, nombre_servicio)
+
+
+ERROR_NO_ENCONTRADO = "Alumno o servidor no encontrado."
+ERROR_NO_AUTORIZADO = "ERROR\nEl alumno no pertenece a un CURSO válido con estado DICTANDO"
+ERROR_SERVICIO = "Servicio no encontrado."
+ERROR_EXISTE = "Ya existe una conexión con handler: "
+ERROR_FLOWS = "Error al insertar flow."
+
+
+# Busca y autoriza los objetos de una conexión. Devuelve (alumno, servidor, servicio, error)
+def resolver_conexion(cod_alumno, nombre_servidor, nombre_servicio):
+    alumno = alumnos.get(cod_alumno)
+    servidor = servidores.get(nombre_servidor)
+
+    if not alumno or not servidor:
+        return None, None, None, ERROR_NO_ENCONTRADO
+
+    servicio_obj = servidor.servicios.get(nombre_servicio)
+    if not autorizar(alumno, servidor.nombre, servicio_obj.nombre if servicio_obj else nombre_servicio):
+        return None, None, None, ERROR_NO_AUTORIZADO
+
+    if not servicio_obj:
+        return None, None, None, ERROR_SERVICIO
+
+    return alumno, servidor, servicio_obj, None
+
+
+def handler_conexion(alumno, servidor, servicio):
+    return f"{alumno.codigo}-{servidor.nombre}-{servicio.nombre}"
+
+
+# Handlers con los flows instalándose: evita que dos altas simultáneas de la misma
+# conexión instalen dos veces
+creando = set()
+creando_lock = threading.Lock()
+
+
+def reservar_handler(handler):
+    with creando_lock:
+        if handler in creando or conexiones.tiene(handler):
+            return False
+        creando.add(handler)
+        return True
+
+
+def handler_en_creacion(handler):
+    with creando_lock:
+        return handler in creando
+
+
+def liberar_handler(handler):
+    with creando_lock:
+        creando.discard(handler)
+    reglas_compartidas.soltar(handler)
+
+
+# Crea una conexión: autoriza, inserta el flow y la registra. Devuelve (conexion, error).
+# Los flows se instalan sin el cerrojo del estado; al registrar se vuelve a autorizar
+# por si mientras tanto el curso dejó de estar DICTANDO (en ese caso se retiran)
+@metricas.medir('crear_conexion')
+def conectar(cod_alumno, nombre_servidor, nombre_servicio):
+    with estado_lock.lectura():
+        alumno, servidor, servicio_obj, error = resolver_conexion(cod_alumno, nombre_servidor, nombre_servicio)
+        if error:
+            return None, error
+        handler = handler_conexion(alumno, servidor, servicio_obj)
+        if not reservar_handler(handler):
+            return None, ERROR_EXISTE + handler
+
+    try:
+        flows = insertar_flows(alumno.mac, servidor.direccion_ip, servicio_obj.protocolo, servicio_obj.puerto,
+                               handler)
+        if not flows:
+            return None, ERROR_FLOWS
+
+        with estado_lock.escritura():
+            vigente = resolver_conexion(cod_alumno, nombre_servidor, nombre_servicio)
+            if vigente[:3] == (alumno, servidor, servicio_obj):
+                conexion = Conexion(handler, alumno, servidor, servicio_obj, flows)
+                conexiones.agregar(conexion)
+                return conexion, None
+        eliminar_flows(flows, usuarios={handler})
+        return None, vigente[3] or ERROR_NO_AUTORIZADO
+    finally:
+        liberar_handler(handler)
+
+
+# Lee solicitudes (alumno, servidor, servicio) de un archivo CSV, una por línea
+def leer_solicitudes(ruta):
+    solicitudes = []
+    with open(ruta, newline='') as archivo:
+        for fila in csv.reader(archivo):
+            if not fila or fila[0].strip().startswith('#'):
+                continue
+            if len(fila) != 3:
+                print(f"Línea ignorada (se esperaban 3 campos): {','.join(fila)}")
+                continue
+            codigo, servidor, servicio = (campo.strip() for campo in fila)
+            solicitudes.append((codigo, servidor, servicio.lower()))
+    return solicitudes
+
+
+# Genera las solicitudes de todos los alumnos de los cursos DICTANDO a los servicios de sus servidores
+def solicitudes_de_cursos():
+    return sorted(indice_autorizacion.permisos)
+
+
+# Autoriza todas las solicitudes y empuja los flows con un pool acotado de workers.
+# Devuelve la lista de resultados (solicitud, handler, ok, mensaje) y un resumen
+@metricas.medir('crear_conexiones_masivas')
+def crear_conexiones_masivas(solicitudes, workers=BULK_WORKERS):
+    inicio = time.perf_counter()
+    resultados = [None] * len(solicitudes)
+    pendientes = []
+    handlers = set()
+
+    with estado_lock.lectura():
+        for i, solicitud in enumerate(solicitudes):
+            alumno, servidor, servicio, error = resolver_conexion(*solicitud)
+            if error:
+                resultados[i] = (solicitud, None, False, error.replace("\n", " "))
+                continue
+            handler = handler_conexion(alumno, servidor, servicio)
+            if handler in handlers or not reservar_handler(handler):
+                resultados[i] = (solicitud, handler, False, "La conexión ya existe")
+                continue
+            handlers.add(handler)
+            pendientes.append((i, solicitud, handler, alumno, servidor, servicio))
+
+    # Una sola descarga de la tabla de dispositivos para todo el lote
+    if pendientes:
+        tabla_dispositivos.obtener()
+
+    retirar = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futuros = {}
+        for pendiente in pendientes:
+            _, _, handler, alumno, servidor, servicio = pendiente
+            futuro = pool.submit(insertar_flows, alumno.mac, servidor.direccion_ip,
+                                 servicio.protocolo, servicio.puerto, handler)
+            futuros[futuro] = pendiente
+        for futuro in as_completed(futuros):
+            i, solicitud, handler, alumno, servidor, servicio = futuros[futuro]
+            try:
+                flows = futuro.result()
+            except Exception as e:
+                flows = None
+                print(f"Excepción al insertar {handler}: {e}")
+            if not flows:
+                resultados[i] = (solicitud, handler, False, ERROR_FLOWS)
+            else:
+                with estado_lock.escritura():
+                    autorizada = autorizar(alumno, servidor.nombre, servicio.nombre)
+                    if autorizada:
+                        conexiones.agregar(Conexion(handler, alumno, servidor, servicio, flows))
+                if autorizada:
+                    resultados[i] = (solicitud, handler, True, "Conexión creada")
+                else:
+                    retirar.extend((nombre, handler) for nombre in flows)
+                    resultados[i] = (solicitud, handler, False, ERROR_NO_AUTORIZADO.replace("\n", " "))
+            liberar_handler(handler)
+    for futuro in [borrar_flow(nombre, usuarios={handler}) for nombre, handler in retirar]:
+        futuro.result()
+
+    duracion = time.perf_counter() - inicio
+    exitosas = sum(1 for r in resultados if r[2])
+    resumen = {
+        "total": len(resultados),
+        "exitosas": exitosas,
+        "fallidas": len(resultados) - exitosas,
+        "segundos": duracion,
+        "por_minuto": exitosas / duracion * 60 if duracion > 0 else 0.0,
+    }
+    return resultados, resumen
+
+
+def crear_conexiones_archivo():
+    ruta = input("Ingrese el archivo CSV (alumno,servidor,servicio) o deje vacío para usar los cursos DICTANDO: ").strip()
+    if ruta:
+        try:
+            solicitudes = leer_solicitudes(ruta)
+        except OSError as e:
+            print(f"Error al leer el archivo: {e}")
+            return
+    else:
+        solicitudes = solicitudes_de_cursos()
+
+    if not solicitudes:
+        print("No hay solicitudes para procesar.")
+        return
+
+    resultados, resumen = crear_conexiones_masivas(solicitudes)
+    for (codigo, servidor, servicio), handler, ok, mensaje in resultados:
+        estado = "OK" if ok else "ERROR"
+        print(f"[{estado}] {codigo} / {servidor} / {servicio}: {mensaje}" + (f" ({handler})" if handler and ok else ""))
+
+    print(f"\nTotal: {resumen['total']} | Exitosas: {resumen['exitosas']} | Fallidas: {resumen['fallidas']}")
+    print(f"Tiempo: {resumen['segundos']:.2f} s | Throughput: {resumen['por_minuto']:.0f} conexiones/min")
+
+
+def listar_conexiones(formato=None, pagina=None, **filtros):
+    global conexiones
+    if not conexiones:
+        print("No hay conexiones registradas.")
+        return
+    inicio = time.perf_counter()
+    seleccion = medir_listado('listar_conexiones', seleccionar_conexiones(**filtros), inicio)
+    columnas = ["Handler", "Alumno", "Servidor", "Servicio"]
+    if recolector_uso.ultima_recoleccion is None:
+        filas = ((c.handler, c.alumno.nombre, c.servidor.nombre, c.servicio.nombre) for c in seleccion)
+    else:
+        # Con datos de uso: paquetes y bytes de sus flows y tiempo sin tráfico
+        columnas += ["Paquetes", "Bytes", "Inactiva"]
+        ahora = time.time()
+        filas = ((c.handler, c.alumno.nombre, c.servidor.nombre, c.servicio.nombre) + _columnas_uso(c.handler, ahora)
+                 for c in seleccion)
+    if not mostrar_listado(columnas, filas, formato, pagina):
+        print("Ninguna conexión cumple el filtro.")
+
+
+def _columnas_uso(handler, ahora):
+    uso = recolector_uso.uso.get(handler)
+    if uso is None:
+        return "-", "-", "-"
+    if not uso.flows:
+        return 0, 0, "sin flows"
+    return uso.paquetes, uso.bytes, duracion_legible(recolector_uso.inactividad(handler, ahora))
+
+def borrar_conexion():
+    handler = input("Ingrese el handler de la conexión a eliminar: ")
+    ok, error = desconectar(handler)
+    if ok:
+        print(f"Conexión con handler '{handler}' eliminada correctamente.")
+    else:
+        print(error)
+
+
+# Retira los flows de una conexión y la elimina del registro. Devuelve (ok, error); si
+# algún borrado falla (tras los reintentos) la conexión queda registrada
+@metricas.medir('borrar_conexion')
+def desconectar(handler):
+    with estado_lock.lectura():
+        conexion = conexiones.get(handler)
+    if not conexion:
+        return False, f"No se encontró una conexión con handler {handler}"
+    propios, compartidas = separar_compartidas(conexion.flows or [handler])
+    fallidos = eliminar_flows(propios)
+    if fallidos:
+        return False, f"No se pudieron borrar los flows {', '.join(fallidos)} de la conexión {handler}"
+    with estado_lock.escritura():
+        conexiones.quitar(conexion)
+    eliminar_flows(compartidas, usuarios={conexion.handler})
+    return True, None
+
+
+# Revoca un grupo de conexiones encolando todos los DELETE al static flow pusher de una
+# vez (con prioridad de revocación). Solo se quitan del registro las conexiones cuyos
+# flows se borraron todos. Devuelve (handlers revocados, handlers con algún borrado fallido)
+@metricas.medir('revocar_conexiones')
+def revocar(lista, cliente=None):
+    revocadas, fallidas = [], []
+    futuros = [(conexion, [borrar_flow(nombre, cliente)
+                           for nombre in separar_compartidas(conexion.flows or [conexion.handler])[0]])
+               for conexion in lista]
+    borradas = [(conexion, all(f.result().ok for f in borrados)) for conexion, borrados in futuros]
+    compartidas = set()
+    with estado_lock.escritura():
+        for conexion, ok in borradas:
+            if ok:
+                conexiones.quitar(conexion)
+                revocadas.append(conexion.handler)
+                compartidas.update(separar_compartidas(conexion.flows)[1])
+            else:
+                fallidas.append(conexion.handler)
+    eliminar_flows(compartidas, cliente, set(revocadas))
+    return revocadas, fallidas
+
+
+# Revoca las conexiones (alumno, servidor, servicio) que ya ningún curso DICTANDO autoriza
+def revocar_no_autorizadas(candidatas, cliente=None):
+    with estado_lock.lectura():
+        lista = [c for c in candidatas if not autorizar(c.alumno, c.servidor.nombre, c.servicio.nombre)]
+    return revocar(lista, cliente)
+
+
+# Saca a un alumno de un curso y revoca en lote los accesos que dependían de ese curso
+def quitar_alumno_de_curso(curso, alumno, cliente=None):
+    with estado_lock.escritura():
+        curso.del_alumno(alumno)
+        anotar('baja', curso.codigo, alumno.codigo)
+        candidatas = conexiones.de_curso(curso, [alumno])
+    return revocar_no_autorizadas(candidatas, cliente)
+
+
+# Cambia el estado de un curso manteniendo el índice; al dejar de estar DICTANDO se
+# revocan en lote las conexiones de sus alumnos que quedan sin autorización
+def cambiar_estado_curso(curso, estado, cliente=None):
+    with estado_lock.escritura():
+        if estado == curso.estado:
+            return [], []
+        fijar_estado_curso(curso, estado)
+        anotar('estado', curso.codigo, estado)
+        if estado == "DICTANDO":
+            return [], []
+        candidatas = conexiones.de_curso(curso)
+    return revocar_no_autorizadas(candidatas, cliente)
+
+
+def fijar_estado_curso(curso, estado):
+    if estado == curso.estado:
+        return
+    if curso.estado == "DICTANDO":
+        indice_autorizacion.quitar_curso(curso)
+    curso.estado = estado
+    if estado == "DICTANDO":
+        indice_autorizacion.agregar_curso(curso)
+
+
+def imprimir_revocacion(revocadas, fallidas):
+    print(f"Conexiones revocadas: {len(revocadas)}")
+    for handler in revocadas:
+        print(f"  - {handler}")
+    if fallidas:
+        print(f"No se pudieron borrar los flows de: {', '.join(fallidas)}")
+
+
+def borrar_conexiones_filtro():
+    codigo = input("Código del alumno (vacío = cualquiera): ").strip() or None
+    servidor = input("Servidor (vacío = cualquiera): ").strip() or None
+    servicio = input("Servicio (vacío = cualquiera): ").strip() or None
+    if codigo is None and servidor is None and servicio is None:
+        print("Debe indicar al menos un filtro.")
+        return
+
+    seleccion = conexiones.buscar(codigo, servidor, servicio)
+    if not seleccion:
+        print("No hay conexiones que cumplan el filtro.")
+        return
+    if input(f"Se borrarán {len(seleccion)} conexiones. ¿Continuar? (s/n): ").strip().lower() != "s":
+        print("Operación cancelada.")
+        return
+    imprimir_revocacion(*revocar(seleccion))
+
+
+# Si el nombre de un flow corresponde a un handler de esta herramienta devuelve
+# (código, servidor, servicio); los flows ajenos nunca se tocan al reconciliar
+def interpretar_handler(nombre):
+    codigo, _, resto = handler_de_flow(nombre).partition('-')
+    servidor, _, servicio = resto.rpartition('-')
+    if not codigo.isdigit() or not servidor or not servicio:
+        return None
+    if not alumnos.tiene(codigo) or not servidores.tiene(servidor):
+        return None
+    return codigo, servidor, servicio
+
+
+# Encola altas y bajas de flows en el planificador (por defecto las bajas pasan primero)
+# y espera las respuestas. Devuelve los nombres que no se pudieron aplicar. Las reglas
+# compartidas se envían y borran sin contar usuarios: quien llama ya sabe cuáles hacen
+# falta (reconciliación y reparación de la auditoría)
+def _aplicar_cambios(agregar, borrar, cliente, prioridad_borrado=PRIORIDAD_REVOCACION):
+    return _esperar_cambios(_encolar_cambios(agregar, borrar, cliente, prioridad_borrado))
+
+
+def _encolar_cambios(agregar, borrar, cliente, prioridad_borrado=PRIORIDAD_REVOCACION):
+    futuros = {enviar_flow(flow, cliente): flow['name'] for flow in agregar}
+    futuros.update({borrar_flow(nombre, cliente, prioridad_borrado): nombre for nombre in borrar})
+    return futuros
+
+
+def _esperar_cambios(futuros):
+    return [futuros[futuro] for futuro in as_completed(futuros) if not futuro.result().ok]
+
+
+# Reconciliación incremental entre la política local y el static flow pusher:
+# descarga los flows del controlador en una llamada, los compara con los esperados
+# y envía solo las altas, modificaciones y bajas necesarias. La comparación se hace
+# sobre una copia del registro; los cambios se aplican con el cerrojo de escritura
+# contra el registro actual (ver `_aplicar_reconciliacion`)
+@metricas.medir('reconciliar')
+def reconciliar(aplicar=True, cliente=None):
+    cliente = cliente or controlador
+    actuales = flows_en_controlador(cliente)
+    if actuales is None:
+        return None
+
+    resultado = {"agregar": [], "modificar": [], "borrar": [], "adoptadas": [], "revocadas": [],
+                 "sin_punto": [], "fallidos": []}
+
+    with estado_lock.lectura():
+        # Conexiones que ya no están autorizadas se revocan
+        vigentes, no_autorizadas = [], []
+        for conexion in conexiones:
+            if autorizar(conexion.alumno, conexion.servidor.nombre, conexion.servicio.nombre):
+                vigentes.append(conexion)
+            else:
+                no_autorizadas.append(conexion)
+        previos = {conexion.handler: conexion.flows for conexion in vigentes}
+
+        # Flows propios del controlador autorizados pero desconocidos localmente (p. ej. tras un reinicio)
+        conocidos = set(previos)
+        adoptadas = []
+        for nombre in actuales:
+            partes = interpretar_handler(nombre)
+            handler = handler_de_flow(nombre)
+            if not partes or handler in conocidos:
+                continue
+            alumno, servidor, servicio, error = resolver_conexion(*partes)
+            if error:
+                continue
+            conocidos.add(handler)
+            adoptadas.append(Conexion(handler, alumno, servidor, servicio))
+    resultado["revocadas"] = [c.handler for c in no_autorizadas]
+    resultado["adoptadas"] = [c.handler for c in adoptadas]
+
+    esperados, nuevos_flows, usuarios = {}, {}, {}
+    sin_punto = set()
+    for conexion in vigentes + adoptadas:
+        flows = flows_de_conexion(conexion.alumno, conexion.servidor, conexion.servicio, conexion.handler, cliente)
+        if flows is None:
+            resultado["sin_punto"].append(conexion.handler)
+            # Tampoco se tocan las reglas compartidas que usa
+            sin_punto.add(conexion.handler)
+            sin_punto.update(nombre for nombre in conexion.flows if es_compartido(nombre))
+            continue
+        nuevos_flows[conexion.handler] = list(flows)
+        for nombre in flows:
+            usuarios.setdefault(nombre, []).append(conexion.handler)
+        esperados.update(flows)
+
+    for nombre, flow in esperados.items():
+        firma = firma_flow(flow['switch'], flow, flow['actions'])
+        if nombre not in actuales:
+            resultado["agregar"].append(flow)
+        elif actuales[nombre] != firma:
+            resultado["modificar"].append(flow)
+
+    for nombre in actuales:
+        if nombre not in esperados and handler_de_flow(nombre) not in sin_punto and \
+                (interpretar_handler(nombre) or es_compartido(nombre)):
+            resultado["borrar"].append(nombre)
+
+    if aplicar:
+        # Las bajas se encolan con el cerrojo tomado: una conexión que se cree después
+        # encola sus altas detrás y quedan últimas
+        with estado_lock.escritura():
+            agregar, borrar = _aplicar_reconciliacion(resultado, vigentes, previos, adoptadas, no_autorizadas,
+                                                      nuevos_flows, usuarios)
+            # El static flow pusher reemplaza un flow existente al recibir otro con el mismo nombre
+            futuros = _encolar_cambios(agregar, borrar, cliente)
+        resultado["fallidos"] = _esperar_cambios(futuros)
+    return resultado
+
+
+# Aplica una reconciliación al registro actual (con el cerrojo de escritura tomado). La
+# comparación se hizo sin el cerrojo y mientras tanto el seguimiento de dispositivos,
+# el recolector de uso o la API pueden haber creado, rehubicado o quitado conexiones:
+# se revocan las que siguen registradas y sin autorización, se adoptan las que nadie
+# registró ni está creando y solo se actualizan las conexiones que siguen registradas
+# con los mismos flows. Devuelve las altas de esas conexiones y las bajas de flows que
+# ninguna conexión registrada o en creación usa; lo demás queda para la próxima vez
+def _aplicar_reconciliacion(resultado, vigentes, previos, adoptadas, no_autorizadas, nuevos_flows, usuarios):
+    revocadas = []
+    for conexion in no_autorizadas:
+        if conexiones.get(conexion.handler) is conexion and \
+                not autorizar(conexion.alumno, conexion.servidor.nombre, conexion.servicio.nombre):
+            conexiones.quitar(conexion)
+            revocadas.append(conexion.handler)
+    resultado["revocadas"] = revocadas
+
+    aplicadas = set()
+    for conexion in vigentes:
+        if conexiones.get(conexion.handler) is not conexion or conexion.flows != previos[conexion.handler]:
+            continue
+        aplicadas.add(conexion.handler)
+        flows = nuevos_flows.get(conexion.handler)
+        if flows is not None and flows != conexion.flows:
+            conexion.flows = flows
+            conexiones.actualizar(conexion)
+    adoptadas_aplicadas = []
+    for conexion in adoptadas:
+        if conexiones.tiene(conexion.handler) or handler_en_creacion(conexion.handler):
+            continue
+        aplicadas.add(conexion.handler)
+        if conexion.handler in nuevos_flows:
+            conexion.flows = nuevos_flows[conexion.handler]
+        conexiones.agregar(conexion)
+        adoptadas_aplicadas.append(conexion.handler)
+    resultado["adoptadas"] = adoptadas_aplicadas
+
+    agregar = [flow for flow in resultado["agregar"] + resultado["modificar"]
+               if aplicadas.intersection(usuarios[flow['name']])]
+    borrar = []
+    for nombre in resultado["borrar"]:
+        if es_compartido(nombre):
+            if not conexiones.usa_regla(nombre) and not reglas_compartidas.reservada(nombre):
+                borrar.append(nombre)
+            continue
+        handler = handler_de_flow(nombre)
+        conexion = conexiones.get(handler)
+        if handler_en_creacion(handler):
+            continue
+        if conexion is None or (handler in aplicadas and nombre not in conexion.flows):
+            borrar.append(nombre)
+    return agregar, borrar
+
+
+def reconciliar_conexiones():
+    resultado = reconciliar()
+    if resultado is None:
+        return
+    print(f"Flows agregados: {len(resultado['agregar'])}")
+    print(f"Flows modificados: {len(resultado['modificar'])}")
+    print(f"Flows eliminados: {len(resultado['borrar'])}")
+    print(f"Conexiones recuperadas del controlador: {len(resultado['adoptadas'])}")
+    print(f"Conexiones revocadas (sin autorización): {len(resultado['revocadas'])}")
+    if resultado["sin_punto"]:
+        print(f"Sin punto de conexión conocido (no se tocaron): {', '.join(resultado['sin_punto'])}")
+    if resultado["fallidos"]:
+        print(f"Operaciones fallidas: {', '.join(resultado['fallidos'])}")
+
+
+# Auditoría de las tablas de flows: descarga en paralelo el listado del static flow
+# pusher de cada switch, leyéndolo a medida que llega (sin armar el JSON completo), y
+# compara cada entrada con los flows que corresponden a las conexiones según la
+# topología y los puntos de conexión actuales: match y acciones. Por switch informa los
+# flows que faltan, los que sobran (propios, de handlers sin conexión, p. ej. de una
+# sesión que se cortó), los distintos y los que están en otro switch. Los flows que no
+# siguen el esquema de nombres de las conexiones (ni son reglas compartidas) son ajenos
+# y no se tocan
+class _EsperadoFlow:
+    __slots__ = ('flow', 'firma', 'handler')
+
+    def __init__(self, flow, firma, handler):
+        self.flow = flow
+        self.firma = firma
+        self.handler = handler
+
+
+def _flow_propio(nombre):
+    return handler_de_flow(nombre) != nombre or es_compartido(nombre)
+
+
+# Flows esperados: ({nombre: _EsperadoFlow}, {switch: {nombres}}, {handler: [nombres]},
+# handlers sin punto de conexión más las reglas compartidas que usan, que no se verifican)
+def flows_esperados(lista, cliente=None):
+    esperados, por_switch, por_handler, sin_punto = {}, {}, {}, set()
+    for conexion in lista:
+        flows = flows_de_conexion(conexion.alumno, conexion.servidor, conexion.servicio, conexion.handler, cliente)
+        if flows is None:
+            sin_punto.add(conexion.handler)
+            sin_punto.update(nombre for nombre in conexion.flows if es_compartido(nombre))
+            continue
+        por_handler[conexion.handler] = list(flows)
+        for nombre, flow in flows.items():
+            firma = firma_flow(flow['switch'], flow, flow['actions'])
+            esperados[nombre] = _EsperadoFlow(flow, firma, conexion.handler)
+            por_switch.setdefault(firma[0], set()).add(nombre)
+    return esperados, por_switch, por_handler, sin_punto
+
+
+# Compara el listado de un switch con lo esperado a medida que se lee
+def auditar_switch(switch, esperados, por_switch, sin_punto, cliente=None):
+    dpid = str(switch).lower()
+    resultado = {"flows": 0, "correctos": 0, "faltantes": [], "sobrantes": [], "distintos": [], "movidos": [],
+                 "ajenos": 0, "completo": False}
+    vistos = set()
+    entradas = (cliente or controlador).elementos(f'/wm/staticflowpusher/list/{switch}/json', switch)
+    while True:
+        try:
+            entrada = next(entradas)
+        except StopIteration as fin:
+            resultado["completo"] = bool(fin.value)
+            break
+        for nombre, datos in entrada.items():
+            resultado["flows"] += 1
+            if not _flow_propio(nombre) and nombre not in esperados:
+                resultado["ajenos"] += 1
+                continue
+            esperado = esperados.get(nombre)
+            if esperado is None:
+                if handler_de_flow(nombre) not in sin_punto:
+                    resultado["sobrantes"].append(nombre)
+                continue
+            if esperado.firma[0] != dpid:
+                resultado["movidos"].append(nombre)
+                continue
+            vistos.add(nombre)
+            if firma_entrada(dpid, datos) == esperado.firma:
+                resultado["correctos"] += 1
+            else:
+                resultado["distintos"].append(nombre)
+    # Con el listado incompleto no se puede afirmar que falte nada
+    if resultado["completo"]:
+        resultado["faltantes"] = sorted(por_switch.get(dpid, set()) - vistos)
+    return resultado
+
+
+# Audita todos los switches (los de la topología más los que tienen flows esperados) con
+# `workers` descargas simultáneas. Con reparar=True reinstala los flows faltantes y
+# distintos y borra los sobrantes, de a `lote` operaciones
+@metricas.medir('auditar_flows')
+def auditar_flows(reparar=False, lote=AUDIT_REPAIR_BATCH, workers=AUDIT_WORKERS, switches=None, cliente=None):
+    cliente = cliente or controlador
+    inicio = time.perf_counter()
+    with estado_lock.lectura():
+        lista = list(conexiones)
+    esperados, por_switch, por_handler, sin_punto = flows_esperados(lista, cliente)
+    if switches is None:
+        topologia_local.asegurar(cliente)
+        switches = set(topologia_local.switches) | set(por_switch)
+    switches = sorted({str(switch).lower() for switch in switches})
+
+    por_switch_resultado = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(switches) or 1))) as pool:
+        futuros = {pool.submit(auditar_switch, switch, esperados, por_switch, sin_punto, cliente): switch
+                   for switch in switches}
+        for futuro in as_completed(futuros):
+            por_switch_resultado[futuros[futuro]] = futuro.result()
+
+    resultado = {"switches": dict(sorted(por_switch_resultado.items())), "conexiones": len(lista),
+                 "sin_punto": sorted(h for h in sin_punto if not es_compartido(h)), "esperados": len(esperados)}
+    for clave in ("flows", "correctos", "ajenos"):
+        resultado[clave] = sum(r[clave] for r in por_switch_resultado.values())
+    for clave in ("faltantes", "sobrantes", "distintos", "movidos"):
+        resultado[clave] = sum(len(r[clave]) for r in por_switch_resultado.values())
+    resultado["incompletos"] = [switch for switch, r in resultado["switches"].items() if not r["completo"]]
+    resultado["segundos_auditoria"] = time.perf_counter() - inicio
+
+    if reparar:
+        resultado.update(reparar_flows(por_switch_resultado, esperados, por_handler, lista, lote, cliente))
+    return resultado
+
+
+# Un flow movido se corrige al reinstalarlo en su switch (el static flow pusher lo
+# reemplaza por nombre), así que no se borra. Las conexiones cuyos flows quedaron
+# completos actualizan su lista de nombres. Lo esperado se calculó con el registro del
+# comienzo de la auditoría, así que cada lote se vuelve a validar contra el registro
+# actual antes de encolarlo (ver `_vigentes_reparacion`)
+def reparar_flows(por_switch_resultado, esperados, por_handler, lista, lote, cliente=None):
+    agregar, borrar = [], []
+    for r in por_switch_resultado.values():
+        agregar.extend(r["faltantes"] + r["distintos"])
+        borrar.extend(r["sobrantes"])
+    auditadas = {conexion.handler: conexion for conexion in lista}
+    compartidas = {}
+    for handler, nombres in por_handler.items():
+        for nombre in nombres:
+            if es_compartido(nombre):
+                compartidas.setdefault(nombre, []).append(handler)
+    fallidos, reinstalados, borrados, omitidos = [], 0, 0, 0
+    lote = max(1, lote)
+    for i in range(0, max(len(agregar), len(borrar)), lote):
+        # Las bajas se encolan con el cerrojo tomado: una conexión que se cree después
+        # encola sus altas detrás y quedan últimas
+        with estado_lock.escritura():
+            agregar_lote, borrar_lote = _vigentes_reparacion(agregar[i:i + lote], borrar[i:i + lote],
+                                                             esperados, auditadas, compartidas)
+            futuros = _encolar_cambios([esperados[nombre].flow for nombre in agregar_lote], borrar_lote, cliente)
+        fallidos_lote = _esperar_cambios(futuros)
+        fallidos.extend(fallidos_lote)
+        omitidos += len(agregar[i:i + lote]) + len(borrar[i:i + lote]) - len(agregar_lote) - len(borrar_lote)
+        reinstalados += len(agregar_lote) - len(set(fallidos_lote).intersection(agregar_lote))
+        borrados += len(borrar_lote) - len(set(fallidos_lote).intersection(borrar_lote))
+    no_aplicados = set(fallidos)
+    with estado_lock.escritura():
+        for conexion in lista:
+            nombres = por_handler.get(conexion.handler)
+            if nombres is not None and nombres != conexion.flows and not no_aplicados.intersection(nombres) \
+                    and conexiones.get(conexion.handler) is conexion:
+                conexion.flows = nombres
+                conexiones.actualizar(conexion)
+    return {"reinstalados": reinstalados, "borrados": borrados, "omitidos": omitidos, "fallidos": fallidos}
+
+
+# Filtra un lote de la reparación contra el registro actual (con el cerrojo de escritura
+# tomado). Un sobrante deja de serlo si su handler quedó registrado o se está creando
+# (la regla compartida, si alguna conexión la usa o la tiene reservada); un faltante se
+# omite si su conexión se revocó o se reemplazó durante la auditoría (la regla
+# compartida, si ya no sigue registrada ninguna de las conexiones auditadas que la usan)
+def _vigentes_reparacion(agregar, borrar, esperados, auditadas, compartidas):
+    vigentes = []
+    for nombre in agregar:
+        handlers = compartidas.get(nombre, ()) if es_compartido(nombre) else (esperados[nombre].handler,)
+        if any(conexiones.get(handler) is auditadas[handler] for handler in handlers):
+            vigentes.append(nombre)
+    sobrantes = []
+    for nombre in borrar:
+        if es_compartido(nombre):
+            if not conexiones.usa_regla(nombre) and not reglas_compartidas.reservada(nombre):
+                sobrantes.append(nombre)
+            continue
+        handler = handler_de_flow(nombre)
+        if not conexiones.tiene(handler) and not handler_en_creacion(handler):
+            sobrantes.append(nombre)
+    return vigentes, sobrantes
+
+
+def auditar_conexiones():
+    respuesta = input("¿Reparar lo que se encuentre? (s/n) [n]: ").strip().lower()
+    resultado = auditar_flows(reparar=respuesta == 's')
+    imprimir_auditoria(resultado)
+
+
+def imprimir_auditoria(resultado, limite=10):
+    for switch, r in resultado["switches"].items():
+        problemas = len(r["faltantes"]) + len(r["sobrantes"]) + len(r["distintos"]) + len(r["movidos"])
+        estado = "" if r["completo"] else " (listado incompleto)"
+        print(f"{switch}: {r['flows']} flows, {r['correctos']} correctos, {len(r['faltantes'])} faltantes, "
+              f"{len(r['sobrantes'])} sobrantes, {len(r['distintos'])} distintos, {len(r['movidos'])} en otro "
+              f"switch, {r['ajenos']} ajenos{estado}")
+        if not problemas:
+            continue
+        for clave in ("faltantes", "sobrantes", "distintos", "movidos"):
+            nombres = r[clave]
+            if nombres:
+                resto = f" (y {len(nombres) - limite} más)" if len(nombres) > limite else ""
+                print(f"  {clave}: {', '.join(nombres[:limite])}{resto}")
+    print(f"Total: {resultado['flows']} flows en {len(resultado['switches'])} switches | {resultado['esperados']} "
+          f"esperados de {resultado['conexiones']} conexiones | faltantes {resultado['faltantes']}, sobrantes "
+          f"{resultado['sobrantes']}, distintos {resultado['distintos']}, en otro switch {resultado['movidos']} | "
+          f"{resultado['segundos_auditoria']:.2f} s")
+    if resultado["sin_punto"]:
+        print(f"Sin punto de conexión conocido (no se verificaron): {', '.join(resultado['sin_punto'])}")
+    if resultado["incompletos"]:
+        print(f"No se pudo leer completo el listado de: {', '.join(resultado['incompletos'])}")
+    if "reinstalados" in resultado:
+        omitidos = f", {resultado['omitidos']} omitidos por cambios durante la auditoría" if resultado["omitidos"] else ""
+        print(f"Reparación: {resultado['reinstalados']} flows reinstalados, {resultado['borrados']} borrados{omitidos}")
+        if resultado["fallidos"]:
+            print(f"Operaciones fallidas: {', '.join(resultado['fallidos'])}")
+
+
+# Huella de las conexiones registradas en las tablas de flows: reglas que necesitan
+# compiladas una por conexión y salto (exacto) y con reglas compartidas (agregado), en
+# total y por switch, y las que tienen instaladas según el registro. Las rutas y puntos
+# de conexión salen de las cachés, así que no hace falta instalar nada para comparar
+@metricas.medir('huella_flows')
+def huella_flows(cliente=None):
+    cliente = cliente or controlador
+    inicio = time.perf_counter()
+    with estado_lock.lectura():
+        lista = list(conexiones)
+        instaladas = len({nombre for conexion in lista for nombre in conexion.flows})
+        usuarios = [len(handlers) for handlers in conexiones.por_regla.values()]
+    por_switch, exacto, agregado, sin_punto = {}, 0, set(), []
+    for conexion in lista:
+        flows = flows_de_conexion(conexion.alumno, conexion.servidor, conexion.servicio, conexion.handler, cliente,
+                                  agregar=False)
+        if flows is None:
+            sin_punto.append(conexion.handler)
+            continue
+        for flow in flows.values():
+            por_switch.setdefault(str(flow['switch']).lower(), [0, set()])[0] += 1
+        exacto += len(flows)
+        flows = flows_de_conexion(conexion.alumno, conexion.servidor, conexion.servicio, conexion.handler, cliente,
+                                  agregar=True) or {}
+        for nombre, flow in flows.items():
+            por_switch.setdefault(str(flow['switch']).lower(), [0, set()])[1].add(nombre)
+            agregado.add(nombre)
+    switches = {switch: {"exacto": e, "agregado": len(a)} for switch, (e, a) in sorted(por_switch.items())}
+    return {
+        "modo": "agregado" if reglas_compartidas.activo else "exacto", "conexiones": len(lista),
+        "sin_punto": sin_punto, "exacto": exacto, "agregado": len(agregado),
+        "compartidas": sum(1 for nombre in agregado if es_compartido(nombre)),
+        "reduccion": 1 - len(agregado) / exacto if exacto else 0.0,
+        "maximo_exacto": max((r["exacto"] for r in switches.values()), default=0),
+        "maximo_agregado": max((r["agregado"] for r in switches.values()), default=0),
+        "instaladas": instaladas, "compartidas_instaladas": len(usuarios),
+        "usuarios_por_regla": sum(usuarios) / len(usuarios) if usuarios else 0.0,
+        "switches": switches, "segundos": time.perf_counter() - inicio,
+    }
+
+
+def imprimir_huella(resultado, limite=10):
+    switches = sorted(resultado["switches"].items(), key=lambda par: -par[1]["exacto"])
+    for switch, r in switches[:limite]:
+        print(f"{switch}: {r['exacto']} reglas exactas -> {r['agregado']} agregadas")
+    if len(switches) > limite:
+        print(f"(y {len(switches) - limite} switches más)")
+    print(f"Total: {resultado['exacto']} reglas exactas -> {resultado['agregado']} agregadas "
+          f"({resultado['compartidas']} compartidas, {resultado['reduccion']:.0%} menos) para "
+          f"{resultado['conexiones']} conexiones | máximo por switch {resultado['maximo_exacto']} -> "
+          f"{resultado['maximo_agregado']}")
+    print(f"Instaladas ahora (modo {resultado['modo']}): {resultado['instaladas']} reglas, "
+          f"{resultado['compartidas_instaladas']} compartidas con {resultado['usuarios_por_regla']:.1f} "
+          f"conexiones en promedio")
+    if resultado["sin_punto"]:
+        print(f"Sin punto de conexión conocido (no se contaron): {', '.join(resultado['sin_punto'])}")
+
+
+# Cambia el modo de agregación y, si se pide, recompila las conexiones registradas con
+# el modo nuevo (rehubicar instala las reglas nuevas y retira las que sobran)
+def opcion_huella():
+    imprimir_huella(huella_flows())
+    nuevo = not reglas_compartidas.activo
+    respuesta = input(f"¿{'Activar' if nuevo else 'Desactivar'} la agregación de reglas? (s/n) [n]: ")
+    if respuesta.strip().lower() != 's':
+        return
+    reglas_compartidas.activo = nuevo
+    print(f"Agregación {'activada' if nuevo else 'desactivada'}.")
+    respuesta = input(f"¿Recompilar las {len(conexiones)} conexiones registradas? (s/n) [s]: ")
+    if respuesta.strip().lower() in ('', 's'):
+        rehubicadas, fallidas = rehubicar(list(conexiones))
+        print(f"Conexiones recompiladas: {len(rehubicadas)}, fallidas: {len(fallidas)}")
+
+
+# Reinstala los flows de las conexiones dadas según los puntos de conexión actuales
+# (y el modo de agregación activo). Los flows con el mismo nombre se reemplazan; los que
+# sobran (ruta más corta) se borran; las reglas compartidas que dejan de usar, una vez
+# registrados los flows nuevos y solo si ya nadie las usa. Las conexiones revocadas
+# mientras tanto no se vuelven a registrar: se retiran los flows recién instalados y no
+# cuentan como rehubicadas ni fallidas. Devuelve (handlers rehubicados, handlers
+# fallidos o sin punto de conexión)
+def rehubicar(lista, cliente=None):
+    cliente = cliente or controlador
+    nuevas, fallidas = [], []
+    for conexion in lista:
+        flows = flows_de_conexion(conexion.alumno, conexion.servidor, conexion.servicio, conexion.handler, cliente)
+        if flows is None:
+            fallidas.append(conexion.handler)
+            continue
+        nuevas.append((conexion, flows))
+
+    # Los flows sobrantes de la ruta vieja se borran después de instalar la nueva
+    futuros = {}
+    for conexion, flows in nuevas:
+        for nombre, flow in flows.items():
+            futuros[enviar_flow(flow, cliente, handler=conexion.handler)] = nombre
+    for conexion, flows in nuevas:
+        for nombre in separar_compartidas(conexion.flows)[0]:
+            if nombre not in flows:
+                futuros[borrar_flow(nombre, cliente, PRIORIDAD_CONCESION)] = nombre
+    no_aplicados = {futuros[futuro] for futuro in as_completed(futuros) if not futuro.result().ok}
+    rehubicadas, sobrantes, retiros = [], set(), []
+    with estado_lock.escritura():
+        for conexion, flows in nuevas:
+            vigente = conexiones.get(conexion.handler)
+            if vigente is not conexion:
+                # Revocada mientras se instalaban los flows. Si ya se está creando otra
+                # vez (o se creó) con el mismo handler, los nombres son de la nueva. Las
+                # bajas se encolan con el cerrojo tomado para que una creación posterior
+                # las encuentre antes en la cola y su alta quede última
+                if vigente is None and not handler_en_creacion(conexion.handler):
+                    reglas_compartidas.soltar(conexion.handler)
+                    retiros.extend(borrar_flow(nombre, cliente, usuarios={conexion.handler}) for nombre in flows)
+                continue
+            if no_aplicados.intersection(flows):
+                fallidas.append(conexion.handler)
+            else:
+                sobrantes.update(nombre for nombre in separar_compartidas(conexion.flows)[1] if nombre not in flows)
+                conexion.flows = list(flows)
+                conexiones.actualizar(conexion)
+                rehubicadas.append(conexion.handler)
+    for conexion, _ in nuevas:
+        reglas_compartidas.soltar(conexion.handler)
+    eliminar_flows(sobrantes, cliente, set(rehubicadas))
+    for futuro in retiros:
+        futuro.result()
+    return rehubicadas, fallidas
+
+
+# Registros del diario que fijan el modelo (los genera la reimportación incremental).
+# Cada uno lleva la tupla completa de su sección del snapshot y se aplica sobre los
+# mismos objetos: las conexiones y los cursos que los referencian siguen siendo válidos
+def fijar_alumno(nombre, codigo, mac):
+    alumno = alumnos.get(codigo)
+    if alumno is None:
+        alumnos.agregar(Alumno(nombre, codigo, mac))
+    else:
+        alumno.nombre = nombre
+        alumno.mac = normalizar_mac(mac)
+
+
+# Los cursos cuyos servicios cambian se sacan del índice con los servicios viejos y se
+# vuelven a agregar (si están DICTANDO) con los nuevos
+def _sacar_del_indice(lista):
+    for curso in lista:
+        if curso.estado == "DICTANDO":
+            indice_autorizacion.quitar_curso(curso)
+
+
+def _volver_al_indice(lista):
+    for curso in lista:
+        indice_autorizacion.agregar_curso(curso)
+
+
+def fijar_servidor(nombre, direccion_ip, servicios):
+    servidor = servidores.get(nombre)
+    if servidor is None:
+        servidores.agregar(Servidor(nombre, direccion_ip, [Servicio(*servicio) for servicio in servicios]))
+        return
+    nombres = {servicio[0] for servicio in servicios}
+    afectados = []
+    if servidor.nombre != nombre or nombres != {servicio.nombre for servicio in servidor.servicios}:
+        afectados = [curso for curso in cursos if servidor in curso.servidores]
+    _sacar_del_indice(afectados)
+    if servidor.nombre != nombre:
+        for curso in afectados:
+            curso.servicios_permitidos[nombre] = curso.servicios_permitidos.pop(servidor.nombre, set())
+        servidor.nombre = nombre
+    servidor.direccion_ip = direccion_ip
+    for nombre_servicio, protocolo, puerto in servicios:
+        servicio = servidor.servicios.get(nombre_servicio)
+        if servicio is None:
+            servidor.add_servicio(Servicio(nombre_servicio, protocolo, puerto))
+        else:
+            servicio.nombre, servicio.protocolo, servicio.puerto = nombre_servicio, protocolo, puerto
+    minusculas = {_minusculas(nombre_servicio) for nombre_servicio in nombres}
+    for servicio in servidor.servicios:
+        if _minusculas(servicio.nombre) not in minusculas:
+            servidor.del_servicio(servicio)
+    _volver_al_indice(afectados)
+
+
+# Las altas y bajas de alumnos se aplican una por una (el índice se actualiza solo para
+# ellos); un cambio de estado o de servidores rehace el curso en el índice
+def fijar_curso(codigo, nombre, estado, codigos_alumnos, servidores_curso):
+    curso = cursos.get(codigo)
+    if curso is None:
+        curso = Curso(nombre, estado, codigo)
+        cursos.agregar(curso)
+    curso.nombre = nombre
+    miembros = [alumno for alumno in (alumnos.get(c) for c in codigos_alumnos) if alumno is not None]
+    nuevos_servidores, permitidos = [], {}
+    for nombre_servidor, servicios_servidor in servidores_curso:
+        servidor = servidores.get(nombre_servidor)
+        if servidor is not None:
+            nuevos_servidores.append(servidor)
+            permitidos[servidor.nombre] = set(servicios_servidor)
+    actuales = {servidor.nombre: curso.servicios_permitidos.get(servidor.nombre, set())
+                for servidor in curso.servidores}
+    if curso.indice is None or estado != curso.estado or actuales != permitidos:
+        _sacar_del_indice([curso])
+        curso.estado = estado
+        curso.alumnos.reemplazar(miembros)
+        curso.servidores.reemplazar(nuevos_servidores)
+        curso.servicios_permitidos = permitidos
+        _volver_al_indice([curso])
+        return
+    codigos = {str(alumno.codigo) for alumno in miembros}
+    for alumno in curso.alumnos:
+        if str(alumno.codigo) not in codigos:
+            curso.del_alumno(alumno)
+    for alumno in miembros:
+        if alumno not in curso.alumnos:
+            curso.add_alumno(alumno)
+
+
+def retirar_curso(codigo):
+    curso = cursos.get(codigo)
+    if curso is not None:
+        _sacar_del_indice([curso])
+        cursos.quitar(curso)
+
+
+def retirar_alumno(codigo):
+    alumno = alumnos.get(codigo)
+    if alumno is not None:
+        for curso in cursos:
+            curso.del_alumno(alumno)
+        alumnos.quitar(alumno)
+
+
+def retirar_servidor(nombre):
+    servidor = servidores.get(nombre)
+    if servidor is None:
+        return
+    afectados = [curso for curso in cursos if servidor in curso.servidores]
+    _sacar_del_indice(afectados)
+    for curso in afectados:
+        curso.servidores.quitar(servidor)
+        curso.servicios_permitidos.pop(servidor.nombre, None)
+    _volver_al_indice(afectados)
+    servidores.quitar(servidor)
+
+
+REGISTROS_MODELO = {'alumno': fijar_alumno, 'servidor': fijar_servidor, 'curso': fijar_curso,
+                    'sin_alumno': retirar_alumno, 'sin_servidor': retirar_servidor, 'sin_curso': retirar_curso}
+
+
+# Reimportación incremental: compara el archivo con el estado vigente y aplica solo lo
+# que cambió (anotándolo en el diario). Después revoca en lote las conexiones que
+# quedaron sin autorización y reinstala las afectadas por un cambio de MAC, IP,
+# protocolo o puerto. Con simular=True solo calcula la diferencia y con solo_yaml=True
+# el archivo se lee siempre como YAML. Devuelve el resumen, o None si el archivo no se
+# pudo leer
+@metricas.medir('reimportar_datos')
+def reimportar_datos(ruta, simular=False, cliente=None, solo_yaml=False):
+    inicio = time.perf_counter()
+    datos = leer_archivo_datos(ruta, solo_yaml)
+    if datos is None:
+        return None
+    nuevos_alumnos, nuevos_cursos, nuevos_servidores, _ = datos
+    nuevo = secciones_modelo(nuevos_alumnos, nuevos_servidores, nuevos_cursos)
+    lectura = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    revisar, reinstalar = {}, {}
+    with estado_lock.escritura():
+        cambios = diferencia(secciones_modelo(alumnos, servidores, cursos), nuevo)
+        if not simular:
+            for registro in cambios.registros:
+                aplicar_registro(registro)
+                anotar(*registro)
+        for codigo in cambios.revisar_alumnos:
+            revisar.update((c.handler, c) for c in conexiones.buscar(codigo=codigo))
+        for servidor, servicio in cambios.revisar_servicios:
+            revisar.update((c.handler, c) for c in conexiones.buscar(servidor=servidor, servicio=servicio))
+        for codigo in cambios.macs:
+            reinstalar.update((c.handler, c) for c in conexiones.buscar(codigo=codigo))
+        for servidor in cambios.ips:
+            reinstalar.update((c.handler, c) for c in conexiones.buscar(servidor=servidor))
+        for servidor, servicio in cambios.servicios_cambiados:
+            reinstalar.update((c.handler, c) for c in conexiones.buscar(servidor=servidor, servicio=servicio))
+    local = time.perf_counter() - inicio
+
+    resultado = dict(cambios.resumen(), simulado=simular, lectura=lectura, aplicacion=local)
+    if simular:
+        resultado.update(conexiones_a_revisar=sorted(revisar), conexiones_a_reinstalar=sorted(reinstalar))
+        return resultado
+    revocadas, fallidas = revocar_no_autorizadas(list(revisar.values()), cliente) if revisar else ([], [])
+    descartadas = set(revocadas) | set(fallidas)
+    lista = [c for handler, c in sorted(reinstalar.items()) if handler not in descartadas]
+    reinstaladas, no_reinstaladas = rehubicar(lista, cliente) if lista else ([], [])
+    resultado.update(conexiones_revocadas=revocadas, revocaciones_fallidas=fallidas,
+                     conexiones_reinstaladas=reinstaladas, reinstalaciones_fallidas=no_reinstaladas)
+    return resultado
+
+
+def imprimir_reimportacion(resultado):
+    print("\n--- Cambios" + (" (simulación, no se aplicó nada)" if resultado["simulado"] else "") + " ---")
+    print(f"Alumnos: {resultado['alumnos_nuevos']} nuevos, {resultado['alumnos_quitados']} quitados, "
+          f"{resultado['macs']} con otra MAC, {resultado['alumnos_renombrados']} renombrados")
+    print(f"Cursos: {resultado['cursos_nuevos']} nuevos, {resultado['cursos_quitados']} quitados, "
+          f"{resultado['estados']} cambios de estado, {resultado['altas']} altas, {resultado['bajas']} bajas, "
+          f"{resultado['cursos_cambiados']} con otros servidores/servicios")
+    print(f"Servidores: {resultado['servidores_nuevos']} nuevos, {resultado['servidores_quitados']} quitados, "
+          f"{resultado['ips']} con otra IP")
+    print(f"Servicios: {resultado['servicios_nuevos']} nuevos, {resultado['servicios_quitados']} quitados, "
+          f"{resultado['servicios_cambiados']} con otro protocolo/puerto")
+    if resultado["simulado"]:
+        print(f"Conexiones a revisar: {len(resultado['conexiones_a_revisar'])} | "
+              f"a reinstalar: {len(resultado['conexiones_a_reinstalar'])}")
+    else:
+        print(f"Conexiones revocadas: {len(resultado['conexiones_revocadas'])} | "
+              f"reinstaladas: {len(resultado['conexiones_reinstaladas'])}")
+        if resultado["revocaciones_fallidas"]:
+            print(f"No se pudieron borrar los flows de: {', '.join(resultado['revocaciones_fallidas'])}")
+        if resultado["reinstalaciones_fallidas"]:
+            print(f"No se pudieron reinstalar: {', '.join(resultado['reinstalaciones_fallidas'])}")
+    print(f"Lectura del archivo: {resultado['lectura'] * 1000:.1f} ms | "
+          f"diferencia y aplicación: {resultado['aplicacion'] * 1000:.1f} ms")
+
+
+# Rastreador de dispositivos: hilo opcional que pide /wm/device/ cada `intervalo` segundos,
+# compara los puntos de conexión con los de la consulta anterior y reinstala solo los flows
+# de las conexiones cuyo alumno (MAC) o servidor (IP) cambió de switch o de puerto
+class RastreadorDispositivos:
+    def __init__(self, intervalo=DEVICE_TRACKER_INTERVAL, cliente=None):
+        self.intervalo = intervalo
+        self.cliente = cliente
+        self.por_mac = None # MAC -> (dpid, puerto) de la consulta anterior
+        self.por_ip = None  # IPv4 -> (dpid, puerto)
+        self.hilo = None
+        self.parar = threading.Event()
+        self.lock = threading.Lock()
+        self.reiniciar_estadisticas()
+
+    def reiniciar_estadisticas(self):
+        self.estadisticas = {
+            "sondeos": 0,
+            "sondeos_fallidos": 0,
+            "segundos_sondeo": 0.0,      # acumulado: costo de las consultas y del diff
+            "ultimo_sondeo": 0.0,
+            "movimientos": 0,            # MACs/IPs con conexiones que cambiaron de punto
+            "rehubicadas": 0,
+            "fallidas": 0,
+            "latencia_ultima": None,     # desde que el controlador vio el nuevo punto hasta reinstalar
+            "latencia_maxima": None,
+        }
+
+    def activo(self):
+        return self.hilo is not None and self.hilo.is_alive()
+
+    def iniciar(self):
+        if self.activo():
+            return False
+        self.parar.clear()
+        self.hilo = threading.Thread(target=self._bucle, name='rastreador-dispositivos', daemon=True)
+        self.hilo.start()
+        return True
+
+    def detener(self):
+        if not self.activo():
+            return False
+        self.parar.set()
+        self.hilo.join()
+        self.hilo = None
+        return True
+
+    def _bucle(self):
+        while True:
+            try:
+                self.sondear()
+            except Exception as e:
+                self.estadisticas["sondeos_fallidos"] += 1
+                print(f"Rastreador: error al sondear ({e})")
+            if self.parar.wait(self.intervalo):
+                break
+
+    @staticmethod
+    def _puntos(dispositivos):
+        por_mac, por_ip, vistos = {}, {}, {}
+        for dispositivo in dispositivos:
+            puntos = dispositivo.get('attachmentPoint') or []
+            if not puntos:
+                continue
+            punto = (puntos[0].get('switchDPID'), puntos[0].get('port'))
+            for mac in dispositivo.get('mac') or []:
+                mac = normalizar_mac(mac)
+                por_mac[mac] = punto
+                vistos[mac] = dispositivo.get('lastSeen')
+            for ip in dispositivo.get('ipv4') or []:
+                por_ip[ip] = punto
+                vistos[ip] = dispositivo.get('lastSeen')
+        return por_mac, por_ip, vistos
+
+    # Una consulta y un diff contra la anterior. Devuelve (rehubicadas, fallidas) o None
+    # si la consulta falló; la primera solo fija la referencia
+    @metricas.medir('rastreo_dispositivos')
+    def sondear(self):
+        with self.lock:
+            inicio = time.perf_counter()
+            cliente = self.cliente or controlador
+            dispositivos = tabla_dispositivos.obtener(cliente, forzar=True)
+            if dispositivos is None:
+                self.estadisticas["sondeos_fallidos"] += 1
+                return None
+            por_mac, por_ip, vistos = self._puntos(dispositivos)
+            anterior_mac, anterior_ip = self.por_mac, self.por_ip
+            self.por_mac, self.por_ip = por_mac, por_ip
+
+            afectadas = {}
+            movidos = []
+            with estado_lock.lectura():
+                if anterior_mac is not None:
+                    macs = {mac for mac, punto in por_mac.items() if anterior_mac.get(mac, punto) != punto}
+                    ips = {ip for ip, punto in por_ip.items() if anterior_ip.get(ip, punto) != punto}
+                    if macs:
+                        for codigo in list(conexiones.por_alumno):
+                            alumno = alumnos.get(codigo)
+                            if alumno is not None and alumno.mac in macs:
+                                movidos.append(alumno.mac)
+                                afectadas.update((c.handler, c) for c in conexiones.buscar(codigo=codigo))
+                    if ips:
+                        for servidor in servidores:
+                            if servidor.direccion_ip not in ips or \
+                                    not conexiones.por_servidor.get(_minusculas(servidor.nombre)):
+                                continue
+                            movidos.append(servidor.direccion_ip)
+                            afectadas.update((c.handler, c) for c in conexiones.buscar(servidor=servidor.nombre))
+
+            rehubicadas, fallidas = rehubicar(list(afectadas.values()), cliente) if afectadas else ([], [])
+
+            estadisticas = self.estadisticas
+            estadisticas["sondeos"] += 1
+            estadisticas["ultimo_sondeo"] = time.perf_counter() - inicio
+            estadisticas["segundos_sondeo"] += estadisticas["ultimo_sondeo"]
+            estadisticas["movimientos"] += len(movidos)
+            estadisticas["rehubicadas"] += len(rehubicadas)
+            estadisticas["fallidas"] += len(fallidas)
+            # lastSeen (ms desde epoch) indica cuándo el controlador vio al host en el punto nuevo
+            latencias = [time.time() - vistos[clave] / 1000 for clave in movidos if vistos.get(clave)]
+            if latencias:
+                estadisticas["latencia_ultima"] = max(latencias)
+                estadisticas["latencia_maxima"] = max(estadisticas["latencia_maxima"] or 0.0, max(latencias))
+            if movidos:
+                print(f"Rastreador: {len(movidos)} hosts cambiaron de punto de conexión; "
+                      f"{len(rehubicadas)} conexiones rehubicadas, {len(fallidas)} fallidas")
+            return rehubicadas, fallidas
+
+
+rastreador = RastreadorDispositivos()
+
+
+def opcion_rastreador():
+
+    while True:
+        estadisticas = rastreador.estadisticas
+        sondeos = estadisticas["sondeos"]
+        print(f"\nRastreador: {'activo' if rastreador.activo() else 'detenido'} | "
+              f"intervalo: {rastreador.intervalo:g} s")
+        print(f"Sondeos: {sondeos} (fallidos: {estadisticas['sondeos_fallidos']}) | "
+              f"costo medio: {estadisticas['segundos_sondeo'] / sondeos * 1000 if sondeos else 0:.1f} ms | "
+              f"último: {estadisticas['ultimo_sondeo'] * 1000:.1f} ms")
+        print(f"Movimientos: {estadisticas['movimientos']} | Rehubicadas: {estadisticas['rehubicadas']} | "
+              f"Fallidas: {estadisticas['fallidas']}")
+        if estadisticas["latencia_maxima"] is not None:
+            print(f"Latencia de detección: última {estadisticas['latencia_ultima']:.2f} s | "
+                  f"máxima {estadisticas['latencia_maxima']:.2f} s")
+
+        print("\nSelecciona una opción:")
+        print(f"1) {'Detener' if rastreador.activo() else 'Iniciar'}")
+        print("2) Cambiar intervalo")
+        print("3) Sondear ahora")
+        print("4) Regresar")
+        print("\n>>> ", end="")
+
+        opcion = input()
+
+        if opcion == "4":
+            break
+
+        if opcion == "1":
+            if rastreador.activo():
+                rastreador.detener()
+            else:
+                rastreador.iniciar()
+        elif opcion == "2":
+            try:
+                intervalo = float(input("Nuevo intervalo (s): "))
+            except ValueError:
+                print("Intervalo no válido.")
+                continue
+            if intervalo <= 0:
+                print("Intervalo no válido.")
+                continue
+            rastreador.intervalo = intervalo
+        elif opcion == "3":
+            resultado = rastreador.sondear()
+            if resultado is None:
+                print("No se pudo consultar el controlador.")
+        else:
+            print("Opción no válida.")
+
+
+# Uso de las conexiones: en cada recolección se piden los contadores de todos los flows
+# de todos los switches (una sola llamada) y el listado del static flow pusher, se
+# asocia cada contador a su flow por (switch, match) y cada flow a su conexión por el
+# nombre. Una conexión está inactiva desde la última recolección en la que sus
+# contadores crecieron; si sus flows nunca tuvieron tráfico, desde que se instalaron
+class UsoConexion:
+    __slots__ = ('paquetes', 'bytes', 'ultima_actividad', 'flows')
+
+    def __init__(self, paquetes=0, bytes=0, ultima_actividad=None, flows=0):
+        self.paquetes = paquetes
+        self.bytes = bytes
+        self.ultima_actividad = ultima_actividad # time.time() de la última actividad vista
+        self.flows = flows                       # flows de la conexión presentes en los switches
+
+
+# Contadores de flows por switch: Floodlight >= 1.2 devuelve {dpid: {"flows": [...]}}
+# con los contadores como texto; 1.0/1.1 devuelve {dpid: [...]}
+def _estadisticas_flows(datos):
+    for switch, flows in (datos or {}).items():
+        if isinstance(flows, dict):
+            flows = flows.get('flows')
+        for flow in flows or []:
+            yield switch, flow
+
+
+def _contador(flow, *claves):
+    for clave in claves:
+        valor = flow.get(clave)
+        if valor not in (None, ''):
+            try:
+                return int(valor)
+            except (TypeError, ValueError):
+                return 0
+    return 0
+
+
+class RecolectorUso:
+    def __init__(self, intervalo=FLOW_STATS_INTERVAL, umbral=FLOW_IDLE_EXPIRY, lote=FLOW_EXPIRY_BATCH,
+                 cliente=None):
+        self.intervalo = intervalo
+        self.umbral = umbral # inactividad (s) a partir de la cual se expira; 0 = no expirar
+        self.lote = lote
+        self.cliente = cliente
+        self.uso = {}        # handler -> UsoConexion
+        self.sin_flows = set() # handlers registrados sin flows en la recolección anterior
+        self.ultima_recoleccion = None
+        self.hilo = None
+        self.parar = threading.Event()
+        self.lock = threading.Lock()
+        self.estadisticas = {"recolecciones": 0, "recolecciones_fallidas": 0, "ultima_duracion": 0.0,
+                             "flows_contados": 0, "sin_flows": 0, "expiradas": 0, "vencidas": 0, "fallidas": 0,
+                             "reinstaladas": 0}
+
+    def activo(self):
+        return self.hilo is not None and self.hilo.is_alive()
+
+    def iniciar(self):
+        if self.activo():
+            return False
+        self.parar.clear()
+        self.hilo = threading.Thread(target=self._bucle, name='recolector-uso', daemon=True)
+        self.hilo.start()
+        return True
+
+    def detener(self):
+        if not self.activo():
+            return False
+        self.parar.set()
+        self.hilo.join()
+        self.hilo = None
+        return True
+
+    def _bucle(self):
+        while not self.parar.wait(self.intervalo):
+            try:
+                if self.recolectar() is not None and self.umbral:
+                    self.expirar(self.umbral)
+            except Exception as e:
+                self.estadisticas["recolecciones_fallidas"] += 1
+                print(f"Recolector de uso: error ({e})")
+
+    # Segundos sin actividad de una conexión (None si todavía no se recolectó su uso)
+    def inactividad(self, handler, ahora=None):
+        uso = self.uso.get(handler)
+        if uso is None or uso.ultima_actividad is None:
+            return None
+        return max(0.0, (ahora or time.time()) - uso.ultima_actividad)
+
+    # Una recolección. Devuelve {handler: UsoConexion} o None si alguna consulta falló.
+    # Con timeouts en los switches, una conexión que ya estaba registrada antes de pedir
+    # los contadores y a la que no se le encontró ningún flow en dos recolecciones
+    # seguidas se saca del registro (vencida); si le faltan solo algunos (con
+    # idle_timeout cada sentido vence por separado) se le reinstalan
+    @metricas.medir('recolectar_uso')
+    def recolectar(self):
+        with self.lock:
+            inicio = time.perf_counter()
+            cliente = self.cliente or controlador
+            with estado_lock.lectura():
+                previas = {conexion.handler: conexion for conexion in conexiones}
+            nombres = flows_en_controlador(cliente)
+            respuesta = cliente.get('/wm/core/switch/all/flow/json') if nombres is not None else None
+            if respuesta is None or not respuesta.ok:
+                if respuesta is not None:
+                    print(f"Error al consultar los contadores de los flows | STATUS: {respuesta.status}")
+                self.estadisticas["recolecciones_fallidas"] += 1
+                return None
+            ahora = time.time()
+
+            por_firma = {firma[:2]: handler_de_flow(nombre) for nombre, firma in nombres.items()}
+            contadores = {} # handler -> [paquetes, bytes, menor duración, flows]
+            contados = 0
+            for switch, flow in _estadisticas_flows(respuesta.datos):
+                handler = por_firma.get(firma_flow(switch, flow.get('match') or {}, None)[:2])
+                # Las reglas compartidas no son de ninguna conexión: la actividad se mide
+                # en las exactas de los extremos
+                if handler is None or es_compartido(handler):
+                    continue
+                contados += 1
+                duracion = _contador(flow, 'duration_sec', 'durationSeconds')
+                acumulado = contadores.get(handler)
+                if acumulado is None:
+                    contadores[handler] = [_contador(flow, 'packet_count', 'packetCount'),
+                                           _contador(flow, 'byte_count', 'byteCount'), duracion, 1]
+                else:
+                    acumulado[0] += _contador(flow, 'packet_count', 'packetCount')
+                    acumulado[1] += _contador(flow, 'byte_count', 'byteCount')
+                    acumulado[2] = min(acumulado[2], duracion)
+                    acumulado[3] += 1
+
+            anterior = self.uso
+            uso = {}
+            with estado_lock.lectura():
+                registradas = list(conexiones)
+            for conexion in registradas:
+                handler = conexion.handler
+                previo = anterior.get(handler)
+                acumulado = contadores.get(handler)
+                if acumulado is None:
+                    # Sin flows en los switches: vencidos por timeout o borrados por fuera
+                    ultima = previo.ultima_actividad if previo is not None else None
+                    uso[handler] = UsoConexion(0, 0, ultima, 0)
+                    continue
+                paquetes, bytes_, duracion, flows = acumulado
+                if previo is None or previo.ultima_actividad is None:
+                    # Primera vez: sin tráfico, inactiva desde que se instaló el flow más nuevo
+                    ultima = ahora - duracion if not paquetes else ahora
+                elif paquetes != previo.paquetes and paquetes:
+                    # Creció (o se reinstaló y ya volvió a tener tráfico)
+                    ultima = ahora
+                else:
+                    ultima = previo.ultima_actividad
+                uso[handler] = UsoConexion(paquetes, bytes_, ultima, flows)
+            self.uso = uso
+            self.ultima_recoleccion = ahora
+
+            # Solo cuentan las que ya estaban registradas antes de pedir los contadores: una
+            # creada mientras tanto puede no tener todavía sus flows instalados
+            medidas = [c for c in registradas if previas.get(c.handler) is c]
+            sin_flows = [c.handler for c in medidas if not uso[c.handler].flows]
+            incompletas = [c for c in medidas if 0 < uso[c.handler].flows < len(separar_compartidas(c.flows)[0])]
+            vencidas, reinstaladas = [], []
+            timeouts = FLOW_IDLE_TIMEOUT or FLOW_HARD_TIMEOUT
+            if timeouts:
+                # El switch ya quitó los flows: solo queda sacarlas del registro. Se espera
+                # una segunda recolección por si los flows se estaban reinstalando
+                with estado_lock.escritura():
+                    for handler in sin_flows:
+                        if handler in self.sin_flows and conexiones.get(handler) is previas[handler]:
+                            conexiones.quitar_clave(handler)
+                            del uso[handler]
+                            vencidas.append(handler)
+                if incompletas:
+                    reinstaladas, fallidas = rehubicar(incompletas, cliente)
+                    if fallidas:
+                        print(f"Recolector de uso: no se pudieron reinstalar {len(fallidas)} conexiones "
+                              f"con flows vencidos")
+            self.sin_flows = set(sin_flows).difference(vencidas)
+
+            estadisticas = self.estadisticas
+            estadisticas["recolecciones"] += 1
+            estadisticas["ultima_duracion"] = time.perf_counter() - inicio
+            estadisticas["flows_contados"] = contados
+            estadisticas["sin_flows"] = len(sin_flows) - len(vencidas)
+            estadisticas["vencidas"] += len(vencidas)
+            estadisticas["reinstaladas"] += len(reinstaladas)
+            if vencidas:
+                print(f"Recolector de uso: {len(vencidas)} conexiones vencidas por timeout en los switches")
+            if reinstaladas:
+                print(f"Recolector de uso: {len(reinstaladas)} conexiones con parte de sus flows vencidos "
+                      f"reinstaladas")
+            return uso
+
+    # Conexiones inactivas hace al menos `umbral` segundos, de la más inactiva a la menos
+    def inactivas(self, umbral, ahora=None):
+        ahora = ahora or time.time()
+        candidatas = []
+        for conexion in conexiones:
+            segundos = self.inactividad(conexion.handler, ahora)
+            if segundos is not None and segundos >= umbral:
+                candidatas.append((segundos, conexion))
+        candidatas.sort(key=lambda par: -par[0])
+        return [conexion for _, conexion in candidatas]
+
+    # Revoca en lotes de `lote` conexiones las inactivas hace al menos `umbral` segundos.
+    # Devuelve (handlers revocados, handlers con algún borrado fallido)
+    @metricas.medir('expirar_inactivas')
+    def expirar(self, umbral, lote=None, cliente=None):
+        lote = lote or self.lote
+        candidatas = self.inactivas(umbral)
+        revocadas, fallidas = [], []
+        for i in range(0, len(candidatas), lote):
+            r, f = revocar(candidatas[i:i + lote], cliente or self.cliente)
+            revocadas.extend(r)
+            fallidas.extend(f)
+        for handler in revocadas:
+            self.uso.pop(handler, None)
+        self.estadisticas["expiradas"] += len(revocadas)
+        self.estadisticas["fallidas"] += len(fallidas)
+        if candidatas:
+            print(f"Expiración: {len(revocadas)} conexiones inactivas hace más de {duracion_legible(umbral)} "
+                  f"revocadas, {len(fallidas)} fallidas")
+        return revocadas, fallidas
+
+    # El uso se guarda junto al estado (<estado>.uso) para que la inactividad se siga
+    # midiendo entre invocaciones de la línea de comandos
+    def guardar(self, ruta):
+        datos = {handler: [u.paquetes, u.bytes, u.ultima_actividad, u.flows] for handler, u in self.uso.items()}
+        temporal = f"{ruta}.tmp"
+        with open(temporal, 'w') as archivo:
+            json.dump({"recoleccion": self.ultima_recoleccion, "uso": datos, "sin_flows": sorted(self.sin_flows)},
+                      archivo)
+        os.replace(temporal, ruta)
+
+    def cargar(self, ruta):
+        try:
+            with open(ruta) as archivo:
+                datos = json.load(archivo)
+        except FileNotFoundError:
+            return False
+        self.uso = {handler: UsoConexion(*valores) for handler, valores in datos.get("uso", {}).items()}
+        self.sin_flows = set(datos.get("sin_flows", ()))
+        self.ultima_recoleccion = datos.get("recoleccion")
+        return True
+
+
+recolector_uso = RecolectorUso()
+
+
+def ruta_uso(ruta):
+    return f"{ruta}.uso"
+
+
+# 90 -> "1.5 min"
+def duracion_legible(segundos):
+    if segundos is None:
+        return "-"
+    for unidad, tamano in (("d", 86400), ("h", 3600), ("min", 60)):
+        if segundos >= tamano:
+            return f"{segundos / tamano:.1f} {unidad}"
+    return f"{segundos:.0f} s"
+
+
+def leer_segundos(texto):
+    texto = texto.strip().lower()
+    for sufijo, factor in (("d", 86400), ("h", 3600), ("m", 60), ("s", 1)):
+        if texto.endswith(sufijo):
+            return float(texto[:-1]) * factor
+    return float(texto)
+
+
+def opcion_uso():
+    global FLOW_IDLE_TIMEOUT, FLOW_HARD_TIMEOUT
 
     while True:
-        print("\n")
+        estadisticas = recolector_uso.estadisticas
+        print(f"\nRecolector de uso: {'activo' if recolector_uso.activo() else 'detenido'} | "
+              f"intervalo: {recolector_uso.intervalo:g} s | "
+              f"expirar tras: {duracion_legible(recolector_uso.umbral) if recolector_uso.umbral else 'nunca'}")
+        print(f"Recolecciones: {estadisticas['recolecciones']} (fallidas: {estadisticas['recolecciones_fallidas']}) | "
+              f"última: {estadisticas['ultima_duracion'] * 1000:.1f} ms, {estadisticas['flows_contados']} flows | "
+              f"sin flows en los switches: {estadisticas['sin_flows']}")
+        print(f"Expiradas: {estadisticas['expiradas']} | Vencidas por timeout: {estadisticas['vencidas']} | "
+              f"Reinstaladas: {estadisticas['reinstaladas']} | Fallidas: {estadisticas['fallidas']}")
+        print(f"Timeouts de los flows nuevos: idle {FLOW_IDLE_TIMEOUT or 'no'} | hard {FLOW_HARD_TIMEOUT or 'no'}")
+
         print("\nSelecciona una opción:")
-        print("1) Listar")
-        print("2) Mostrar detalles")
-        print("3) Regresar")
-        print("\n>>> ", end="")        
-        
+        print("1) Recolectar ahora")
+        print(f"2) {'Detener' if recolector_uso.activo() else 'Iniciar'} recolección periódica")
+        print("3) Cambiar intervalo")
+        print("4) Cambiar inactividad para expirar (0 = nunca)")
+        print("5) Expirar inactivas ahora")
+        print("6) Timeouts de los flows nuevos")
+        print("7) Regresar")
+        print("\n>>> ", end="")
+
         opcion = input()
-        
-        if opcion == "3":
-            print("Volviendo al menú principal...")
+
+        if opcion == "7":
             break
-        
+
         if opcion == "1":
-            print("Opción 1 seleccionada: Listar")
-            listar_alumnos()
+            uso = recolector_uso.recolectar()
+            if uso is None:
+                print("No se pudo consultar el controlador.")
+            else:
+                activas = sum(1 for u in uso.values() if u.paquetes)
+                print(f"{len(uso)} conexiones, {activas} con tráfico")
         elif opcion == "2":
-            print("Opción 2 seleccionada: Mostrar detalles")
-            mostrar_alumnos()
-        elif opcion == "3":
-            print("Opción 3 seleccionada: Regresar")
+            if recolector_uso.activo():
+                recolector_uso.detener()
+            else:
+                recolector_uso.iniciar()
+        elif opcion in ("3", "4", "5"):
+            try:
+                segundos = leer_segundos(input("Tiempo (s, o con sufijo m/h/d): "))
+            except ValueError:
+                print("Tiempo no válido.")
+                continue
+            if segundos < 0 or (opcion == "3" and segundos == 0):
+                print("Tiempo no válido.")
+                continue
+            if opcion == "3":
+                recolector_uso.intervalo = segundos
+            elif opcion == "4":
+                recolector_uso.umbral = segundos
+            else:
+                if recolector_uso.ultima_recoleccion is None:
+                    print("Todavía no hay datos de uso: recolecte primero.")
+                    continue
+                candidatas = recolector_uso.inactivas(segundos)
+                confirmacion = input(f"Se revocarán {len(candidatas)} conexiones. ¿Continuar? (s/n): ")
+                if confirmacion.strip().lower() == 's':
+                    recolector_uso.expirar(segundos)
+        elif opcion == "6":
+            try:
+                FLOW_IDLE_TIMEOUT = int(input("idle_timeout (s, 0 = sin timeout): ") or 0)
+                FLOW_HARD_TIMEOUT = int(input("hard_timeout (s, 0 = sin timeout): ") or 0)
+            except ValueError:
+                print("Timeout no válido.")
         else:
             print("Opción no válida.")
 
 
-def opcion_servidores():
+# Políticas: la matriz de decisión se compila desde los cursos (ver politicas.py) y se
+# recompila solo si el índice de autorización cambió desde la última vez. Las
+# simulaciones trabajan sobre una copia y no tocan el controlador ni el estado
+_politicas = (None, None) # (versión del índice, matriz)
+
+
+def politicas_vigentes():
+    global _politicas
+    version, matriz = _politicas
+    if matriz is None or version != indice_autorizacion.version:
+        version = indice_autorizacion.version
+        matriz = compilar_politicas()
+        _politicas = (version, matriz)
+    return matriz
+
+
+@metricas.medir('compilar_politicas')
+def compilar_politicas():
+    return MatrizPoliticas.desde_cursos(cursos)
+
+
+# Cambios hipotéticos en una línea: CURSO=ESTADO, alta=CURSO:CODIGO, baja=CURSO:CODIGO.
+# Devuelve (estados, altas, bajas)
+def leer_cambios(partes):
+    estados, altas, bajas = {}, [], []
+    for parte in partes:
+        clave, separador, valor = parte.partition('=')
+        if not separador or not valor:
+            raise ValueError(f"Cambio no válido: {parte}")
+        if clave in ('alta', 'baja'):
+            curso, separador, codigo = valor.partition(':')
+            if not separador or not curso or not codigo:
+                raise ValueError(f"Cambio no válido: {parte} (se esperaba {clave}=CURSO:CODIGO)")
+            (altas if clave == 'alta' else bajas).append((curso, codigo))
+        else:
+            estado = valor.upper()
+            if estado not in ("DICTANDO", "INACTIVO"):
+                raise ValueError(f"Estado no válido: {valor}")
+            curso = cursos.get(clave)
+            estados[curso.codigo if curso else clave] = estado
+    if not estados and not altas and not bajas:
+        raise ValueError("No se indicó ningún cambio")
+    return estados, altas, bajas
+
+
+# Efecto de los cambios sobre la matriz y sobre las conexiones existentes (las que
+# quedarían sin autorización y se revocarían)
+@metricas.medir('simular_politicas')
+def simular_politicas(estados=None, altas=(), bajas=(), matriz=None):
+    matriz = matriz or politicas_vigentes()
+    simulada = matriz.simular(estados, altas, bajas)
+    ganados, perdidos = matriz.diferencia(simulada)
+    revocadas = []
+    for codigo, servidor, servicio in perdidos:
+        revocadas.extend(c.handler for c in conexiones.buscar(codigo, servidor, servicio))
+    return {"antes": matriz.total(), "despues": simulada.total(), "ganados": ganados,
+            "perdidos": perdidos, "conexiones_revocadas": revocadas}
+
+
+def opcion_politicas():
 
     while True:
         print("\n")
         print("\nSelecciona una opción:")
-        print("1) Listar")
-        print("2) Mostrar detalles")
-        print("3) Regresar")
-        print("\n>>> ", end="")        
-        
+        print("1) Consultar acceso")
+        print("2) Alumnos con acceso a un servicio")
+        print("3) Accesos de un alumno")
+        print("4) Resumen de la matriz")
+        print("5) Simular cambios")
+        print("6) Regresar")
+        print("\n>>> ", end="")
+
         opcion = input()
-        
-        if opcion == "3":
+
+        if opcion == "6":
             print("Volviendo al menú principal...")
             break
-        
+
         if opcion == "1":
-            print("Opción 1 seleccionada: Listar")
-            listar_servidores()
+            print("Opción 1 seleccionada: Consultar acceso")
+            consultar_acceso()
         elif opcion == "2":
-            print("Opción 2 seleccionada: Mostrar detalles")
-            mostrar_servidores()
+            print("Opción 2 seleccionada: Alumnos con acceso a un servicio")
+            mostrar_quienes()
         elif opcion == "3":
-            print("Opción 3 seleccionada: Regresar")
+            print("Opción 3 seleccionada: Accesos de un alumno")
+            mostrar_accesos()
+        elif opcion == "4":
+            print("Opción 4 seleccionada: Resumen de la matriz")
+            mostrar_resumen_politicas()
+        elif opcion == "5":
+            print("Opción 5 seleccionada: Simular cambios")
+            simular_cambios()
         else:
             print("Opción no válida.")
 
 
+def consultar_acceso():
+    codigo = input("Código del alumno: ").strip()
+    servidor = input("Servidor: ").strip()
+    servicio = input("Servicio: ").strip()
+    matriz = politicas_vigentes()
+    if matriz.permitido(codigo, servidor, servicio):
+        print(f"PERMITIDO (cursos: {', '.join(matriz.cursos_que_autorizan(codigo, servidor, servicio))})")
+    else:
+        print("DENEGADO: ningún curso DICTANDO del alumno permite ese servicio.")
 
 
-def opcion_conexiones():
-    global conexiones 
-    while True:
-        print("\nSelecciona una opción:")
-        print("1) Crear conexión")
-        print("2) Listar conexiones")
-        print("3) Borrar conexión")
-        print("4) Regresar")
-        print("\n>>> ", end="")        
+def mostrar_quienes():
+    servidor = input("Servidor: ").strip()
+    servicio = input("Servicio: ").strip()
+    codigos = politicas_vigentes().quienes(servidor, servicio)
+    if not codigos:
+        print("Ningún alumno tiene acceso a ese servicio.")
+        return
+    print(f"{len(codigos)} alumnos con acceso a {servicio} en {servidor}:")
+    filas = ((codigo, alumno.nombre if alumno else "-", alumno.mac if alumno else "-")
+             for codigo, alumno in ((c, alumnos.get(c)) for c in codigos))
+    mostrar_listado(["Código", "Nombre", "MAC"], filas)
 
-        opcion = input()
-        
-        if opcion == "4":
-            print("Volviendo al menú principal...")
-            break
-        
-        if opcion == "1":
-            print("Opción 1 seleccionada: Crear conexión")
-            crear_conexion()
-        
-        elif opcion == "2":
-            print("Opción 2 seleccionada: Listar conexiones")
-            listar_conexiones()
-        
-        elif opcion == "3":
-            print("Opción 3 seleccionada: Borrar conexión")
-            borrar_conexion()
 
-        else:
-            print("Opción no válida.")
+def mostrar_accesos():
+    codigo = input("Código del alumno: ").strip()
+    matriz = politicas_vigentes()
+    accesos = matriz.accesos(codigo)
+    if not accesos:
+        print("El alumno no tiene accesos.")
+        return
+    mostrar_listado(["Servidor", "Servicio", "Cursos"],
+                    ((servidor, servicio, ', '.join(matriz.cursos_que_autorizan(codigo, servidor, servicio)))
+                     for servidor, servicio in accesos))
 
 
-def crear_conexion():
-    global conexiones
-    cod_alumno = input("Ingrese el código del alumno: ")
-    nombre_servidor = input("Ingrese el servidor: ")
-    nombre_servicio = input("Ingrese el servicio: ").lower()
+def mostrar_resumen_politicas():
+    matriz = politicas_vigentes()
+    print(f"Alumnos: {len(matriz.codigos)} | Servicios: {len(matriz.servicios)} | "
+          f"Accesos permitidos: {matriz.total()}")
+    mostrar_listado(["Servidor", "Servicio", "Alumnos con acceso"], matriz.resumen())
 
-    alumno = next((a for a in alumnos if str(a.codigo) == cod_alumno), None)
-    servidor = next((s for s in servidores if s.nombre == nombre_servidor), None)
 
-    if not alumno or not servidor:
-        print("Alumno o servidor no encontrado.")
+def simular_cambios():
+    import shlex
+    texto = input("Cambios (CURSO=DICTANDO|INACTIVO alta=CURSO:CODIGO baja=CURSO:CODIGO): ")
+    try:
+        resultado = simular_politicas(*leer_cambios(shlex.split(texto)))
+    except (LookupError, ValueError) as e:
+        print(f"Error: {e}")
         return
+    print(f"Accesos permitidos: {resultado['antes']} -> {resultado['despues']}")
+    print(f"Accesos ganados: {len(resultado['ganados'])} | perdidos: {len(resultado['perdidos'])}")
+    print(f"Conexiones que se revocarían: {len(resultado['conexiones_revocadas'])}")
+    cambios = [("+",) + acceso for acceso in resultado['ganados']] + \
+              [("-",) + acceso for acceso in resultado['perdidos']]
+    if cambios:
+        mostrar_listado(["", "Alumno", "Servidor", "Servicio"], cambios)
 
-    # Verificar autorización
-    autorizado = False
-    for curso in cursos:
-        if curso.estado == "DICTANDO" and alumno in curso.alumnos:
-            for srv in curso.servidores:
-                if srv.nombre == nombre_servidor:
-                    for servicio_srv in srv.servicios:
-                        if servicio_srv.nombre == nombre_servicio:
-                            autorizado = True
-                            break
-                    if autorizado:
-                        break
-            if autorizado:
+
+# Listados: las vistas generan las filas filtradas y ordenadas de forma perezosa y las
+# muestran paginadas (ver listados.py)
+def mostrar_listado(columnas, filas, formato=None, pagina=None):
+    tamano = int(pagina) if pagina else LISTING_PAGE_SIZE
+    return listados.mostrar(columnas, filas, formato or LISTING_FORMAT, tamano, listados.pausa)
+
+
+# Mide un listado perezoso como una operación: desde `inicio` (antes de la selección,
+# que puede ordenar) hasta que quien lo consume deja de pedir elementos, contando solo
+# el tiempo dentro del iterador (filtro, orden y armado de las filas) y no el de
+# escribirlas ni las pausas entre páginas
+def medir_listado(nombre, elementos, inicio):
+    if not metricas.activo:
+        return elementos
+    return _medir_listado(nombre, iter(elementos), time.perf_counter() - inicio)
+
+
+def _medir_listado(nombre, elementos, total):
+    try:
+        while True:
+            inicio = time.perf_counter()
+            try:
+                elemento = next(elementos)
+            except StopIteration:
                 break
+            finally:
+                total += time.perf_counter() - inicio
+            yield elemento
+    except GeneratorExit:
+        # Quien lo consumía cortó antes del final (p. ej. 'q' en la paginación)
+        metricas.registrar('operacion', nombre, total)
+        raise
+    except BaseException:
+        metricas.registrar('operacion', nombre, total, 'excepcion')
+        raise
+    metricas.registrar('operacion', nombre, total)
 
-    if not autorizado:
-        print("ERROR")
-        print("El alumno no pertenece a un CURSO válido con estado DICTANDO")
-        return
 
-    servicio_obj = next((x for x in servidor.servicios if x.nombre == nombre_servicio), None)
+# Pide filtros y opciones en una línea (clave=valor ...) y muestra el listado
+def listar_con_opciones(vista, filtros):
+    permitidas = filtros + ('orden', 'formato', 'pagina')
+    texto = input(f"Filtros y opciones ({' '.join(clave + '=' for clave in permitidas)}); Enter para ninguno: ")
+    try:
+        vista(**listados.leer_opciones(texto, permitidas))
+    except (LookupError, ValueError) as e:
+        print(f"Error: {e}")
 
-    if servicio_obj:
-        mac_src = alumno.mac
-        ip_dst = servidor.direccion_ip
-        protocolo = servicio_obj.protocolo
-        puerto = servicio_obj.puerto
-        handler = f"{alumno.codigo}-{servidor.nombre}-{servicio_obj.nombre}"
-        
-        success = insertar_flows(mac_src, ip_dst, protocolo, puerto, handler, controller_ip)
 
-        if success:
-            conexiones.append(Conexion(handler, alumno, servidor, servicio_obj))
-            print(f"Conexión creada con handler: {handler}")
-        else:
-            print("Error al insertar flow.")
+def seleccionar_alumnos(curso=None, mac=None, nombre=None, orden=None):
+    if curso:
+        curso_encontrado = cursos.get(curso)
+        if curso_encontrado is None:
+            raise LookupError(f"No se encontró un curso con el código {curso}")
+        seleccion = iter(curso_encontrado.alumnos)
     else:
-        print("Servicio no encontrado.")
+        seleccion = iter(alumnos)
+    if mac:
+        prefijo = normalizar_mac(mac)
+        seleccion = (a for a in seleccion if a.mac.startswith(prefijo))
+    if nombre:
+        nombre = nombre.lower()
+        seleccion = (a for a in seleccion if nombre in a.nombre.lower())
+    return listados.ordenar(seleccion, orden, {'codigo': lambda a: str(a.codigo), 'nombre': lambda a: a.nombre,
+                                               'mac': lambda a: a.mac})
 
 
-def listar_conexiones():
-    global conexiones
-    if not conexiones:
-        print("No hay conexiones registradas.")
-    else:
-        table = PrettyTable()
-        table.field_names = ["Handler", "Alumno", "Servidor", "Servicio"]
-        for c in conexiones:
-            table.add_row([c.handler, c.alumno.nombre, c.servidor.nombre, c.servicio.nombre])
-        print(table)
+def seleccionar_cursos(estado=None, nombre=None, orden=None):
+    seleccion = iter(cursos)
+    if estado:
+        estado = estado.upper()
+        seleccion = (c for c in seleccion if c.estado == estado)
+    if nombre:
+        nombre = nombre.lower()
+        seleccion = (c for c in seleccion if nombre in c.nombre.lower())
+    return listados.ordenar(seleccion, orden, {'codigo': lambda c: str(c.codigo), 'nombre': lambda c: c.nombre,
+                                               'estado': lambda c: c.estado,
+                                               'alumnos': lambda c: len(c.alumnos)})
 
-def borrar_conexion():
-    global conexiones
-    handler = input("Ingrese el handler de la conexión a eliminar: ")
-    conexion = next((c for c in conexiones if c.handler == handler), None)
-    if conexion:
-        requests.delete(f"http://{controller_ip}:8080/wm/staticflowpusher/json", json={"name": handler})
-        conexiones.remove(conexion)
-        print(f"Conexión con handler '{handler}' eliminada correctamente.")
+
+def seleccionar_conexiones(alumno=None, servidor=None, servicio=None, curso=None, handler=None, orden=None):
+    if alumno or servidor or servicio:
+        seleccion = iter(conexiones.buscar(alumno or None, servidor or None, servicio or None))
     else:
-        print("No se encontró una conexión con ese handler.")
+        seleccion = iter(conexiones)
+    if curso:
+        curso_encontrado = cursos.get(curso)
+        if curso_encontrado is None:
+            raise LookupError(f"No se encontró un curso con el código {curso}")
+        del_curso = {c.handler for c in conexiones.de_curso(curso_encontrado)}
+        seleccion = (c for c in seleccion if c.handler in del_curso)
+    if handler:
+        handler = handler.lower()
+        seleccion = (c for c in seleccion if handler in c.handler.lower())
+    uso = recolector_uso.uso
+    return listados.ordenar(seleccion, orden, {'handler': lambda c: c.handler,
+                                               'alumno': lambda c: str(c.alumno.codigo),
+                                               'servidor': lambda c: c.servidor.nombre,
+                                               'servicio': lambda c: c.servicio.nombre,
+                                               'bytes': lambda c: getattr(uso.get(c.handler), 'bytes', -1),
+                                               'inactividad': lambda c: recolector_uso.inactividad(c.handler) or 0})
 
 
 def mostrar_detalles_cursos():
+    from prettytable import PrettyTable
     global cursos
 
     codigo_curso = input("\nIngrese el código del curso para ver los detalles: ")
 
-    curso_encontrado = None
-    for curso in cursos:
-        if curso.codigo == codigo_curso:
-            curso_encontrado = curso
-            break
+    curso_encontrado = cursos.get(codigo_curso)
 
     if not curso_encontrado:
         print(f"No se encontró un curso con el código {codigo_curso}.")
@@ -472,21 +3948,16 @@ def mostrar_detalles_cursos():
 
     print(f"\nDetalles del curso: {curso_encontrado.nombre} (Código: {curso_encontrado.codigo})")
 
-    table_alumnos = PrettyTable()
-    table_alumnos.field_names = ["Nombre", "Código", "MAC"]
-
-    for alumno in curso_encontrado.alumnos:
-        table_alumnos.add_row([alumno.nombre, alumno.codigo, alumno.mac])
-
-    print("\nAlumnos en este curso:")
-    print(table_alumnos)
+    print(f"\nAlumnos en este curso ({len(curso_encontrado.alumnos)}):")
+    mostrar_listado(["Nombre", "Código", "MAC"],
+                    ((alumno.nombre, alumno.codigo, alumno.mac) for alumno in curso_encontrado.alumnos))
 
     table_servidores = PrettyTable()
     table_servidores.field_names = ["Nombre del Servidor", "IP"]
 
     for servidor in curso_encontrado.servidores:
         table_servidores.add_row([servidor.nombre, servidor.direccion_ip])
-        for servicio in servidor.servicios:
+        for servicio in curso_encontrado.servicios_de(servidor):
             table_servidores.add_row([f"  Servicio: {servicio.nombre}", f"Protocolo: {servicio.protocolo} - Puerto: {servicio.puerto}"])
 
     print("\nServidores en este curso:")
@@ -529,21 +4000,13 @@ def añadir_alumno_a_curso():
     mostrar_alumnos()
     codigo_alumno = input("Ingrese el código del alumno que desea añadir: ")
 
-    curso_encontrado = None
-    for curso in cursos:
-        if curso.codigo == codigo_curso:
-            curso_encontrado = curso
-            break
+    curso_encontrado = cursos.get(codigo_curso)
 
     if not curso_encontrado:
         print(f"No se encontró un curso con el código {codigo_curso}.")
         return
 
-    alumno_encontrado = None
-    for alumno in alumnos:
-        if alumno.codigo == int(codigo_alumno):
-            alumno_encontrado = alumno
-            break
+    alumno_encontrado = alumnos.get(codigo_alumno)
 
     if not alumno_encontrado:
         print(f"No se encontró un alumno con el código {codigo_alumno}.")
@@ -554,6 +4017,7 @@ def añadir_alumno_a_curso():
         return
 
     curso_encontrado.add_alumno(alumno_encontrado)
+    anotar('alta', curso_encontrado.codigo, alumno_encontrado.codigo)
     print(f"Alumno {alumno_encontrado.nombre} añadido al curso {curso_encontrado.nombre}.")
 
 
@@ -565,31 +4029,48 @@ def eliminar_alumno_de_curso():
     mostrar_alumnos()
     codigo_alumno = input("Ingrese el código del alumno que desea eliminar: ")
 
-    curso_encontrado = None
-    for curso in cursos:
-        if curso.codigo == codigo_curso:
-            curso_encontrado = curso
-            break
+    curso_encontrado = cursos.get(codigo_curso)
 
     if not curso_encontrado:
         print(f"No se encontró un curso con el código {codigo_curso}.")
         return
 
-    alumno_a_eliminar = None
-    for alumno in curso_encontrado.alumnos:
-        if str(alumno.codigo) == str(codigo_alumno):
-            alumno_a_eliminar = alumno
-            break
+    alumno_a_eliminar = curso_encontrado.alumnos.get(codigo_alumno)
 
     if not alumno_a_eliminar:
         print(f"No se encontró un alumno con el código {codigo_alumno} en el curso {curso_encontrado.nombre}.")
         return
 
-    curso_encontrado.del_alumno(alumno_a_eliminar)
+    revocadas, fallidas = quitar_alumno_de_curso(curso_encontrado, alumno_a_eliminar)
     print(f"Alumno {alumno_a_eliminar.nombre} eliminado del curso {curso_encontrado.nombre}.")
+    if revocadas or fallidas:
+        imprimir_revocacion(revocadas, fallidas)
+
+
+def cambiar_estado():
+    mostrar_cursos()
+    codigo_curso = input("Ingrese el código del curso: ")
+
+    curso_encontrado = cursos.get(codigo_curso)
+
+    if not curso_encontrado:
+        print(f"No se encontró un curso con el código {codigo_curso}.")
+        return
+
+    estado = input(f"Nuevo estado (actual: {curso_encontrado.estado}) [DICTANDO/INACTIVO]: ").strip().upper()
+    if estado not in ("DICTANDO", "INACTIVO"):
+        print("Estado no válido.")
+        return
+
+    revocadas, fallidas = cambiar_estado_curso(curso_encontrado, estado)
+    print(f"Curso {curso_encontrado.nombre} ahora está {estado}.")
+    if revocadas or fallidas:
+        imprimir_revocacion(revocadas, fallidas)
 
 
+@metricas.medir('listar_servidores')
 def listar_servidores():
+    from prettytable import PrettyTable
     global servidores
     table_servidores = PrettyTable()
     table_servidores.field_names = ["Nombre del Servidor", "IP"]
@@ -602,14 +4083,11 @@ def listar_servidores():
 
 
 def mostrar_servidores():
+    from prettytable import PrettyTable
     global servidores
     nombre_servidor = input("\nIngrese el nombre del servidor para ver sus servicios: ")
 
-    servidor_encontrado = None
-    for servidor in servidores:
-        if servidor.nombre.lower() == nombre_servidor.lower():
-            servidor_encontrado = servidor
-            break
+    servidor_encontrado = servidores.get(nombre_servidor)
 
     if not servidor_encontrado:
         print(f"No se encontró un servidor con el nombre {nombre_servidor}.")
@@ -642,7 +4120,7 @@ def listar_alumnos():
         
         if opcion == "1":
             print("Opción 1 seleccionada: Listar todos")
-            mostrar_alumnos()
+            listar_con_opciones(mostrar_alumnos, ('curso', 'mac', 'nombre'))
         elif opcion == "2":
             print("Opción 2 seleccionada: Listar por curso")
             mostrar_alumnos_curso()
@@ -652,16 +4130,12 @@ def listar_alumnos():
             print("Opción no válida.")
 
 
-def mostrar_alumnos():
-    global alumnos
-    table = PrettyTable()
-    table.field_names = ["Código", "Nombre", "MAC"]
-    
-    for alumno in alumnos:
-        table.add_row([alumno.codigo, alumno.nombre, alumno.mac])
-    
+def mostrar_alumnos(formato=None, pagina=None, **filtros):
+    inicio = time.perf_counter()
+    seleccion = medir_listado('mostrar_alumnos', seleccionar_alumnos(**filtros), inicio)
     print("\nLista de Alumnos:")
-    print(table)
+    mostrar_listado(["Código", "Nombre", "MAC"],
+                    ((alumno.codigo, alumno.nombre, alumno.mac) for alumno in seleccion), formato, pagina)
 
 
 def mostrar_alumnos_curso():
@@ -670,37 +4144,615 @@ def mostrar_alumnos_curso():
     mostrar_cursos()
     codigo_curso = input("\nIngrese el código del curso para ver los alumnos: ")
 
-    curso_encontrado = None
-    for curso in cursos:
-        if curso.codigo == codigo_curso:
-            curso_encontrado = curso
-            break
+    curso_encontrado = cursos.get(codigo_curso)
 
     if not curso_encontrado:
         print(f"No se encontró un curso con el código {codigo_curso}.")
         return
 
-    table = PrettyTable()
-    table.field_names = ["Código", "Nombre", "MAC"]
-
-    for alumno in curso_encontrado.alumnos:
-        table.add_row([alumno.codigo, alumno.nombre, alumno.mac])
-
     print(f"\nAlumnos en el curso {curso_encontrado.nombre} (Código: {curso_encontrado.codigo}):")
-    print(table)
+    mostrar_listado(["Código", "Nombre", "MAC"],
+                    ((alumno.codigo, alumno.nombre, alumno.mac) for alumno in curso_encontrado.alumnos))
 
 
-def mostrar_cursos():
-    global cursos
-    table = PrettyTable()
-    table.field_names = ["Código", "Nombre", "Estado"]
-    
-    for curso in cursos:
-        table.add_row([curso.codigo, curso.nombre, curso.estado])
-    
+def mostrar_cursos(formato=None, pagina=None, **filtros):
+    inicio = time.perf_counter()
+    seleccion = medir_listado('mostrar_cursos', seleccionar_cursos(**filtros), inicio)
     print("\nLista de Cursos:")
-    print(table)
+    mostrar_listado(["Código", "Nombre", "Estado"],
+                    ((curso.codigo, curso.nombre, curso.estado) for curso in seleccion), formato, pagina)
+
+
+# Modo no interactivo: subcomandos con salida JSON. El estado se guarda entre
+# invocaciones en un snapshot (--estado) más su diario (<estado>.diario): se recupera
+# al empezar y cada mutación se anota en el diario, que se compacta periódicamente
+ESTADO_CLI = os.environ.get('UPSM_ESTADO', 'estado.snap')
+
+
+def _json_alumno(alumno):
+    return {"codigo": alumno.codigo, "nombre": alumno.nombre, "mac": alumno.mac}
+
+
+def _json_servidor(servidor, servicios=None):
+    return {"nombre": servidor.nombre, "ip": servidor.direccion_ip,
+            "servicios": [{"nombre": x.nombre, "protocolo": x.protocolo, "puerto": x.puerto}
+                          for x in (servicios if servicios is not None else servidor.servicios)]}
+
+
+def _json_curso(curso, detalle=False):
+    datos = {"codigo": curso.codigo, "nombre": curso.nombre, "estado": curso.estado,
+             "alumnos": len(curso.alumnos), "servidores": [s.nombre for s in curso.servidores]}
+    if detalle:
+        datos["alumnos"] = [_json_alumno(a) for a in curso.alumnos]
+        datos["servidores"] = [_json_servidor(s, curso.servicios_de(s)) for s in curso.servidores]
+    return datos
+
+
+def _json_conexion(conexion):
+    datos = {"handler": conexion.handler, "alumno": conexion.alumno.codigo, "servidor": conexion.servidor.nombre,
+             "servicio": conexion.servicio.nombre, "flows": list(conexion.flows)}
+    uso = recolector_uso.uso.get(conexion.handler)
+    if uso is not None:
+        datos["uso"] = {"paquetes": uso.paquetes, "bytes": uso.bytes, "flows_en_switches": uso.flows,
+                        "inactiva_segundos": recolector_uso.inactividad(conexion.handler)}
+    return datos
+
+
+# Devuelve un iterador: cli() escribe los elementos a medida que se generan. Se mide
+# como listar_<entidad> mientras se consume
+def cli_list(args):
+    inicio = time.perf_counter()
+    if args.entidad == 'alumnos':
+        elementos = map(_json_alumno, seleccionar_alumnos(args.curso, args.mac, args.nombre, args.orden))
+    elif args.entidad == 'cursos':
+        elementos = map(_json_curso, seleccionar_cursos(args.estado_curso, args.nombre, args.orden))
+    elif args.entidad == 'servidores':
+        elementos = map(_json_servidor, listados.ordenar(iter(servidores), args.orden, {'nombre': lambda s: s.nombre}))
+    elif args.entidad == 'conexiones':
+        if recolector_uso.ultima_recoleccion is None:
+            recolector_uso.cargar(ruta_uso(args.estado))
+        elementos = map(_json_conexion, seleccionar_conexiones(args.alumno, args.servidor, args.servicio, args.curso,
+                                                               args.handler, args.orden))
+    else:
+        elementos = ({"mac": mac, "ipv4": ipv4, "switch": dpid, "puerto": puerto}
+                     for mac, ipv4, dpid, puerto in filas_dispositivos(tabla_dispositivos.recorrer(), args.mac,
+                                                                       args.switch))
+    elementos = itertools.islice(elementos, args.desde, args.desde + args.limite if args.limite else None)
+    return medir_listado(f"listar_{args.entidad}", elementos, inicio)
+
+
+# Escribe un listado en JSON (un arreglo que se va emitiendo elemento a elemento), CSV
+# o texto plano (columnas = claves del primer elemento)
+def escribir_listado(elementos, formato, destino):
+    if formato == 'json':
+        destino.write('[')
+        for i, elemento in enumerate(elementos):
+            destino.write((', ' if i else '') + json.dumps(elemento, ensure_ascii=False, default=list))
+        destino.write(']\n')
+        return
+    elementos = iter(elementos)
+    primero = next(elementos, None)
+    if primero is None:
+        return
+    columnas = list(primero)
+    filas = ([' '.join(map(str, v)) if isinstance(v, (list, tuple)) else v for v in e.values()]
+             for e in itertools.chain([primero], elementos))
+    listados.mostrar(columnas, filas, formato, salida=destino)
+
+
+def cli_show(args):
+    if args.entidad == 'alumno':
+        alumno = alumnos.get(args.id)
+        if alumno:
+            datos = _json_alumno(alumno)
+            datos["permisos"] = [{"servidor": srv, "servicio": svc, "cursos": sorted(cur)}
+                                 for srv, svc, cur in indice_autorizacion.permisos_de_alumno(alumno.codigo)]
+            return datos
+    elif args.entidad == 'curso':
+        curso = cursos.get(args.id)
+        if curso:
+            return _json_curso(curso, detalle=True)
+    elif args.entidad == 'servidor':
+        servidor = servidores.get(args.id)
+        if servidor:
+            return _json_servidor(servidor)
+    raise LookupError(f"No se encontró {args.entidad} {args.id}")
+
+
+def cli_connect(args):
+    conexion, error = conectar(args.alumno, args.servidor, args.servicio.lower())
+    if error:
+        raise LookupError(error.replace("\n", " "))
+    return _json_conexion(conexion)
+
+
+def cli_disconnect(args):
+    if args.handler:
+        ok, error = desconectar(args.handler)
+        if not ok:
+            raise (ConnectionError if conexiones.tiene(args.handler) else LookupError)(error)
+        return {"handler": args.handler, "eliminada": True}
+    if args.alumno is None and args.servidor is None and args.servicio is None:
+        raise ValueError("Indique un handler o al menos un filtro (--alumno, --servidor, --servicio)")
+    revocadas, fallidas = revocar(conexiones.buscar(args.alumno, args.servidor, args.servicio))
+    return {"revocadas": revocadas, "fallidas": fallidas}
+
+
+def cli_course_state(args):
+    curso = cursos.get(args.curso)
+    if not curso:
+        raise LookupError(f"No se encontró curso {args.curso}")
+    revocadas, fallidas = cambiar_estado_curso(curso, args.nuevo_estado)
+    return {"curso": curso.codigo, "estado": curso.estado, "revocadas": revocadas, "fallidas": fallidas}
+
+
+def cli_unenroll(args):
+    curso = cursos.get(args.curso)
+    alumno = curso.alumnos.get(args.alumno) if curso else None
+    if not alumno:
+        raise LookupError(f"No se encontró el alumno {args.alumno} en el curso {args.curso}")
+    revocadas, fallidas = quitar_alumno_de_curso(curso, alumno)
+    return {"curso": curso.codigo, "alumno": alumno.codigo, "revocadas": revocadas, "fallidas": fallidas}
+
+
+def _json_acceso(codigo, servidor, servicio):
+    return {"alumno": codigo, "servidor": servidor, "servicio": servicio}
+
+
+def cli_policy(args):
+    matriz = politicas_vigentes()
+    if args.accion == 'check':
+        return {"alumno": args.alumno, "servidor": args.servidor, "servicio": args.servicio,
+                "permitido": matriz.permitido(args.alumno, args.servidor, args.servicio),
+                "cursos": matriz.cursos_que_autorizan(args.alumno, args.servidor, args.servicio)}
+    if args.accion == 'who':
+        return ({"alumno": codigo} for codigo in matriz.quienes(args.servidor, args.servicio))
+    if args.accion == 'of':
+        return {"alumno": args.alumno,
+                "accesos": [{"servidor": srv, "servicio": svc,
+                             "cursos": matriz.cursos_que_autorizan(args.alumno, srv, svc)}
+                            for srv, svc in matriz.accesos(args.alumno)]}
+    if args.accion == 'matrix':
+        return itertools.starmap(_json_acceso, matriz.pares())
+    resultado = simular_politicas(*leer_cambios(args.cambios), matriz=matriz)
+    resultado["ganados"] = [_json_acceso(*acceso) for acceso in resultado["ganados"]]
+    resultado["perdidos"] = [_json_acceso(*acceso) for acceso in resultado["perdidos"]]
+    return resultado
+
+
+def cli_reconcile(args):
+    resultado = reconciliar(aplicar=not args.simular)
+    if resultado is None:
+        raise ConnectionError("No se pudo consultar el controlador")
+    resultado["agregar"] = [flow["name"] for flow in resultado["agregar"]]
+    resultado["modificar"] = [flow["name"] for flow in resultado["modificar"]]
+    return resultado
+
+
+def cli_audit(args):
+    return auditar_flows(reparar=args.reparar, lote=args.lote, workers=args.workers, switches=args.switch)
+
+
+def cli_footprint(args):
+    resultado = {}
+    if args.recompilar:
+        resultado["recompiladas"], resultado["fallidas"] = rehubicar(list(conexiones))
+    return dict(huella_flows(), **resultado)
+
+
+def cli_usage(args):
+    ruta = ruta_uso(args.estado)
+    recolector_uso.cargar(ruta)
+    vencidas = recolector_uso.estadisticas["vencidas"]
+    reinstaladas = recolector_uso.estadisticas["reinstaladas"]
+    uso = recolector_uso.recolectar()
+    if uso is None:
+        raise ConnectionError("No se pudo consultar el controlador")
+    resultado = {"conexiones": len(uso), "con_trafico": sum(1 for u in uso.values() if u.paquetes),
+                 "sin_flows": sum(1 for u in uso.values() if not u.flows),
+                 "vencidas": recolector_uso.estadisticas["vencidas"] - vencidas,
+                 "reinstaladas": recolector_uso.estadisticas["reinstaladas"] - reinstaladas}
+    if args.expirar is not None:
+        umbral = leer_segundos(args.expirar)
+        if args.simular:
+            resultado["inactivas"] = [c.handler for c in recolector_uso.inactivas(umbral)]
+        else:
+            resultado["expiradas"], resultado["fallidas"] = recolector_uso.expirar(umbral, args.lote)
+    recolector_uso.guardar(ruta)
+    return resultado
+
+
+def cli_import(args):
+    if args.incremental or args.simular:
+        resultado = reimportar_datos(resolver_archivo(args.archivo), args.simular)
+        if resultado is None:
+            raise ValueError(f"No se pudo importar {args.archivo}")
+        return resultado
+    if not cargar_datos(resolver_archivo(args.archivo)):
+        raise ValueError(f"No se pudo importar {args.archivo}")
+    return {"alumnos": len(alumnos), "cursos": len(cursos), "servidores": len(servidores),
+            "conexiones": len(conexiones)}
+
+
+def cli_export(args):
+    formato = args.formato or ('snap' if args.archivo.endswith('.snap') else 'yaml')
+    if not guardar_datos(args.archivo, formato):
+        raise OSError(f"No se pudo exportar a {args.archivo}")
+    return {"archivo": args.archivo, "formato": formato}
+
+
+# Modo daemon: el estado queda cargado en memoria (con sus índices y la matriz de
+# políticas) y se atiende una API HTTP/JSON local con varias peticiones a la vez. Las
+# consultas toman el cerrojo de lectura; las altas y bajas solo lo toman para registrar
+# el resultado (ver conectar y revocar), así que los flows de muchas conexiones se
+# instalan en paralelo. Las respuestas son las mismas que las de la línea de comandos
+DAEMON_HOST = os.environ.get('UPSM_API_HOST', '127.0.0.1')
+DAEMON_PORT = int(os.environ.get('UPSM_API_PUERTO', '8081'))
+
+FILTROS_LISTADO = ('curso', 'estado_curso', 'mac', 'nombre', 'alumno', 'servidor', 'servicio', 'handler',
+                   'switch', 'orden')
+
+
+def _argumentos(**valores):
+    import argparse
+    return argparse.Namespace(**valores)
+
+
+def _leer_entero(consulta, clave, defecto=None):
+    valor = consulta.get(clave)
+    if valor in (None, ''):
+        return defecto
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError(f"{clave} debe ser un entero") from None
+
+
+def _requeridos(datos, *claves):
+    faltan = [clave for clave in claves if not datos.get(clave)]
+    if faltan:
+        raise ValueError(f"Faltan campos: {', '.join(faltan)}")
+    return [str(datos[clave]) for clave in claves]
+
+
+# Status HTTP de los errores de conectar()
+def _status_conexion(error):
+    if error == ERROR_NO_AUTORIZADO:
+        return 403
+    if error.startswith(ERROR_EXISTE):
+        return 409
+    if error == ERROR_FLOWS:
+        return 502
+    return 404
+
+
+def crear_api(host=DAEMON_HOST, puerto=DAEMON_PORT):
+    api = ServidorAPI(host, puerto, lambda nombre, segundos, status, enviados, recibidos: metricas.registrar(
+        'api', nombre, segundos, status if status >= 400 else None, enviados, recibidos))
+
+    @api.ruta('GET', r'/salud')
+    def salud(consulta, cuerpo):
+        with estado_lock.lectura():
+            datos = {"alumnos": len(alumnos), "cursos": len(cursos), "servidores": len(servidores),
+                     "conexiones": len(conexiones)}
+        datos["escrituras"] = escrituras.estado()
+        datos["reglas_compartidas"] = dict(reglas_compartidas.estado(), activo=reglas_compartidas.activo)
+        return 200, datos
+
+    @api.ruta('GET', r'/huella')
+    def huella(consulta, cuerpo):
+        return 200, huella_flows()
+
+    @api.ruta('GET', r'/metricas')
+    def exportar_metricas(consulta, cuerpo):
+        return 200, metricas.prometheus()
+
+    # El listado se arma dentro del cerrojo (los iteradores de cli_list son perezosos)
+    @api.ruta('GET', r'/(alumnos|cursos|servidores|conexiones|dispositivos)')
+    def listar(entidad, consulta, cuerpo):
+        argumentos = _argumentos(entidad=entidad, estado=ESTADO_CLI, desde=_leer_entero(consulta, 'desde', 0),
+                                 limite=_leer_entero(consulta, 'limite'),
+                                 **{clave: consulta.get(clave) for clave in FILTROS_LISTADO})
+        with estado_lock.lectura():
+            return 200, list(cli_list(argumentos))
+
+    @api.ruta('GET', r'/(alumno|curso|servidor)s/([^/]+)')
+    def detalle(entidad, identificador, consulta, cuerpo):
+        with estado_lock.lectura():
+            return 200, cli_show(_argumentos(entidad=entidad, id=identificador))
+
+    @api.ruta('POST', r'/conexiones')
+    def crear(consulta, cuerpo):
+        codigo, servidor, servicio = _requeridos(cuerpo, 'alumno', 'servidor', 'servicio')
+        conexion, error = conectar(codigo, servidor, servicio.lower())
+        if error:
+            raise ErrorAPI(_status_conexion(error), error.replace("\n", " "))
+        with estado_lock.lectura():
+            return 201, _json_conexion(conexion)
+
+    @api.ruta('DELETE', r'/conexiones/([^/]+)')
+    def borrar(handler, consulta, cuerpo):
+        return 200, cli_disconnect(_argumentos(handler=handler, alumno=None, servidor=None, servicio=None))
+
+    # Borrado por filtro: DELETE /conexiones?alumno=...&servidor=...&servicio=...
+    @api.ruta('DELETE', r'/conexiones')
+    def borrar_filtro(consulta, cuerpo):
+        with estado_lock.lectura():
+            lista = conexiones.buscar(consulta.get('alumno'), consulta.get('servidor'), consulta.get('servicio')) \
+                if consulta.keys() & {'alumno', 'servidor', 'servicio'} else None
+        if lista is None:
+            raise ValueError("Indique al menos un filtro (alumno, servidor, servicio)")
+        revocadas, fallidas = revocar(lista)
+        return 200, {"revocadas": revocadas, "fallidas": fallidas}
+
+    @api.ruta('PUT', r'/cursos/([^/]+)/estado')
+    def estado_curso(curso, consulta, cuerpo):
+        estado, = _requeridos(cuerpo, 'estado')
+        if estado not in ('DICTANDO', 'INACTIVO'):
+            raise ValueError("estado debe ser DICTANDO o INACTIVO")
+        return 200, cli_course_state(_argumentos(curso=curso, nuevo_estado=estado))
+
+    @api.ruta('DELETE', r'/cursos/([^/]+)/alumnos/([^/]+)')
+    def baja(curso, alumno, consulta, cuerpo):
+        return 200, cli_unenroll(_argumentos(curso=curso, alumno=alumno))
+
+    @api.ruta('GET', r'/politicas/acceso')
+    def acceso(consulta, cuerpo):
+        alumno, servidor, servicio = _requeridos(consulta, 'alumno', 'servidor', 'servicio')
+        with estado_lock.lectura():
+            return 200, cli_policy(_argumentos(accion='check', alumno=alumno, servidor=servidor, servicio=servicio))
+
+    @api.ruta('GET', r'/politicas/quienes')
+    def quienes(consulta, cuerpo):
+        servidor, servicio = _requeridos(consulta, 'servidor', 'servicio')
+        with estado_lock.lectura():
+            return 200, list(cli_policy(_argumentos(accion='who', servidor=servidor, servicio=servicio)))
+
+    @api.ruta('GET', r'/alumnos/([^/]+)/accesos')
+    def accesos(alumno, consulta, cuerpo):
+        with estado_lock.lectura():
+            return 200, cli_policy(_argumentos(accion='of', alumno=alumno))
+
+    # Reimportación incremental de un archivo local del servidor: {"archivo": ..., "simular": false}.
+    # Solo YAML: los snapshots se leen con marshal, que no es seguro con datos que llegan
+    # de la red, así que no se aceptan (ni se busca el .snap) y el archivo nunca se lee
+    # como snapshot
+    @api.ruta('POST', r'/importaciones')
+    def reimportar(consulta, cuerpo):
+        archivo, = _requeridos(cuerpo, 'archivo')
+        ruta = archivo if os.path.isfile(archivo) else archivo + '.yaml'
+        if snapshot.es_snapshot(ruta):
+            raise ValueError(f"{archivo} es un snapshot: la API solo reimporta archivos YAML")
+        resultado = reimportar_datos(ruta, bool(cuerpo.get('simular')), solo_yaml=True)
+        if resultado is None:
+            raise ValueError(f"No se pudo importar {archivo}")
+        return 200, resultado
+
+    # POST /politicas/simulacion {"cambios": ["TEL354=INACTIVO", "alta=TEL354:20012482"]}
+    @api.ruta('POST', r'/politicas/simulacion')
+    def simulacion(consulta, cuerpo):
+        cambios = cuerpo.get('cambios')
+        if not isinstance(cambios, list) or not cambios:
+            raise ValueError("cambios debe ser una lista no vacía")
+        with estado_lock.lectura():
+            return 200, cli_policy(_argumentos(accion='what-if', cambios=[str(c) for c in cambios]))
+
+    return api
+
+
+# Atiende la API hasta Ctrl+C. El diario sigue anotando cada mutación y se compacta
+# en segundo plano cuando acumula suficientes registros
+def servir(host=DAEMON_HOST, puerto=DAEMON_PORT):
+    api = crear_api(host, puerto)
+    api.iniciar()
+    parar = threading.Event()
+
+    def compactar_periodicamente():
+        while not parar.wait(1.0):
+            if diario is not None and diario.registros >= JOURNAL_COMPACT_RECORDS:
+                with estado_lock.escritura():
+                    compactar_si_hace_falta()
+
+    threading.Thread(target=compactar_periodicamente, name='compactacion', daemon=True).start()
+    print(f"API escuchando en http://{api.host}:{api.puerto} (Ctrl+C para terminar)")
+    try:
+        api.servir()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        parar.set()
+    escrituras.esperar(CONTROLLER_WRITE_BACKOFF_MAX * 2)
+    return api
+
+
+def cli_serve(args):
+    if FLOW_IDLE_EXPIRY:
+        recolector_uso.cargar(ruta_uso(args.estado))
+        recolector_uso.iniciar()
+    if DEVICE_TRACKER:
+        rastreador.iniciar()
+    try:
+        servir(args.host, args.puerto)
+    finally:
+        rastreador.detener()
+        recolector_uso.detener()
+        if recolector_uso.ultima_recoleccion is not None:
+            recolector_uso.guardar(ruta_uso(args.estado))
+        with estado_lock.escritura():
+            compactar_estado()
+    return {"estado": args.estado, "conexiones": len(conexiones)}
+
+
+def crear_parser():
+    import argparse
+    parser = argparse.ArgumentParser(description="Network Policy manager de la UPSM")
+    parser.add_argument('--estado', default=ESTADO_CLI, help="snapshot con el estado entre invocaciones")
+    parser.add_argument('--controlador', help="URL base del controlador, o varias separadas por comas (por defecto "
+                                              "CONTROLLER_URL)")
+    parser.add_argument('--cluster', default=CONTROLLER_CLUSTER_FILE,
+                        help="archivo con los controladores y sus switches (por defecto UPSM_CLUSTER)")
+    parser.add_argument('--timeout', type=float, help="timeout de cada llamada al controlador (s)")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument('--agregar', action='store_true', default=None,
+                      help="compilar las conexiones con reglas compartidas en los saltos de tránsito")
+    modo.add_argument('--exacto', dest='agregar', action='store_false', default=None,
+                      help="una regla por conexión y salto (por defecto, salvo UPSM_AGREGAR_FLOWS=1)")
+    sub = parser.add_subparsers(dest='comando')
+
+    sub.add_parser('menu', help="menú interactivo")
+
+    p = sub.add_parser('import', help="importar un YAML o snapshot")
+    p.add_argument('archivo')
+    p.add_argument('--incremental', action='store_true',
+                   help="aplicar solo los cambios respecto del estado actual (sin reemplazarlo)")
+    p.add_argument('--simular', action='store_true', help="mostrar los cambios sin aplicarlos")
+    p.set_defaults(funcion=cli_import, modifica=True)
+
+    p = sub.add_parser('list', help="listar entidades (con filtros, orden y paginación)")
+    p.add_argument('entidad', choices=['alumnos', 'cursos', 'servidores', 'conexiones', 'dispositivos'])
+    p.add_argument('--curso', help="alumnos o conexiones de un curso")
+    p.add_argument('--estado-curso', choices=['DICTANDO', 'INACTIVO'], help="cursos en ese estado")
+    p.add_argument('--mac', help="prefijo de MAC (alumnos, dispositivos)")
+    p.add_argument('--nombre', help="texto contenido en el nombre (alumnos, cursos)")
+    p.add_argument('--alumno', help="código de alumno (conexiones)")
+    p.add_argument('--servidor', help="servidor (conexiones)")
+    p.add_argument('--servicio', help="servicio (conexiones)")
+    p.add_argument('--handler', help="texto contenido en el handler (conexiones)")
+    p.add_argument('--switch', help="DPID del switch (dispositivos)")
+    p.add_argument('--orden', help="campo de orden; descendente con '-' (--orden=-nombre)")
+    p.add_argument('--desde', type=int, default=0, help="saltar las primeras N filas")
+    p.add_argument('--limite', type=int, help="mostrar como mucho N filas")
+    p.add_argument('--salida', choices=['json', 'csv', 'plano'], default='json')
+    p.set_defaults(funcion=cli_list, modifica=False)
+
+    p = sub.add_parser('show', help="detalle de una entidad")
+    p.add_argument('entidad', choices=['alumno', 'curso', 'servidor'])
+    p.add_argument('id')
+    p.set_defaults(funcion=cli_show, modifica=False)
+
+    p = sub.add_parser('connect', help="crear una conexión")
+    p.add_argument('alumno')
+    p.add_argument('servidor')
+    p.add_argument('servicio')
+    p.set_defaults(funcion=cli_connect, modifica=True)
+
+    p = sub.add_parser('disconnect', help="borrar una conexión o todas las que cumplan un filtro")
+    p.add_argument('handler', nargs='?')
+    p.add_argument('--alumno')
+    p.add_argument('--servidor')
+    p.add_argument('--servicio')
+    p.set_defaults(funcion=cli_disconnect, modifica=True)
+
+    p = sub.add_parser('course-state', help="cambiar el estado de un curso (revoca accesos al inactivarlo)")
+    p.add_argument('curso')
+    p.add_argument('nuevo_estado', metavar='estado', choices=['DICTANDO', 'INACTIVO'])
+    p.set_defaults(funcion=cli_course_state, modifica=True)
+
+    p = sub.add_parser('unenroll', help="sacar a un alumno de un curso y revocar sus accesos")
+    p.add_argument('curso')
+    p.add_argument('alumno')
+    p.set_defaults(funcion=cli_unenroll, modifica=True)
+
+    p = sub.add_parser('policy', help="consultar la matriz de políticas o simular cambios")
+    acciones = p.add_subparsers(dest='accion', required=True)
+    q = acciones.add_parser('check', help="¿puede el alumno llegar al servicio?")
+    q.add_argument('alumno')
+    q.add_argument('servidor')
+    q.add_argument('servicio')
+    q = acciones.add_parser('who', help="alumnos con acceso a un servicio")
+    q.add_argument('servidor')
+    q.add_argument('servicio')
+    q.add_argument('--salida', choices=['json', 'csv', 'plano'], default='json')
+    q = acciones.add_parser('of', help="accesos de un alumno")
+    q.add_argument('alumno')
+    q = acciones.add_parser('matrix', help="todos los accesos permitidos (alumno, servidor, servicio)")
+    q.add_argument('--salida', choices=['json', 'csv', 'plano'], default='json')
+    q = acciones.add_parser('what-if', help="efecto de cambios hipotéticos, sin aplicarlos")
+    q.add_argument('cambios', nargs='+', metavar='cambio', help="CURSO=ESTADO, alta=CURSO:CODIGO o baja=CURSO:CODIGO")
+    p.set_defaults(funcion=cli_policy, modifica=False)
+
+    p = sub.add_parser('usage', help="recolectar el uso de los flows y expirar conexiones inactivas")
+    p.add_argument('--expirar', metavar='TIEMPO', help="revocar las inactivas hace al menos TIEMPO (s, o 30m, 12h, 7d)")
+    p.add_argument('--lote', type=int, default=FLOW_EXPIRY_BATCH, help="conexiones revocadas por lote")
+    p.add_argument('--simular', action='store_true', help="solo listar las que se expirarían")
+    p.set_defaults(funcion=cli_usage, modifica=True)
+
+    p = sub.add_parser('serve', help="modo daemon: API HTTP/JSON local con el estado en memoria")
+    p.add_argument('--host', default=DAEMON_HOST, help="dirección donde escuchar (por defecto UPSM_API_HOST)")
+    p.add_argument('--puerto', type=int, default=DAEMON_PORT, help="puerto (por defecto UPSM_API_PUERTO)")
+    p.set_defaults(funcion=cli_serve, modifica=True)
+
+    p = sub.add_parser('reconcile', help="reconciliar con el controlador")
+    p.add_argument('--simular', action='store_true', help="solo calcular el plan, sin aplicarlo")
+    p.set_defaults(funcion=cli_reconcile, modifica=True)
+
+    p = sub.add_parser('audit', help="auditar las tablas de flows de los switches")
+    p.add_argument('--reparar', action='store_true', help="reinstalar faltantes y distintos, borrar sobrantes")
+    p.add_argument('--lote', type=int, default=AUDIT_REPAIR_BATCH, help="altas/bajas por lote al reparar")
+    p.add_argument('--workers', type=int, default=AUDIT_WORKERS, help="listados descargados a la vez")
+    p.add_argument('--switch', action='append', help="auditar solo este switch (repetible)")
+    p.set_defaults(funcion=cli_audit, modifica=True)
+
+    p = sub.add_parser('footprint', help="reglas de flows exactas vs. agregadas de las conexiones registradas")
+    p.add_argument('--recompilar', action='store_true', help="reinstalar las conexiones con el modo activo")
+    p.set_defaults(funcion=cli_footprint, modifica=True)
+
+    p = sub.add_parser('export', help="exportar el estado")
+    p.add_argument('archivo')
+    p.add_argument('--formato', choices=['yaml', 'snap'])
+    p.set_defaults(funcion=cli_export, modifica=False)
+    return parser
+
+
+def cli(argv):
+    import contextlib
+    import sys
+
+    args = crear_parser().parse_args(argv)
+    if args.cluster:
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                configurar_cluster(args.cluster)
+        except (OSError, ValueError, KeyError) as e:
+            json.dump({"error": f"No se pudo leer el cluster: {e}"}, sys.stdout, ensure_ascii=False)
+            sys.stdout.write("\n")
+            return 1
+    if args.controlador or args.timeout is not None:
+        configurar_controlador(args.controlador, args.timeout)
+    if args.agregar is not None:
+        reglas_compartidas.activo = args.agregar
+
+    if args.comando in (None, 'menu'):
+        main(args.estado)
+        return 0
+
+    # Los mensajes informativos van a stderr; stdout queda solo para el JSON
+    codigo = 0
+    destino = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        recuperar_estado(args.estado)
+        try:
+            salida = args.funcion(args)
+            if isinstance(salida, Iterator):
+                escribir_listado(salida, args.salida, destino)
+                salida = None
+            # Las mutaciones ya quedaron en el diario; una importación completa reemplaza
+            # todo el estado y se compacta directamente en el snapshot
+            if args.comando == 'import' and not (args.incremental or args.simular):
+                compactar_estado()
+            else:
+                compactar_si_hace_falta()
+        except (LookupError, ValueError, OSError, ConnectionError) as e:
+            salida = {"error": str(e)}
+            codigo = 1
+        finally:
+            cerrar_diario()
+    if salida is not None:
+        json.dump(salida, sys.stdout, ensure_ascii=False, default=list)
+        sys.stdout.write("\n")
+    return codigo
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import sys
+    sys.exit(cli(sys.argv[1:]))
\ No newline at end of file
@@ -0,0 +1,167 @@
+# Instrumentación: contadores, errores por código, bytes transferidos e histogramas de
+# latencia por llamada al controlador y por operación, más indicadores instantáneos
+# (gauges). Con la instrumentación apagada cada punto medido solo comprueba un atributo
+import functools
+import re
+import threading
+import time
+
+# Límites (segundos) de los buckets de los histogramas, como los de Prometheus por defecto
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_DPID = re.compile(r'/[0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){7}(?=/|$)')
+_NUMERO = re.compile(r'/\d+(?=/|$)')
+
+
+# Etiqueta estable para un endpoint: los DPID y números de puerto se reemplazan
+def endpoint(metodo, ruta):
+    ruta = _NUMERO.sub('/<n>', _DPID.sub('/<dpid>', ruta.split('?', 1)[0]))
+    return f"{metodo} {ruta}"
+
+
+class Histograma:
+    __slots__ = ('cuentas', 'suma', 'total')
+
+    def __init__(self):
+        self.cuentas = [0] * (len(BUCKETS) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(BUCKETS):
+            if valor <= limite:
+                break
+        else:
+            i = len(BUCKETS)
+        self.cuentas[i] += 1
+        self.suma += valor
+        self.total += 1
+
+    # Estimación del percentil: límite superior del bucket donde cae
+    def percentil(self, p):
+        if not self.total:
+            return 0.0
+        objetivo = p / 100 * self.total
+        acumulado = 0
+        for i, cuenta in enumerate(self.cuentas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return BUCKETS[i] if i < len(BUCKETS) else float('inf')
+        return float('inf')
+
+
+class Serie:
+    __slots__ = ('llamadas', 'errores', 'bytes_enviados', 'bytes_recibidos', 'latencia')
+
+    def __init__(self):
+        self.llamadas = 0
+        self.errores = {}  # código (status HTTP, 0 sin respuesta, 'excepcion') -> cantidad
+        self.bytes_enviados = 0
+        self.bytes_recibidos = 0
+        self.latencia = Histograma()
+
+
+class Metricas:
+    def __init__(self, activo=True):
+        self.activo = activo
+        self.series = {}  # (tipo, nombre) -> Serie; tipo es 'controlador' u 'operacion'
+        self.indicadores = {}  # nombre -> (ayuda, función): valores instantáneos (gauges)
+        self.desde = time.time()
+        self.lock = threading.Lock()
+
+    def registrar(self, tipo, nombre, segundos, error=None, enviados=0, recibidos=0):
+        with self.lock:
+            serie = self.series.get((tipo, nombre))
+            if serie is None:
+                serie = self.series[(tipo, nombre)] = Serie()
+            serie.llamadas += 1
+            if error is not None:
+                serie.errores[error] = serie.errores.get(error, 0) + 1
+            serie.bytes_enviados += enviados
+            serie.bytes_recibidos += recibidos
+            serie.latencia.observar(segundos)
+
+    # Decorador para medir una operación (cuenta como error si lanza una excepción)
+    def medir(self, nombre):
+        def decorador(funcion):
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                if not self.activo:
+                    return funcion(*args, **kwargs)
+                inicio = time.perf_counter()
+                try:
+                    resultado = funcion(*args, **kwargs)
+                except BaseException:
+                    self.registrar('operacion', nombre, time.perf_counter() - inicio, 'excepcion')
+                    raise
+                self.registrar('operacion', nombre, time.perf_counter() - inicio)
+                return resultado
+            return envoltura
+        return decorador
+
+    # Valor que se lee al exportar, p. ej. la profundidad de una cola
+    def indicador(self, nombre, ayuda, funcion):
+        self.indicadores[nombre] = (ayuda, funcion)
+
+    def reiniciar(self):
+        with self.lock:
+            self.series = {}
+            self.desde = time.time()
+
+    # Filas para mostrar: (tipo, nombre, llamadas, errores, enviados, recibidos, media, p50, p95, p99)
+    def filas(self):
+        with self.lock:
+            series = sorted(self.series.items())
+            filas = []
+            for (tipo, nombre), serie in series:
+                latencia = serie.latencia
+                media = latencia.suma / latencia.total if latencia.total else 0.0
+                filas.append((tipo, nombre, serie.llamadas, dict(serie.errores), serie.bytes_enviados,
+                              serie.bytes_recibidos, media, latencia.percentil(50), latencia.percentil(95),
+                              latencia.percentil(99)))
+            return filas
+
+    # Formato de exposición de texto de Prometheus
+    def prometheus(self):
+        lineas = []
+        with self.lock:
+            series = sorted(self.series.items())
+            for metrica, ayuda, tipo_metrica in (
+                    ('upsm_llamadas_total', 'Llamadas realizadas', 'counter'),
+                    ('upsm_errores_total', 'Llamadas con error por código', 'counter'),
+                    ('upsm_bytes_enviados_total', 'Bytes enviados al controlador', 'counter'),
+                    ('upsm_bytes_recibidos_total', 'Bytes recibidos del controlador', 'counter'),
+                    ('upsm_latencia_segundos', 'Latencia de las llamadas', 'histogram')):
+                lineas.append(f"# HELP {metrica} {ayuda}")
+                lineas.append(f"# TYPE {metrica} {tipo_metrica}")
+                for (tipo, nombre), serie in series:
+                    etiquetas = f'tipo="{tipo}",nombre="{_escapar(nombre)}"'
+                    if metrica == 'upsm_llamadas_total':
+                        lineas.append(f"{metrica}{{{etiquetas}}} {serie.llamadas}")
+                    elif metrica == 'upsm_errores_total':
+                        for codigo, cantidad in sorted(serie.errores.items(), key=lambda e: str(e[0])):
+                            lineas.append(f'{metrica}{{{etiquetas},codigo="{codigo}"}} {cantidad}')
+                    elif metrica == 'upsm_bytes_enviados_total':
+                        lineas.append(f"{metrica}{{{etiquetas}}} {serie.bytes_enviados}")
+                    elif metrica == 'upsm_bytes_recibidos_total':
+                        lineas.append(f"{metrica}{{{etiquetas}}} {serie.bytes_recibidos}")
+                    else:
+                        acumulado = 0
+                        for limite, cuenta in zip(BUCKETS + ('+Inf',), serie.latencia.cuentas):
+                            acumulado += cuenta
+                            lineas.append(f'{metrica}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+                        lineas.append(f"{metrica}_sum{{{etiquetas}}} {serie.latencia.suma}")
+                        lineas.append(f"{metrica}_count{{{etiquetas}}} {serie.latencia.total}")
+        for metrica, (ayuda, funcion) in sorted(self.indicadores.items()):
+            lineas.append(f"# HELP {metrica} {ayuda}")
+            lineas.append(f"# TYPE {metrica} gauge")
+            lineas.append(f"{metrica} {funcion()}")
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self, ruta):
+        with open(ruta, 'w') as archivo:
+            archivo.write(self.prometheus())
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,303 @@
+# Planificador de escrituras al controlador: las mutaciones (altas y bajas de flows) se
+# encolan por prioridad (revocaciones antes que concesiones), se envían con un tope de
+# peticiones por segundo y de escrituras simultáneas, y las que fallan de forma
+# transitoria se reintentan con backoff exponencial con jitter. Las operaciones sobre
+# la misma clave (el nombre del flow) que todavía esperan turno se combinan en una sola
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+PRIORIDAD_REVOCACION = 0
+PRIORIDAD_CONCESION = 1
+
+
+class _Operacion:
+    __slots__ = ('clave', 'cliente', 'metodo', 'ruta', 'datos', 'prioridad', 'futuros', 'intentos', 'orden',
+                 'diferida')
+
+    def __init__(self, clave, cliente, metodo, ruta, datos, prioridad):
+        self.clave = clave
+        self.cliente = cliente
+        self.metodo = metodo
+        self.ruta = ruta
+        self.datos = datos
+        self.prioridad = prioridad
+        self.futuros = []
+        self.intentos = 0
+        self.orden = 0
+        self.diferida = False # esperando el backoff de un reintento
+
+
+class PlanificadorEscrituras:
+    # `reintentable(respuesta)` decide si un fallo es transitorio; `anulada` es el
+    # resultado que reciben las operaciones reemplazadas por otra de sentido contrario
+    # (p. ej. un alta seguida de la baja del mismo flow antes de enviarse)
+    def __init__(self, concurrencia=16, tasa=0.0, rafaga=None, reintentos=4, espera_base=0.1,
+                 espera_maxima=5.0, reintentable=None, anulada=None):
+        self.concurrencia = concurrencia
+        self.tasa = tasa # peticiones por segundo (0 = sin tope)
+        self.rafaga = rafaga or max(1, concurrencia)
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.reintentable = reintentable or (lambda respuesta: False)
+        self.anulada = anulada
+        self.pendientes = {}   # clave -> _Operacion en cola o esperando reintento
+        self.cola = []         # heap (prioridad, orden, clave)
+        self.diferidas = []    # heap (listo_en, orden, clave)
+        self.en_curso = set()  # claves enviadas y todavía sin respuesta
+        self.secuencia = itertools.count(1)
+        self.condicion = threading.Condition()
+        self.lock_tasa = threading.Lock()
+        self.tat = 0.0         # instante teórico de la próxima petición (GCRA)
+        self.hilos = []
+        self.latencia_media = 0.0
+        self.estadisticas = {"enviadas": 0, "completadas": 0, "fallidas": 0, "reintentos": 0, "combinadas": 0,
+                             "anuladas": 0}
+
+    def _iniciar(self):
+        while len(self.hilos) < self.concurrencia:
+            hilo = threading.Thread(target=self._bucle, name=f'escrituras-{len(self.hilos)}', daemon=True)
+            self.hilos.append(hilo)
+            hilo.start()
+
+    # Encola una escritura y devuelve un Future con la respuesta. Si ya hay una
+    # operación pendiente con la misma clave se combina con ella: la última gana y,
+    # si es del mismo tipo, todos reciben la misma respuesta
+    def enviar(self, cliente, metodo, ruta, datos, clave, prioridad=PRIORIDAD_CONCESION):
+        futuro = Future()
+        anulados = []
+        with self.condicion:
+            if not self.hilos:
+                self._iniciar()
+            operacion = self.pendientes.get(clave)
+            if operacion is None:
+                operacion = self.pendientes[clave] = _Operacion(clave, cliente, metodo, ruta, datos, prioridad)
+                self._encolar(operacion)
+            else:
+                self.estadisticas["combinadas"] += 1
+                if operacion.metodo != metodo:
+                    anulados, operacion.futuros = operacion.futuros, []
+                    operacion.intentos = 0
+                    self.estadisticas["anuladas"] += len(anulados)
+                operacion.cliente, operacion.metodo, operacion.ruta, operacion.datos = cliente, metodo, ruta, datos
+                if prioridad < operacion.prioridad:
+                    operacion.prioridad = prioridad
+                    if not operacion.diferida:
+                        self._encolar(operacion)
+            operacion.futuros.append(futuro)
+            self.condicion.notify()
+        for anulado in anulados:
+            anulado.set_result(self.anulada)
+        return futuro
+
+    def _encolar(self, operacion):
+        operacion.orden = next(self.secuencia)
+        operacion.diferida = False
+        heapq.heappush(self.cola, (operacion.prioridad, operacion.orden, operacion.clave))
+
+    # Próxima operación lista (con el lock tomado). Las entradas viejas del heap (de
+    # operaciones combinadas o ya enviadas) se descartan; las de claves con una
+    # escritura en curso se dejan para después, así el orden por clave se respeta
+    def _siguiente(self):
+        ahora = time.monotonic()
+        while self.diferidas and self.diferidas[0][0] <= ahora:
+            _, orden, clave = heapq.heappop(self.diferidas)
+            operacion = self.pendientes.get(clave)
+            if operacion is not None and operacion.orden == orden:
+                self._encolar(operacion)
+        ocupadas = []
+        elegida = None
+        while self.cola:
+            entrada = heapq.heappop(self.cola)
+            operacion = self.pendientes.get(entrada[2])
+            if operacion is None or operacion.orden != entrada[1] or operacion.diferida:
+                continue
+            if operacion.clave in self.en_curso:
+                ocupadas.append(entrada)
+                continue
+            elegida = operacion
+            break
+        for entrada in ocupadas:
+            heapq.heappush(self.cola, entrada)
+        return elegida
+
+    def _espera_diferidas(self):
+        if not self.diferidas:
+            return None
+        return max(0.0, self.diferidas[0][0] - time.monotonic())
+
+    # Tope de peticiones por segundo con ráfagas de hasta `rafaga` peticiones (GCRA)
+    def _esperar_turno(self):
+        if not self.tasa:
+            return
+        intervalo = 1.0 / self.tasa
+        with self.lock_tasa:
+            ahora = time.monotonic()
+            tat = max(self.tat, ahora)
+            salida = max(ahora, tat - (self.rafaga - 1) * intervalo)
+            self.tat = tat + intervalo
+        if salida > ahora:
+            time.sleep(salida - ahora)
+
+    def _backoff(self, intentos):
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** intentos))
+
+    def _bucle(self):
+        while True:
+            with self.condicion:
+                operacion = self._siguiente()
+                while operacion is None:
+                    self.condicion.wait(self._espera_diferidas())
+                    operacion = self._siguiente()
+                del self.pendientes[operacion.clave]
+                self.en_curso.add(operacion.clave)
+                self.estadisticas["enviadas"] += 1
+
+            self._esperar_turno()
+            inicio = time.perf_counter()
+            try:
+                respuesta = operacion.cliente.peticion(operacion.metodo, operacion.ruta, operacion.datos)
+            except Exception as e:
+                print(f"Error en la escritura {operacion.metodo} {operacion.ruta}: {e}")
+                respuesta = self.anulada
+            duracion = time.perf_counter() - inicio
+
+            resueltos = []
+            with self.condicion:
+                self.en_curso.discard(operacion.clave)
+                self.latencia_media = duracion if not self.latencia_media else \
+                    0.9 * self.latencia_media + 0.1 * duracion
+                reintentar = operacion.intentos < self.reintentos and self.reintentable(respuesta)
+                nueva = self.pendientes.get(operacion.clave)
+                if reintentar and nueva is not None:
+                    # Llegó otra operación sobre la misma clave mientras esta se enviaba:
+                    # si es igual, la nueva hace el trabajo; si no, esta queda reemplazada
+                    if nueva.metodo == operacion.metodo:
+                        nueva.futuros.extend(operacion.futuros)
+                    else:
+                        resueltos = operacion.futuros
+                elif reintentar:
+                    operacion.intentos += 1
+                    operacion.orden = next(self.secuencia)
+                    operacion.diferida = True
+                    self.pendientes[operacion.clave] = operacion
+                    heapq.heappush(self.diferidas, (time.monotonic() + self._backoff(operacion.intentos),
+                                                    operacion.orden, operacion.clave))
+                    self.estadisticas["reintentos"] += 1
+                else:
+                    resueltos = operacion.futuros
+                    self.estadisticas["completadas" if getattr(respuesta, 'ok', False) else "fallidas"] += 1
+                self.condicion.notify_all()
+            for futuro in resueltos:
+                futuro.set_result(respuesta)
+
+    # Espera a que no quede nada encolado ni en curso. Devuelve False si venció el timeout
+    def esperar(self, timeout=None):
+        with self.condicion:
+            return self.condicion.wait_for(lambda: not self.pendientes and not self.en_curso, timeout)
+
+    # Profundidad de la cola y tiempo estimado para vaciarla al ritmo actual: el menor
+    # entre el tope de peticiones por segundo y lo que permiten la concurrencia y la
+    # latencia observada
+    def estado(self):
+        with self.condicion:
+            pendientes = len(self.pendientes)
+            diferidas = sum(1 for operacion in self.pendientes.values() if operacion.diferida)
+            en_curso = len(self.en_curso)
+            estadisticas = dict(self.estadisticas)
+            latencia = self.latencia_media
+        ritmo = self.concurrencia / latencia if latencia else float('inf')
+        if self.tasa:
+            ritmo = min(ritmo, self.tasa)
+        total = pendientes + en_curso
+        return dict(estadisticas, pendientes=pendientes, diferidas=diferidas, en_curso=en_curso,
+                    latencia_media=latencia, ritmo=ritmo if ritmo != float('inf') else 0.0,
+                    drenaje=total / ritmo if total and ritmo != float('inf') else 0.0)
+
+
+# Un planificador por controlador (clave: su URL base), cada uno con su propio tope de
+# peticiones por segundo y de escrituras simultáneas: con varios controladores la
+# capacidad total crece con la cantidad de controladores
+class EscriturasPorDestino:
+    def __init__(self, **configuracion):
+        self.configuracion = configuracion
+        self.planificadores = {}
+        self.lock = threading.Lock()
+
+    @property
+    def tasa(self):
+        return self.configuracion.get('tasa', 0.0)
+
+    @tasa.setter
+    def tasa(self, valor):
+        with self.lock:
+            self.configuracion['tasa'] = valor
+            for planificador in self.planificadores.values():
+                planificador.tasa = valor
+
+    @property
+    def concurrencia(self):
+        return self.configuracion.get('concurrencia', 16)
+
+    def de(self, destino):
+        planificador = self.planificadores.get(destino)
+        if planificador is None:
+            with self.lock:
+                planificador = self.planificadores.get(destino)
+                if planificador is None:
+                    planificador = self.planificadores[destino] = PlanificadorEscrituras(**self.configuracion)
+        return planificador
+
+    def enviar(self, cliente, metodo, ruta, datos, clave, prioridad=PRIORIDAD_CONCESION):
+        return self.de(cliente.base_url).enviar(cliente, metodo, ruta, datos, clave, prioridad)
+
+    def esperar(self, timeout=None):
+        limite = time.monotonic() + timeout if timeout is not None else None
+        for planificador in list(self.planificadores.values()):
+            restante = max(0.0, limite - time.monotonic()) if limite is not None else None
+            if not planificador.esperar(restante):
+                return False
+        return True
+
+    # Estado de cada destino: {url: estado}
+    def por_destino(self):
+        return {destino: planificador.estado() for destino, planificador in sorted(self.planificadores.items())}
+
+    # Totales de todos los destinos; la cola se vacía cuando termina el más lento
+    def estado(self):
+        estados = list(self.por_destino().values())
+        total = {"enviadas": 0, "completadas": 0, "fallidas": 0, "reintentos": 0, "combinadas": 0, "anuladas": 0,
+                 "pendientes": 0, "diferidas": 0, "en_curso": 0}
+        for estado in estados:
+            for clave in total:
+                total[clave] += estado[clave]
+        total["ritmo"] = sum(estado["ritmo"] for estado in estados)
+        total["drenaje"] = max((estado["drenaje"] for estado in estados), default=0.0)
+        total["latencia_media"] = max((estado["latencia_media"] for estado in estados), default=0.0)
+        return total
+
+
+# Future que se completa cuando terminan todos: su resultado es el primero que falló
+# (según `ok`) o, si ninguno falló, el primero
+def combinar_futuros(futuros):
+    if len(futuros) == 1:
+        return futuros[0]
+    combinado = Future()
+    restantes = [len(futuros)]
+    lock = threading.Lock()
+
+    def terminado(_):
+        with lock:
+            restantes[0] -= 1
+            if restantes[0]:
+                return
+        resultados = [futuro.result() for futuro in futuros]
+        combinado.set_result(next((r for r in resultados if not getattr(r, 'ok', False)), resultados[0]))
+
+    for futuro in futuros:
+        futuro.add_done_callback(terminado)
+    return combinado
@@ -0,0 +1,221 @@
+# Motor de políticas compilado: cada alumno y cada (servidor, servicio) recibe un índice,
+# y cada curso se reduce a dos bitsets (enteros de Python): sus alumnos y los servicios
+# que permite. La matriz de decisión se guarda por columnas (servicio -> bitset de
+# alumnos autorizados) y por filas (alumno -> bitset de servicios, armadas bajo
+# demanda), así que las consultas individuales son una prueba de bit y las masivas
+# operaciones sobre enteros.
+# Una simulación (what-if) recompila sobre los mismos índices sin tocar el estado real
+import re
+
+ESTADO_ACTIVO = "DICTANDO"
+
+_BITS_BYTE = tuple(tuple(b for b in range(8) if n >> b & 1) for n in range(256))
+_BYTE_NO_NULO = re.compile(b'[^\x00]')
+
+
+def _minusculas(nombre):
+    return str(nombre).lower()
+
+
+# Bitset con los bits de `posiciones` en 1. Se arma en un bytearray: ir haciendo OR
+# sobre un entero grande copiaría el entero en cada paso
+def bitset(posiciones):
+    if not posiciones:
+        return 0
+    datos = bytearray((max(posiciones) >> 3) + 1)
+    for i in posiciones:
+        datos[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(datos, 'little')
+
+
+# Índices de los bits en 1 de un bitset, de menor a mayor. Los bytes nulos se saltan
+# con una búsqueda en C, así que el costo depende sobre todo de los bits en 1
+def indices(bits):
+    datos = bits.to_bytes((bits.bit_length() + 7) >> 3, 'little')
+    resultado = []
+    for encontrado in _BYTE_NO_NULO.finditer(datos):
+        posicion = encontrado.start()
+        base = posicion << 3
+        resultado.extend([base + b for b in _BITS_BYTE[datos[posicion]]])
+    return resultado
+
+
+def contar(bits):
+    return bin(bits).count('1')
+
+
+class PoliticaCurso:
+    __slots__ = ('codigo', 'estado', 'alumnos', 'servicios')
+
+    def __init__(self, codigo, estado, alumnos=0, servicios=0):
+        self.codigo = codigo
+        self.estado = estado
+        self.alumnos = alumnos     # bitset de alumnos
+        self.servicios = servicios # bitset de (servidor, servicio) permitidos
+
+
+class MatrizPoliticas:
+    def __init__(self, codigos, servicios, politicas):
+        self.codigos = codigos                 # índice -> código de alumno
+        self.indice_alumno = {c: i for i, c in enumerate(codigos)}
+        self.servicios = servicios             # índice -> (servidor, servicio)
+        self.indice_servicio = {(_minusculas(srv), _minusculas(svc)): j for j, (srv, svc) in enumerate(servicios)}
+        self.politicas = politicas             # código de curso -> PoliticaCurso
+        self._compilar()
+
+    # Compila desde los objetos del modelo (cursos con alumnos, servidores y
+    # servicios_permitidos). Solo cuentan los servicios que el servidor realmente tiene
+    @classmethod
+    def desde_cursos(cls, cursos):
+        codigos, indice_alumno = [], {}
+        servicios, indice_servicio = [], {}
+        politicas = {}
+        for curso in cursos:
+            posiciones = []
+            for alumno in curso.alumnos:
+                codigo = str(alumno.codigo)
+                i = indice_alumno.get(codigo)
+                if i is None:
+                    i = indice_alumno[codigo] = len(codigos)
+                    codigos.append(codigo)
+                posiciones.append(i)
+            bits_servicios = 0
+            for servidor in curso.servidores:
+                for servicio in curso.servicios_de(servidor):
+                    clave = (_minusculas(servidor.nombre), _minusculas(servicio.nombre))
+                    j = indice_servicio.get(clave)
+                    if j is None:
+                        j = indice_servicio[clave] = len(servicios)
+                        servicios.append((servidor.nombre, servicio.nombre))
+                    bits_servicios |= 1 << j
+            politicas[str(curso.codigo)] = PoliticaCurso(str(curso.codigo), curso.estado, bitset(posiciones),
+                                                         bits_servicios)
+        return cls(codigos, servicios, politicas)
+
+    # Columnas: un OR de bitsets por curso DICTANDO y servicio que permite
+    def _compilar(self):
+        columnas = [0] * len(self.servicios)
+        for politica in self.politicas.values():
+            if politica.estado != ESTADO_ACTIVO or not politica.alumnos:
+                continue
+            alumnos = politica.alumnos
+            for j in indices(politica.servicios):
+                columnas[j] |= alumnos
+        self.columnas = columnas
+        self._filas = None
+
+    # Filas: recorren a cada alumno de cada curso, así que se arman recién con la
+    # primera consulta por alumno
+    @property
+    def filas(self):
+        if self._filas is None:
+            filas = [0] * len(self.codigos)
+            for politica in self.politicas.values():
+                if politica.estado != ESTADO_ACTIVO or not politica.servicios:
+                    continue
+                servicios = politica.servicios
+                for i in indices(politica.alumnos):
+                    filas[i] |= servicios
+            self._filas = filas
+        return self._filas
+
+    def _bit_alumno(self, codigo):
+        return self.indice_alumno.get(str(codigo))
+
+    def _bit_servicio(self, servidor, servicio):
+        return self.indice_servicio.get((_minusculas(servidor), _minusculas(servicio)))
+
+    # ¿Puede el alumno llegar al servicio del servidor?
+    def permitido(self, codigo, servidor, servicio):
+        i = self._bit_alumno(codigo)
+        j = self._bit_servicio(servidor, servicio)
+        return i is not None and j is not None and bool(self.filas[i] >> j & 1)
+
+    # Lo mismo para muchas consultas (codigo, servidor, servicio) a la vez
+    def permitidos(self, consultas):
+        indice_alumno, indice_servicio, filas = self.indice_alumno, self.indice_servicio, self.filas
+        resultado = []
+        for codigo, servidor, servicio in consultas:
+            i = indice_alumno.get(str(codigo))
+            j = indice_servicio.get((_minusculas(servidor), _minusculas(servicio)))
+            resultado.append(i is not None and j is not None and bool(filas[i] >> j & 1))
+        return resultado
+
+    # Cursos DICTANDO que justifican el acceso
+    def cursos_que_autorizan(self, codigo, servidor, servicio):
+        i = self._bit_alumno(codigo)
+        j = self._bit_servicio(servidor, servicio)
+        if i is None or j is None:
+            return []
+        return sorted(p.codigo for p in self.politicas.values()
+                      if p.estado == ESTADO_ACTIVO and p.alumnos >> i & 1 and p.servicios >> j & 1)
+
+    # Alumnos que pueden llegar a un servicio
+    def quienes(self, servidor, servicio):
+        j = self._bit_servicio(servidor, servicio)
+        if j is None:
+            return []
+        return [self.codigos[i] for i in indices(self.columnas[j])]
+
+    # Servicios a los que puede llegar un alumno: [(servidor, servicio)]
+    def accesos(self, codigo):
+        i = self._bit_alumno(codigo)
+        if i is None:
+            return []
+        return [self.servicios[j] for j in indices(self.filas[i])]
+
+    # Resumen por servicio: [(servidor, servicio, alumnos autorizados)]
+    def resumen(self):
+        return [(servidor, servicio, contar(bits)) for (servidor, servicio), bits in zip(self.servicios, self.columnas)]
+
+    def total(self):
+        return sum(contar(bits) for bits in self.columnas)
+
+    # Matriz completa como pares (código, servidor, servicio), por servicio
+    def pares(self):
+        codigos = self.codigos
+        for (servidor, servicio), bits in zip(self.servicios, self.columnas):
+            for i in indices(bits):
+                yield codigos[i], servidor, servicio
+
+    # Nueva matriz con cambios hipotéticos: estados {curso: estado}, altas y bajas
+    # [(curso, código)]. Los índices existentes se comparten; un alumno nuevo se agrega
+    # al final, así que las dos matrices se pueden comparar bit a bit
+    def simular(self, estados=None, altas=(), bajas=()):
+        codigos = list(self.codigos)
+        indice_alumno = dict(self.indice_alumno)
+        politicas = {codigo: PoliticaCurso(p.codigo, p.estado, p.alumnos, p.servicios)
+                     for codigo, p in self.politicas.items()}
+
+        def politica(curso):
+            encontrada = politicas.get(str(curso))
+            if encontrada is None:
+                raise LookupError(f"No se encontró un curso con el código {curso}")
+            return encontrada
+
+        for curso, estado in (estados or {}).items():
+            politica(curso).estado = estado
+        for curso, codigo in altas:
+            codigo = str(codigo)
+            i = indice_alumno.get(codigo)
+            if i is None:
+                i = indice_alumno[codigo] = len(codigos)
+                codigos.append(codigo)
+            politica(curso).alumnos |= 1 << i
+        for curso, codigo in bajas:
+            i = indice_alumno.get(str(codigo))
+            if i is not None:
+                politica(curso).alumnos &= ~(1 << i)
+        return MatrizPoliticas(codigos, self.servicios, politicas)
+
+    # Accesos que se ganan y se pierden al pasar de esta matriz a `otra` (resultado de
+    # simular): ([(código, servidor, servicio)], [(código, servidor, servicio)])
+    def diferencia(self, otra):
+        ganados, perdidos = [], []
+        for j, (servidor, servicio) in enumerate(self.servicios):
+            antes, despues = self.columnas[j], otra.columnas[j]
+            for i in indices(despues & ~antes):
+                ganados.append((otra.codigos[i], servidor, servicio))
+            for i in indices(antes & ~despues):
+                perdidos.append((self.codigos[i], servidor, servicio))
+        return ganados, perdidos
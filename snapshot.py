@@ -0,0 +1,107 @@
+# Snapshot binario del estado: cabecera versionada + tabla de secciones + secciones
+# serializadas con marshal. El archivo se abre con mmap y cada sección se decodifica
+# recién cuando se pide. El formato de marshal puede cambiar entre versiones de
+# Python, así que la cabecera guarda la del intérprete que lo escribió y un snapshot
+# de otra versión se rechaza (hay que regenerarlo desde el YAML)
+import marshal
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'UPSMSNAP'
+VERSION = 2
+PYTHON = sys.version_info[:2]
+
+_CABECERA = struct.Struct('<8sHHBB')  # magic, versión, número de secciones, Python (mayor, menor)
+_ENTRADA = struct.Struct('<16sQQ')    # nombre, offset, longitud
+
+
+class ErrorSnapshot(Exception):
+    pass
+
+
+def es_snapshot(ruta):
+    try:
+        with open(ruta, 'rb') as archivo:
+            return archivo.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+# Escribe {nombre: datos} (tuplas/listas de tipos básicos) de forma atómica
+def escribir_snapshot(ruta, secciones):
+    cuerpos = [(nombre, marshal.dumps(datos)) for nombre, datos in secciones.items()]
+    offset = _CABECERA.size + _ENTRADA.size * len(cuerpos)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'wb') as archivo:
+        archivo.write(_CABECERA.pack(MAGIC, VERSION, len(cuerpos), *PYTHON))
+        for nombre, cuerpo in cuerpos:
+            archivo.write(_ENTRADA.pack(nombre.encode(), offset, len(cuerpo)))
+            offset += len(cuerpo)
+        for _, cuerpo in cuerpos:
+            archivo.write(cuerpo)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+    return offset
+
+
+class Snapshot:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.archivo = open(ruta, 'rb')
+        try:
+            self.mapa = mmap.mmap(self.archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.archivo.close()
+            raise ErrorSnapshot(f"{ruta}: archivo vacío")
+        self.secciones = {}
+        self.cache = {}
+        try:
+            self._leer_tabla()
+        except ErrorSnapshot:
+            self.cerrar()
+            raise
+        except struct.error:
+            self.cerrar()
+            raise ErrorSnapshot(f"{ruta}: cabecera truncada")
+
+    def _leer_tabla(self):
+        magic, version, cantidad, *python = _CABECERA.unpack_from(self.mapa, 0)
+        if magic != MAGIC:
+            raise ErrorSnapshot(f"{self.ruta}: no es un snapshot")
+        if version != VERSION:
+            raise ErrorSnapshot(f"{self.ruta}: versión {version} no soportada (se esperaba {VERSION})")
+        if tuple(python) != PYTHON:
+            raise ErrorSnapshot(f"{self.ruta}: escrito con Python {python[0]}.{python[1]} y este es "
+                                f"{PYTHON[0]}.{PYTHON[1]}; hay que regenerarlo")
+        for i in range(cantidad):
+            nombre, offset, longitud = _ENTRADA.unpack_from(self.mapa, _CABECERA.size + i * _ENTRADA.size)
+            if offset + longitud > len(self.mapa):
+                raise ErrorSnapshot(f"{self.ruta}: sección truncada")
+            self.secciones[nombre.rstrip(b'\0').decode()] = (offset, longitud)
+
+    def nombres(self):
+        return list(self.secciones)
+
+    def seccion(self, nombre, defecto=()):
+        if nombre not in self.secciones:
+            return defecto
+        if nombre not in self.cache:
+            offset, longitud = self.secciones[nombre]
+            try:
+                self.cache[nombre] = marshal.loads(self.mapa[offset:offset + longitud])
+            except (EOFError, ValueError, TypeError) as e:
+                raise ErrorSnapshot(f"{self.ruta}: sección {nombre} corrupta ({e})")
+        return self.cache[nombre]
+
+    def cerrar(self):
+        self.mapa.close()
+        self.archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
@@ -0,0 +1,5 @@
+# Los módulos del proyecto están en la raíz del repositorio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
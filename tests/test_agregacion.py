@@ -0,0 +1,166 @@
+# Reglas compartidas del modo de agregación: una regla se instala con el primer usuario
+# y se borra con el último, contando las conexiones registradas y las reservas de las
+# que se están creando
+from collections import namedtuple
+from concurrent.futures import Future
+
+import main
+from agregacion import ReglasCompartidas, es_compartido, nombre_compartido
+
+Respuesta = namedtuple('Respuesta', 'status ok')
+OK = Respuesta(200, True)
+LISTO = Respuesta(0, True)
+
+
+class Registro:
+    def __init__(self):
+        self.usuarios = {}  # nombre -> {handler}
+
+    def en_uso(self, nombre, excluidos):
+        return bool(self.usuarios.get(nombre, set()) - set(excluidos))
+
+
+class Controlador:
+    def __init__(self):
+        self.altas = []
+        self.bajas = []
+
+    def instalar(self, flow, respuesta=OK):
+        def enviar():
+            self.altas.append(flow['name'])
+            futuro = Future()
+            futuro.set_result(respuesta)
+            return futuro
+        return enviar
+
+    def borrar(self, nombre, respuesta=OK):
+        def enviar():
+            self.bajas.append(nombre)
+            futuro = Future()
+            futuro.set_result(respuesta)
+            return futuro
+        return enviar
+
+
+def regla(acciones='output=2'):
+    match = {"eth_type": "0x0800", "ipv4_dst": "10.0.0.3", "in_port": "1"}
+    return dict(match, name=nombre_compartido('00:00:00:00:00:00:00:01', match), actions=acciones)
+
+
+def reglas(recordar=True):
+    registro = Registro()
+    return registro, ReglasCompartidas(registro.en_uso, LISTO, recordar=recordar, activo=True), Controlador()
+
+
+def test_nombre_estable_y_reconocible():
+    flow = regla()
+    assert es_compartido(flow['name'])
+    match = {"in_port": "1", "ipv4_dst": "10.0.0.3", "eth_type": "0x0800"}
+    assert nombre_compartido('00:00:00:00:00:00:00:01', match) == flow['name']
+    assert nombre_compartido('00:00:00:00:00:00:00:02', match) != flow['name']
+
+
+def test_se_instala_con_el_primero_y_se_borra_con_el_ultimo():
+    registro, compartidas, controlador = reglas()
+    flow = regla()
+    nombre = flow['name']
+    for handler in ('a', 'b', 'c'):
+        assert compartidas.adquirir(flow, handler, controlador.instalar(flow)).result().ok
+    assert controlador.altas == [nombre]
+    registro.usuarios[nombre] = {'a', 'b', 'c'}
+    for handler in ('a', 'b', 'c'):
+        compartidas.soltar(handler)
+
+    # Quedan otros usuarios registrados: la baja se evita
+    registro.usuarios[nombre] = {'b', 'c'}
+    assert compartidas.liberar(nombre, {'a'}, controlador.borrar(nombre)).result() is LISTO
+    registro.usuarios[nombre] = {'c'}
+    compartidas.liberar(nombre, {'b'}, controlador.borrar(nombre)).result()
+    assert controlador.bajas == []
+    del registro.usuarios[nombre]
+    assert compartidas.liberar(nombre, {'c'}, controlador.borrar(nombre)).result().ok
+    assert controlador.bajas == [nombre]
+    assert compartidas.estado() == {"altas": 1, "altas_evitadas": 2, "bajas": 1, "bajas_evitadas": 2,
+                                    "reservadas": 0, "conocidas": 0}
+
+
+def test_revocacion_en_lote_no_cuenta_a_los_del_lote():
+    registro, compartidas, controlador = reglas()
+    nombre = regla()['name']
+    # Siguen en el índice mientras se revocan juntas: `usuarios` las excluye
+    registro.usuarios[nombre] = {'a', 'b'}
+    assert compartidas.liberar(nombre, {'a', 'b'}, controlador.borrar(nombre)).result().ok
+    assert controlador.bajas == [nombre]
+
+
+def test_una_reserva_sin_registrar_evita_la_baja():
+    registro, compartidas, controlador = reglas()
+    flow = regla()
+    nombre = flow['name']
+    compartidas.adquirir(flow, 'nueva', controlador.instalar(flow))
+    assert compartidas.reservada(nombre)
+    registro.usuarios[nombre] = {'vieja'}
+    assert compartidas.liberar(nombre, {'vieja'}, controlador.borrar(nombre)).result() is LISTO
+    assert controlador.bajas == []
+    compartidas.soltar('nueva')
+    assert not compartidas.reservada(nombre)
+    del registro.usuarios[nombre]
+    compartidas.liberar(nombre, {'vieja'}, controlador.borrar(nombre)).result()
+    assert controlador.bajas == [nombre]
+
+
+def test_se_reenvia_si_fallo_cambiaron_las_acciones_o_no_se_recuerda():
+    _, compartidas, controlador = reglas()
+    flow = regla()
+    assert not compartidas.adquirir(flow, 'a', controlador.instalar(flow, Respuesta(500, False))).result().ok
+    compartidas.adquirir(flow, 'b', controlador.instalar(flow))
+    otra = regla('output=3')
+    compartidas.adquirir(otra, 'c', controlador.instalar(otra))
+    compartidas.adquirir(otra, 'd', controlador.instalar(otra))
+    assert len(controlador.altas) == 3
+
+    _, sin_memoria, controlador = reglas(recordar=False)
+    for handler in ('a', 'b'):
+        sin_memoria.adquirir(flow, handler, controlador.instalar(flow))
+    assert len(controlador.altas) == 2
+
+
+def test_timeouts_activados_en_ejecucion(monkeypatch):
+    monkeypatch.setattr(main, 'FLOW_IDLE_TIMEOUT', 0)
+    monkeypatch.setattr(main, 'FLOW_HARD_TIMEOUT', 0)
+    registro, controlador = Registro(), Controlador()
+    # La misma condición que usa la aplicación, leída en cada alta
+    compartidas = ReglasCompartidas(registro.en_uso, LISTO, recordar=main.reglas_compartidas.recordar)
+    flow = regla()
+    for handler in ('a', 'b'):
+        compartidas.adquirir(flow, handler, controlador.instalar(flow))
+    assert len(controlador.altas) == 1
+
+    # Con timeouts el switch puede vencer la regla: cada conexión nueva la reenvía
+    monkeypatch.setattr(main, 'FLOW_IDLE_TIMEOUT', 30)
+    for handler in ('c', 'd'):
+        compartidas.adquirir(flow, handler, controlador.instalar(flow))
+    assert len(controlador.altas) == 3
+
+    # Al quitarlos, la enviada con timeout no cuenta como instalada
+    monkeypatch.setattr(main, 'FLOW_IDLE_TIMEOUT', 0)
+    for handler in ('e', 'f'):
+        compartidas.adquirir(flow, handler, controlador.instalar(flow))
+    assert len(controlador.altas) == 4
+
+
+def test_baja_forzada_y_baja_fallida_de_una_regla_retomada():
+    registro, compartidas, controlador = reglas()
+    nombre = regla()['name']
+    registro.usuarios[nombre] = {'a'}
+    # Sin usuarios se borra aunque alguien la use (p. ej. al sincronizar con la tabla)
+    assert compartidas.liberar(nombre, None, controlador.borrar(nombre)).result().ok
+    assert controlador.bajas == [nombre]
+
+    # Si el DELETE falla pero otra conexión la volvió a tomar, la baja cuenta como hecha
+    del registro.usuarios[nombre]
+    retomada = Future()
+    resultado = compartidas.liberar(nombre, {'a'}, lambda: retomada)
+    registro.usuarios[nombre] = {'b'}
+    retomada.set_result(Respuesta(404, False))
+    assert resultado.result() is LISTO
@@ -0,0 +1,70 @@
+# Despacho de la API del modo daemon: rutas, métodos y errores del cliente
+import json
+import threading
+from http.client import HTTPConnection
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def api():
+    return main.crear_api('127.0.0.1', 0)
+
+
+@pytest.mark.parametrize('cuerpo', [[], ['alumno'], 'x', 1, None])
+@pytest.mark.parametrize('ruta', ['/conexiones', '/importaciones', '/politicas/simulacion'])
+def test_cuerpo_que_no_es_un_objeto(api, ruta, cuerpo):
+    status, datos, nombre = api.despachar('POST', ruta, {}, cuerpo)
+    assert status == 400 and datos == {"error": "El cuerpo debe ser un objeto JSON"}
+    assert nombre == f"POST {ruta}"
+
+
+def test_rutas_y_errores(api):
+    assert api.despachar('POST', '/conexiones', {}, {})[:2] == (400, {"error": "Faltan campos: alumno, servidor, servicio"})
+    assert api.despachar('PUT', '/conexiones', {}, {})[0] == 405
+    assert api.despachar('GET', '/nada', {}, {})[0] == 404
+    assert api.despachar('GET', '/cursos/NOEXISTE', {}, {})[0] == 404
+
+
+def test_por_http(api):
+    api.iniciar()
+    hilo = threading.Thread(target=api.servidor.serve_forever, kwargs={'poll_interval': 0.05})
+    hilo.start()
+    try:
+        conexion = HTTPConnection('127.0.0.1', api.puerto, timeout=5)
+        for crudo, status in ((b'[]', 400), (b'"x"', 400), (b'{', 400), (b'{"alumno": "1"}', 400)):
+            conexion.request('POST', '/conexiones', crudo, {'Content-Type': 'application/json'})
+            respuesta = conexion.getresponse()
+            assert respuesta.status == status
+            assert 'error' in json.loads(respuesta.read())
+        conexion.close()
+    finally:
+        api.servidor.shutdown()
+        api.servidor.server_close()
+        hilo.join()
+
+
+def test_importaciones_solo_acepta_yaml(api, tmp_path, monkeypatch, capsys):
+    def prohibido(*args, **kwargs):
+        raise AssertionError("se leyó un snapshot")
+
+    monkeypatch.setattr(main.snapshot, 'Snapshot', prohibido)
+    falso = tmp_path / 'datos.yaml'
+    falso.write_bytes(main.snapshot.MAGIC + b'\x00' * 32)
+    status, datos, _ = api.despachar('POST', '/importaciones', {}, {"archivo": str(falso)})
+    assert status == 400 and 'snapshot' in datos['error']
+    # Sin extensión no se prueba con .snap
+    (tmp_path / 'estado.snap').write_bytes(main.snapshot.MAGIC)
+    status, datos, _ = api.despachar('POST', '/importaciones', {}, {"archivo": str(tmp_path / 'estado'),
+                                                                    "simular": True})
+    assert status == 400 and datos['error'] == f"No se pudo importar {tmp_path / 'estado'}"
+    # Aunque el archivo cambie después de la verificación, se lee como YAML
+    assert main.reimportar_datos(str(falso), simular=True, solo_yaml=True) is None
+
+    valido = tmp_path / 'vacio.yaml'
+    valido.write_text("alumnos: []\ncursos: []\nservidores: []\n")
+    status, datos, _ = api.despachar('POST', '/importaciones', {}, {"archivo": str(tmp_path / 'vacio'),
+                                                                    "simular": True})
+    assert status == 200 and datos['simulado']
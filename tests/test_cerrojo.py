@@ -0,0 +1,103 @@
+# Cerrojo de lectura/escritura del estado compartido (api.py)
+import threading
+import time
+
+import pytest
+
+from api import CerrojoLecturaEscritura
+
+
+def esperar(condicion, segundos=2):
+    limite = time.monotonic() + segundos
+    while not condicion():
+        if time.monotonic() > limite:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def test_relectura_con_un_escritor_esperando():
+    cerrojo = CerrojoLecturaEscritura()
+    leyendo, releyo, escribio = threading.Event(), threading.Event(), threading.Event()
+
+    # Con preferencia de escritura un lector nuevo esperaría al escritor en cola, pero
+    # este ya tiene el cerrojo: volver a tomarlo no puede bloquearse (el escritor
+    # espera a que lo suelte)
+    def lector():
+        with cerrojo.lectura():
+            leyendo.set()
+            esperar(lambda: cerrojo.esperando == 1)
+            with cerrojo.lectura():
+                releyo.set()
+            assert not escribio.is_set()
+
+    def escritor():
+        with cerrojo.escritura():
+            escribio.set()
+
+    hilo_lector = threading.Thread(target=lector, daemon=True)
+    hilo_lector.start()
+    assert leyendo.wait(2)
+    hilo_escritor = threading.Thread(target=escritor, daemon=True)
+    hilo_escritor.start()
+    assert releyo.wait(2)
+    assert escribio.wait(2)
+    hilo_lector.join(2)
+    assert cerrojo.lectores == 0 and cerrojo.escritor is None
+
+
+def test_lector_nuevo_espera_al_escritor_en_cola():
+    cerrojo = CerrojoLecturaEscritura()
+    orden = []
+
+    def escritor():
+        with cerrojo.escritura():
+            orden.append('escritura')
+
+    def lector():
+        with cerrojo.lectura():
+            orden.append('lectura')
+
+    with cerrojo.lectura():
+        hilo_escritor = threading.Thread(target=escritor, daemon=True)
+        hilo_escritor.start()
+        assert esperar(lambda: cerrojo.esperando == 1)
+        hilo_lector = threading.Thread(target=lector, daemon=True)
+        hilo_lector.start()
+        time.sleep(0.05)
+        assert orden == []
+    hilo_escritor.join(2)
+    hilo_lector.join(2)
+    assert orden == ['escritura', 'lectura']
+
+
+def test_lectura_dentro_de_escritura():
+    cerrojo = CerrojoLecturaEscritura()
+    with cerrojo.escritura():
+        with cerrojo.lectura():
+            with cerrojo.escritura():
+                assert cerrojo.profundidad == 3
+        assert cerrojo.escritor == threading.get_ident()
+    assert cerrojo.escritor is None and cerrojo.lectores == 0
+
+    # Liberado del todo: otro hilo puede escribir
+    escribio = threading.Event()
+
+    def escritor():
+        with cerrojo.escritura():
+            escribio.set()
+
+    threading.Thread(target=escritor, daemon=True).start()
+    assert escribio.wait(2)
+
+
+def test_no_se_puede_pasar_de_lectura_a_escritura():
+    cerrojo = CerrojoLecturaEscritura()
+    with cerrojo.lectura():
+        with pytest.raises(RuntimeError):
+            with cerrojo.escritura():
+                pass
+        assert cerrojo.lectores == 1 and cerrojo.esperando == 0
+    # El intento fallido no deja nada tomado
+    with cerrojo.escritura():
+        assert cerrojo.lectores == 0
@@ -0,0 +1,92 @@
+# Reparto de switches entre controladores y combinación de lecturas repartidas
+from types import SimpleNamespace
+
+from cluster import MapaSwitches, combinar, filtrar_dispositivo
+
+DPIDS = [f"00:00:00:00:00:00:{i >> 8:02x}:{i & 0xff:02x}" for i in range(2000)]
+
+
+def controladores(n):
+    return [SimpleNamespace(base_url=f"http://10.0.0.{i + 1}:8080") for i in range(n)]
+
+
+def repartir(mapa):
+    return {dpid: mapa.dueno(dpid) for dpid in DPIDS}
+
+
+def test_dueno_estable_y_asignados_explicitos():
+    a, b, c = controladores(3)
+    mapa = MapaSwitches([a, b, c], asignados={'00:00:00:00:00:00:00:0A': c})
+    assert mapa.dueno('00:00:00:00:00:00:00:0a') is c
+    assert mapa.dueno(DPIDS[5]) is mapa.dueno(DPIDS[5].upper())
+    reparto, sin_asignados = repartir(mapa), repartir(MapaSwitches([a, b, c]))
+    del reparto[DPIDS[10]], sin_asignados[DPIDS[10]]
+    assert reparto == sin_asignados
+    # Con nodos virtuales el reparto queda razonablemente parejo
+    cuenta = [sum(d is m for d in reparto.values()) for m in (a, b, c)]
+    assert min(cuenta) > len(DPIDS) / 3 * 0.7
+
+
+def test_agregar_un_controlador_solo_mueve_switches_hacia_el():
+    miembros = controladores(4)
+    antes = repartir(MapaSwitches(miembros[:3]))
+    despues = repartir(MapaSwitches(miembros))
+    movidos = [dpid for dpid in DPIDS if antes[dpid] is not despues[dpid]]
+    assert all(despues[dpid] is miembros[3] for dpid in movidos)
+    # Se mueve aproximadamente la parte que le toca al nuevo (1/4), no todo el reparto
+    assert 0.15 < len(movidos) / len(DPIDS) < 0.35
+
+
+def test_quitar_el_ultimo_controlador_solo_mueve_sus_switches():
+    miembros = controladores(4)
+    antes = repartir(MapaSwitches(miembros))
+    despues = repartir(MapaSwitches(miembros[:3]))
+    for dpid in DPIDS:
+        if antes[dpid] is not miembros[3]:
+            assert despues[dpid] is antes[dpid]
+
+
+def test_quitar_un_controlador_del_medio_solo_mueve_sus_switches():
+    miembros = controladores(4)
+    antes = repartir(MapaSwitches(miembros))
+    despues = repartir(MapaSwitches(miembros[:1] + miembros[2:]))
+    movidos = [dpid for dpid in DPIDS if antes[dpid] is not despues[dpid]]
+    assert movidos and all(antes[dpid] is miembros[1] for dpid in movidos)
+    # El reparto tampoco depende del orden en que se configuran los controladores
+    assert repartir(MapaSwitches(miembros[::-1])) == antes
+
+
+def dispositivo(mac, *dpids):
+    return {'mac': [mac], 'attachmentPoint': [{'switchDPID': d, 'port': 1} for d in dpids]}
+
+
+def test_filtrar_dispositivo():
+    a, b = controladores(2)
+    s_a, s_b = '00:00:00:00:00:00:00:01', '00:00:00:00:00:00:00:02'
+    mapa = MapaSwitches([a, b], asignados={s_a: a, s_b: b})
+    ambos = dispositivo('aa', s_a, s_b)
+    assert filtrar_dispositivo(ambos, a, mapa)['attachmentPoint'] == [{'switchDPID': s_a, 'port': 1}]
+    assert ambos['attachmentPoint'][1]['switchDPID'] == s_b
+    propio = dispositivo('bb', s_b)
+    assert filtrar_dispositivo(propio, b, mapa) is propio
+    assert filtrar_dispositivo(propio, a, mapa) is None
+    suelto = {'mac': ['cc'], 'attachmentPoint': []}
+    assert filtrar_dispositivo(suelto, a, mapa) is suelto
+
+
+def test_combinar():
+    a, b = controladores(2)
+    s_a, s_b = '00:00:00:00:00:00:00:01', '00:00:00:00:00:00:00:02'
+    mapa = MapaSwitches([a, b], asignados={s_a: a, s_b: b})
+    # Dispositivos: cada controlador informa los de sus switches, sin repetir MACs
+    dispositivos = combinar('/wm/device/', [(a, {'devices': [dispositivo('aa', s_a), dispositivo('bb', s_b)]}),
+                                            (b, [dispositivo('bb', s_b), dispositivo('cc', s_a, s_b)])], mapa)
+    assert [d['mac'] for d in dispositivos] == [['aa'], ['bb'], ['cc']]
+    assert dispositivos[2]['attachmentPoint'] == [{'switchDPID': s_b, 'port': 1}]
+    # Diccionarios de listas: se concatenan por clave
+    flows = combinar('/wm/staticflowpusher/list/all/json',
+                     [(a, {s_a: [{'f1': {}}], 'x': 1}), (b, {s_a: [{'f2': {}}], s_b: [{'f3': {}}], 'x': 2})], mapa)
+    assert flows == {s_a: [{'f1': {}}, {'f2': {}}], s_b: [{'f3': {}}], 'x': 1}
+    # Listas: se unen sin repetidos, conservando el orden
+    enlaces = combinar('/wm/topology/links/json', [(a, [{'src': 1}, {'src': 2}]), (b, [{'src': 2}, {'src': 3}])], mapa)
+    assert enlaces == [{'src': 1}, {'src': 2}, {'src': 3}]
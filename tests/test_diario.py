@@ -0,0 +1,70 @@
+# Diario: una escritura fallida no pierde registros ni detiene el hilo de escritura
+import errno
+import os
+
+import pytest
+
+import diario as modulo_diario
+from diario import Diario, leer_diario
+
+
+@pytest.fixture
+def disco_lleno(monkeypatch):
+    fsync = os.fsync
+    estado = {"lleno": True}
+
+    def falla(fd):
+        if estado["lleno"]:
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        fsync(fd)
+
+    monkeypatch.setattr(modulo_diario.os, 'fsync', falla)
+    monkeypatch.setattr(modulo_diario, 'REINTENTO', 0.01)
+    return estado
+
+
+def test_reintenta_sin_perder_registros(tmp_path, disco_lleno):
+    ruta = str(tmp_path / 'estado.snap.diario')
+    diario = Diario(ruta, lote=2, intervalo=0.001)
+    diario.anotar(('conexion', 1))
+    with pytest.raises(OSError, match='diario'):
+        diario.anotar(('conexion', 2))
+    assert diario.error is not None
+    # Lo escrito a medias se recortó
+    assert os.path.getsize(ruta) == 0
+    with pytest.raises(OSError):
+        diario.anotar(('conexion', 3))
+    assert diario.hilo.is_alive()
+
+    disco_lleno["lleno"] = False
+    diario.anotar(('conexion', 4))
+    assert diario.error is None
+    diario.cerrar()
+    assert leer_diario(ruta)[0] == [('conexion', 1), ('conexion', 2), ('conexion', 3), ('conexion', 4)]
+
+
+def test_el_hilo_sobrevive_y_escribe_al_recuperarse(tmp_path, disco_lleno):
+    ruta = str(tmp_path / 'estado.snap.diario')
+    diario = Diario(ruta, lote=100, intervalo=0.001)
+    diario.anotar(('conexion', 1))
+    # El hilo intenta escribir, falla y sigue reintentando
+    for _ in range(200):
+        if diario.error is not None:
+            break
+        diario.hilo.join(0.01)
+    assert diario.error is not None and diario.hilo.is_alive()
+    disco_lleno["lleno"] = False
+    for _ in range(200):
+        if diario.error is None:
+            break
+        diario.hilo.join(0.01)
+    assert diario.error is None
+    assert leer_diario(ruta)[0] == [('conexion', 1)]
+    diario.cerrar()
+
+
+def test_cerrar_informa_lo_que_no_se_pudo_escribir(tmp_path, disco_lleno):
+    diario = Diario(str(tmp_path / 'estado.snap.diario'), lote=100, intervalo=0.05)
+    diario.anotar(('conexion', 1))
+    with pytest.raises(OSError, match='1 registros pendientes'):
+        diario.cerrar()
@@ -0,0 +1,140 @@
+# Diferencia estructural entre estados y reimportación incremental aplicada en el lugar
+import pytest
+import yaml
+
+import main
+from diferencias import Diferencia, diferencia
+
+ACTUAL = {
+    'alumnos': (('Ana', 1, 'aa'), ('Luis', 2, 'bb'), ('Eva', 3, 'cc')),
+    'servidores': (('S1', '10.0.0.1', (('ssh', 'TCP', 22), ('web', 'TCP', 80))),
+                   ('S2', '10.0.0.2', (('ftp', 'TCP', 21),))),
+    'cursos': (('C1', 'Redes', 'DICTANDO', (1, 2), (('S1', ('ssh',)),)),
+               ('C2', 'Otro', 'DICTANDO', (3,), (('S2', ('ftp',)),))),
+}
+
+
+def test_sin_cambios():
+    cambios = diferencia(ACTUAL, ACTUAL)
+    assert not cambios and cambios.registros == []
+    assert not any(cambios.resumen().values())
+
+
+def test_registros_de_altas_bajas_y_modificaciones():
+    nuevo = {
+        'alumnos': (('Ana', 1, 'aa'), ('Luis Pérez', 2, 'b2'), ('Iván', 4, 'dd')),
+        'servidores': (('S1', '10.0.0.9', (('SSH', 'TCP', 2222), ('dns', 'UDP', 53))),
+                       ('S3', '10.0.0.3', ())),
+        'cursos': (('C1', 'Redes', 'TERMINADO', (1, 4), (('S1', ('ssh',)),)),
+                   ('C3', 'Nuevo', 'PENDIENTE', (), ())),
+    }
+    cambios = diferencia(ACTUAL, nuevo)
+    # Primero se fijan servidores, alumnos y cursos; después se quitan en orden inverso
+    assert cambios.registros == [
+        ('servidor', 'S1', '10.0.0.9', (('SSH', 'TCP', 2222), ('dns', 'UDP', 53))),
+        ('servidor', 'S3', '10.0.0.3', ()),
+        ('alumno', 'Luis Pérez', 2, 'b2'),
+        ('alumno', 'Iván', 4, 'dd'),
+        ('curso', 'C1', 'Redes', 'TERMINADO', (1, 4), (('S1', ('ssh',)),)),
+        ('curso', 'C3', 'Nuevo', 'PENDIENTE', (), ()),
+        ('sin_curso', 'C2'),
+        ('sin_alumno', 3),
+        ('sin_servidor', 'S2'),
+    ]
+    assert cambios.ips == ['S1'] and cambios.servidores_nuevos == ['S3'] and cambios.servidores_quitados == ['S2']
+    # Los nombres de servicio se comparan sin distinguir mayúsculas
+    assert cambios.servicios_cambiados == [('S1', 'SSH')]
+    assert cambios.servicios_nuevos == [('S1', 'dns')] and cambios.servicios_quitados == [('S1', 'web')]
+    assert cambios.macs == [2] and cambios.renombrados == [2]
+    assert cambios.alumnos_nuevos == [4] and cambios.alumnos_quitados == [3]
+    assert cambios.cursos_nuevos == ['C3'] and cambios.cursos_quitados == ['C2']
+    assert cambios.estados == [('C1', 'DICTANDO', 'TERMINADO')]
+    assert cambios.altas == [('C1', '4')] and cambios.bajas == [('C1', '2')]
+    # C1 deja de dictarse y C2 desaparece: sus alumnos pueden perder accesos
+    assert cambios.revisar_alumnos == {'1', '2', '3'}
+    assert cambios.revisar_servicios == {('S1', 'web'), ('S2', 'ftp')}
+
+
+def test_curso_con_otros_servicios():
+    nuevo = dict(ACTUAL, cursos=(('C1', 'Redes', 'DICTANDO', (2, 1), (('s1', ('ssh', 'web')),)),
+                                 ACTUAL['cursos'][1]))
+    cambios = diferencia(ACTUAL, nuevo)
+    assert cambios.cursos_cambiados == ['C1'] and not cambios.altas and not cambios.bajas
+    assert cambios.revisar_alumnos == {'1', '2'}
+    # Solo cambia el orden de los miembros: no hay nada que hacer
+    nuevo = dict(ACTUAL, cursos=(('C1', 'Redes', 'DICTANDO', (2, 1), (('S1', ('ssh',)),)),
+                                 ACTUAL['cursos'][1]))
+    assert not diferencia(ACTUAL, nuevo)
+
+
+class ControladorProhibido:
+    def __getattr__(self, nombre):
+        raise AssertionError(f"llamada al controlador: {nombre}")
+
+
+@pytest.fixture
+def estado(monkeypatch):
+    monkeypatch.setattr(main, 'controlador', ControladorProhibido())
+    web = main.Servicio('web', 'TCP', 80)
+    servidor = main.Servidor('Servidor 1', '10.0.0.3', [web, main.Servicio('ssh', 'TCP', 22)])
+    ana = main.Alumno('Ana', 20210001, 'fa:16:3e:00:00:01')
+    luis = main.Alumno('Luis', 20210002, 'fa:16:3e:00:00:02')
+    curso = main.Curso('Redes', 'DICTANDO', 'TEL354')
+    curso.add_alumno(ana)
+    curso.add_servidor(servidor, ['web'])
+    main.alumnos.reemplazar([ana, luis])
+    main.servidores.reemplazar([servidor])
+    main.cursos.reemplazar([curso])
+    main.indice_autorizacion.construir(main.cursos)
+    main.conexiones.reemplazar([main.Conexion('20210001-Servidor 1-web', ana, servidor, web,
+                                              ['20210001-Servidor 1-web.0.ida'])])
+    yield
+    for registro in (main.alumnos, main.servidores, main.cursos, main.conexiones):
+        registro.reemplazar([])
+
+
+def archivo(tmp_path, cambiar):
+    datos = main.datos_estado_yaml()
+    del datos['conexiones']
+    cambiar(datos)
+    ruta = tmp_path / 'nuevo.yaml'
+    ruta.write_text(yaml.safe_dump(datos, allow_unicode=True))
+    return str(ruta)
+
+
+def test_simular_no_cambia_el_estado(estado, tmp_path):
+    def cambiar(datos):
+        datos['servidores'][0]['servicios'][0]['puerto'] = 8080
+        datos['alumnos'][1]['mac'] = 'fa:16:3e:00:00:22'
+
+    ruta = archivo(tmp_path, cambiar)
+    antes = main.secciones_estado()
+    resultado = main.reimportar_datos(ruta, simular=True)
+    assert resultado['servicios_cambiados'] == 1 and resultado['macs'] == 1
+    assert resultado['conexiones_a_reinstalar'] == ['20210001-Servidor 1-web']
+    assert main.secciones_estado() == antes
+
+
+def test_reimportacion_incremental_en_el_lugar(estado, tmp_path):
+    servidor = main.servidores.get('Servidor 1')
+    conexion = main.conexiones.get('20210001-Servidor 1-web')
+
+    def cambiar(datos):
+        datos['alumnos'][1]['nombre'] = 'Luis Pérez'
+        datos['alumnos'].append({'nombre': 'Eva', 'codigo': 20210003, 'mac': 'fa:16:3e:00:00:03'})
+        datos['cursos'][0]['alumnos'] += [20210002, 20210003]
+        datos['servidores'].append({'nombre': 'Servidor 2', 'ip': '10.0.0.4', 'servicios': []})
+
+    ruta = archivo(tmp_path, cambiar)
+    resultado = main.reimportar_datos(ruta)
+    assert resultado['alumnos_nuevos'] == 1 and resultado['alumnos_renombrados'] == 1
+    assert resultado['altas'] == 2 and resultado['servidores_nuevos'] == 1
+    assert resultado['conexiones_revocadas'] == [] and resultado['conexiones_reinstaladas'] == []
+    # Los objetos vigentes se conservan: la conexión sigue apuntando a ellos
+    assert main.servidores.get('Servidor 1') is servidor is conexion.servidor
+    assert conexion.alumno is main.alumnos.get('20210001')
+    assert main.alumnos.get('20210002').nombre == 'Luis Pérez'
+    assert main.autorizar(main.alumnos.get('20210003'), 'Servidor 1', 'web')
+    # Volver a importar el mismo archivo no encuentra diferencias
+    resultado = main.reimportar_datos(ruta)
+    assert not any(resultado[clave] for clave in Diferencia().resumen())
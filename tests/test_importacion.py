@@ -0,0 +1,100 @@
+# Importación del YAML en streaming: bloques en cualquier orden, anclas, MACs que YAML
+# 1.1 lee como números y documentos truncados
+import io
+
+import pytest
+import yaml
+
+import main
+
+DOCUMENTO = """\
+cursos:
+  - codigo: TEL354
+    nombre: Redes
+    estado: DICTANDO
+    alumnos: [20210001, 20210002, 20219999]
+    servidores:
+      - nombre: Servidor 1
+        servicios_permitidos: [ssh]
+      - nombre: Servidor 9
+  - codigo: TEL355
+    nombre: Otro
+    estado: PENDIENTE
+    alumnos: [20210001]
+    servidores:
+      - nombre: Servidor 1
+        servicios_permitidos: [ssh, web]
+alumnos:
+  - {nombre: Ana, codigo: 20210001, mac: 'fa:16:3e:00:00:01'}
+  - {nombre: Luis, codigo: 20210002, mac: 44:11:22:44:37:25}
+servidores:
+  - nombre: Servidor 1
+    ip: 10.0.0.3
+    servicios: &servicios
+      - {nombre: ssh, protocolo: TCP, puerto: 22}
+      - {nombre: web, protocolo: TCP, puerto: 80}
+  - nombre: Servidor 2
+    ip: 10.0.0.4
+    servicios: *servicios
+"""
+
+
+def leer(texto):
+    return main.leer_datos_yaml(io.BytesIO(texto.encode()))
+
+
+def test_bloques_en_cualquier_orden_y_servidores_compartidos(capsys):
+    alumnos, cursos, servidores = leer(DOCUMENTO)[:3]
+    assert [a.codigo for a in alumnos] == [20210001, 20210002]
+    assert [s.nombre for s in servidores] == ['Servidor 1', 'Servidor 2']
+    redes, otro = cursos
+    # Los cursos vienen antes que los servidores: se enlazan al mismo objeto
+    assert list(redes.servidores)[0] is servidores[0]
+    assert list(otro.servidores)[0] is servidores[0]
+    assert redes.servicios_permitidos['Servidor 1'] == {'ssh'}
+    assert otro.servicios_permitidos['Servidor 1'] == {'ssh', 'web'}
+    assert [a.codigo for a in redes.alumnos] == [20210001, 20210002]
+    salida = capsys.readouterr().out
+    assert '20219999' in salida and 'Servidor 9' in salida
+
+
+def test_anclas_y_escalares():
+    alumnos, _, servidores = leer(DOCUMENTO)[:3]
+    # Una MAC sin comillas con grupos decimales < 60 se lee como entero sexagesimal
+    assert alumnos[1].mac == '44:11:22:44:37:25'
+    servicios_1, servicios_2 = list(servidores[0].servicios), list(servidores[1].servicios)
+    assert [(s.nombre, s.protocolo, s.puerto) for s in servicios_2] == [('ssh', 'TCP', 22), ('web', 'TCP', 80)]
+    # El ancla se reutiliza como datos, pero cada servidor tiene sus propios servicios
+    assert servicios_2[0] is not servicios_1[0]
+
+
+def test_bloques_con_elementos_de_a_uno():
+    bloques = list(main.leer_bloques_yaml(io.BytesIO(DOCUMENTO.encode())))
+    assert [bloque for bloque, _ in bloques] == ['cursos', 'cursos', 'alumnos', 'alumnos', 'servidores', 'servidores']
+    # Los escalares se resuelven igual que con el loader completo
+    assert bloques[3][1] == {'nombre': 'Luis', 'codigo': 20210002, 'mac': yaml.safe_load('44:11:22:44:37:25')}
+
+
+def test_documento_vacio_o_sin_bloques():
+    assert [list(parte) for parte in leer('')[:3]] == [[], [], []]
+    assert [list(parte) for parte in leer('alumnos:\n')[:3]] == [[], [], []]
+
+
+@pytest.mark.parametrize('corte', [
+    DOCUMENTO.index('servicios: *servicios') + 4,   # a mitad de una clave
+    DOCUMENTO.index("'fa:16") + 4,                  # dentro de un escalar entre comillas
+    DOCUMENTO.index('[20210001, 2021') + 5,         # dentro de una secuencia en línea
+])
+def test_documento_truncado(corte):
+    # Un archivo cortado no se importa a medias: el parser falla
+    with pytest.raises(yaml.YAMLError):
+        leer(DOCUMENTO[:corte])
+
+
+def test_un_archivo_truncado_no_cambia_el_estado(tmp_path, capsys):
+    ruta = tmp_path / 'datos.yaml'
+    ruta.write_text(DOCUMENTO[:DOCUMENTO.index("'fa:16") + 4])
+    antes = list(main.alumnos)
+    assert not main.cargar_datos(str(ruta))
+    assert list(main.alumnos) == antes
+    assert 'Error al cargar el archivo' in capsys.readouterr().out
@@ -0,0 +1,127 @@
+# Listados grandes: paginación perezosa, formatos de salida y lectura en streaming de
+# los arreglos JSON del controlador
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import listados
+import main
+
+
+def test_paginas_perezosas():
+    leidas = []
+
+    def filas():
+        for i in range(7):
+            leidas.append(i)
+            yield (i,)
+
+    paginas = listados.paginas(filas(), 3)
+    pagina, hay_mas = next(paginas)
+    assert pagina == [(0,), (1,), (2,)] and hay_mas
+    # Solo se leyó una página más para saber si hay otra
+    assert leidas == list(range(6))
+    assert [(len(p), mas) for p, mas in paginas] == [(3, True), (1, False)]
+    assert list(listados.paginas(iter(()), 3)) == []
+    assert list(listados.paginas([(1,), (2,), (3,)], 3)) == [([(1,), (2,), (3,)], False)]
+
+
+def test_mostrar_corta_cuando_no_se_continua():
+    salida = io.StringIO()
+    pedidas = []
+
+    def continuar(numero, mostradas):
+        pedidas.append((numero, mostradas))
+        return numero < 2
+
+    mostradas = listados.mostrar(['a', 'b'], ((i, i * i) for i in range(10)), 'plano', 3, continuar, salida)
+    assert mostradas == 6 and pedidas == [(1, 3), (2, 6)]
+    assert salida.getvalue().splitlines()[:3] == ['a\tb', '0\t0', '1\t1']
+
+
+def test_mostrar_csv_y_formato_invalido():
+    salida = io.StringIO()
+    assert listados.mostrar(['nombre', 'mac'], [('Ana, Luis', 'fa:16')], 'csv', salida=salida) == 1
+    assert salida.getvalue().splitlines() == ['nombre,mac', '"Ana, Luis",fa:16']
+    with pytest.raises(ValueError):
+        listados.mostrar(['a'], [], 'xml')
+
+
+def test_ordenar_y_leer_opciones():
+    claves = {'nombre': lambda x: x}
+    assert listados.ordenar(iter(['b', 'a', 'c']), '-nombre', claves) == ['c', 'b', 'a']
+    with pytest.raises(ValueError):
+        listados.ordenar([], 'edad', claves)
+    assert listados.leer_opciones('servidor="Servidor 1" orden=-nombre', ('servidor', 'orden')) == \
+        {'servidor': 'Servidor 1', 'orden': '-nombre'}
+    with pytest.raises(ValueError):
+        listados.leer_opciones('color=rojo', ('servidor',))
+
+
+# Servidor HTTP local que responde el cuerpo configurado en trozos. `cortar`: None (completa),
+# 'cierre' (sin Content-Length, se cierra la conexión donde termina el cuerpo) o 'largo'
+# (anuncia más bytes de los que envía)
+class Respuestas(BaseHTTPRequestHandler):
+    cuerpos = {}
+
+    def do_GET(self):
+        cuerpo, cortar = self.cuerpos[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if cortar != 'cierre':
+            self.send_header('Content-Length', str(len(cuerpo) + (100 if cortar else 0)))
+        self.end_headers()
+        for i in range(0, len(cuerpo), 4096):
+            self.wfile.write(cuerpo[i:i + 4096])
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def controlador():
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Respuestas)
+    threading.Thread(target=servidor.serve_forever, args=(0.05,), daemon=True).start()
+    cliente = main.ClienteControlador(f"http://127.0.0.1:{servidor.server_address[1]}", timeout=5)
+    yield cliente
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def leer_todo(generador):
+    elementos = []
+    while True:
+        try:
+            elementos.append(next(generador))
+        except StopIteration as fin:
+            return elementos, fin.value
+
+
+def test_elementos_de_un_arreglo_en_trozos(controlador):
+    dispositivos = [{"mac": [f"fa:16:3e:00:00:{i:02x}"], "nota": "ñandú [, ]"} for i in range(20)]
+    Respuestas.cuerpos['/lista'] = (main.json.dumps(dispositivos).encode(), None)
+    Respuestas.cuerpos['/objeto'] = (main.json.dumps({"otra": [1], "devices": dispositivos}).encode(), None)
+    assert leer_todo(controlador.elementos('/lista')) == (dispositivos, True)
+    assert leer_todo(controlador.elementos('/objeto', 'devices')) == (dispositivos, True)
+
+
+def test_elementos_de_una_respuesta_truncada(controlador, capsys):
+    esperados = [{"n": i, "relleno": "x" * 50} for i in range(3000)]
+    cuerpo = main.json.dumps(esperados).encode()
+    corte = cuerpo.index(b'{"n": 2500') + 5
+    # El cuerpo termina a mitad de un elemento: se entregan los completos y la lectura
+    # se informa incompleta
+    Respuestas.cuerpos['/cerrada'] = (cuerpo[:corte], 'cierre')
+    assert leer_todo(controlador.elementos('/cerrada')) == (esperados[:2500], False)
+    # La conexión se corta antes del largo anunciado: lo que llegó antes del error es
+    # un prefijo de lo esperado
+    Respuestas.cuerpos['/cortada'] = (cuerpo[:corte], 'largo')
+    elementos, completo = leer_todo(controlador.elementos('/cortada'))
+    assert not completo and elementos == esperados[:len(elementos)]
+    assert 'incompleta' in capsys.readouterr().out
+
+    Respuestas.cuerpos['/no_json'] = (b'<html>error</html>', None)
+    assert leer_todo(controlador.elementos('/no_json')) == ([], False)
@@ -0,0 +1,133 @@
+# Planificador de escrituras: prioridades, combinación y orden por clave, reintentos y
+# tope de peticiones por segundo, con un cliente falso que registra las peticiones
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from planificador import PRIORIDAD_CONCESION, PRIORIDAD_REVOCACION, PlanificadorEscrituras, combinar_futuros
+
+Respuesta = namedtuple('Respuesta', 'status ok')
+OK = Respuesta(200, True)
+ANULADA = Respuesta(0, False)
+
+
+class ClienteFalso:
+    def __init__(self, respuestas=None):
+        self.base_url = 'http://falso'
+        self.peticiones = []         # (método, nombre del flow)
+        self.respuestas = respuestas or {}  # nombre -> [respuestas a devolver en orden]
+        self.puerta = threading.Event()
+        self.puerta.set()
+        self.en_vuelo = {}
+        self.solapadas = 0
+        self.lock = threading.Lock()
+
+    def peticion(self, metodo, ruta, datos):
+        nombre = datos['name']
+        with self.lock:
+            self.peticiones.append((metodo, nombre))
+            if self.en_vuelo.get(nombre):
+                self.solapadas += 1
+            self.en_vuelo[nombre] = self.en_vuelo.get(nombre, 0) + 1
+        self.puerta.wait(2)
+        with self.lock:
+            self.en_vuelo[nombre] -= 1
+            pendientes = self.respuestas.get(nombre)
+            return pendientes.pop(0) if pendientes else OK
+
+
+def enviar(planificador, cliente, metodo, nombre, prioridad=PRIORIDAD_CONCESION):
+    return planificador.enviar(cliente, metodo, '/wm/staticflowpusher/json', {"name": nombre}, nombre, prioridad)
+
+
+def esperar_envio(cliente, cantidad):
+    limite = time.monotonic() + 2
+    while len(cliente.peticiones) < cantidad and time.monotonic() < limite:
+        time.sleep(0.001)
+
+
+def test_revocaciones_antes_que_concesiones():
+    planificador = PlanificadorEscrituras(concurrencia=1, anulada=ANULADA)
+    cliente = ClienteFalso()
+    cliente.puerta.clear()
+    primero = enviar(planificador, cliente, 'POST', 'a')
+    esperar_envio(cliente, 1)
+    futuros = [enviar(planificador, cliente, 'POST', 'b'), enviar(planificador, cliente, 'POST', 'c'),
+               enviar(planificador, cliente, 'DELETE', 'd', PRIORIDAD_REVOCACION)]
+    cliente.puerta.set()
+    assert all(f.result(2).ok for f in [primero] + futuros)
+    assert cliente.peticiones == [('POST', 'a'), ('DELETE', 'd'), ('POST', 'b'), ('POST', 'c')]
+
+
+def test_operaciones_pendientes_sobre_la_misma_clave_se_combinan():
+    planificador = PlanificadorEscrituras(concurrencia=1, anulada=ANULADA)
+    cliente = ClienteFalso()
+    cliente.puerta.clear()
+    enviar(planificador, cliente, 'POST', 'ocupado')
+    esperar_envio(cliente, 1)
+    alta = enviar(planificador, cliente, 'POST', 'x')
+    repetida = enviar(planificador, cliente, 'POST', 'x')
+    baja = enviar(planificador, cliente, 'DELETE', 'x')
+    # La baja reemplaza a las altas que todavía no se enviaron
+    assert alta.result(2) is ANULADA and repetida.result(2) is ANULADA
+    cliente.puerta.set()
+    assert baja.result(2).ok
+    assert cliente.peticiones == [('POST', 'ocupado'), ('DELETE', 'x')]
+    assert planificador.estado()["anuladas"] == 2
+
+
+def test_nunca_dos_escrituras_de_la_misma_clave_a_la_vez():
+    planificador = PlanificadorEscrituras(concurrencia=8, anulada=ANULADA)
+    cliente = ClienteFalso()
+    cliente.puerta.clear()
+    enviar(planificador, cliente, 'POST', 'x')
+    esperar_envio(cliente, 1)
+    # Con la primera en curso, la siguiente sobre la misma clave espera su turno
+    segunda = enviar(planificador, cliente, 'DELETE', 'x')
+    otras = [enviar(planificador, cliente, 'POST', f'y{i}') for i in range(4)]
+    esperar_envio(cliente, 5)
+    assert ('DELETE', 'x') not in cliente.peticiones
+    cliente.puerta.set()
+    assert segunda.result(2).ok and all(f.result(2).ok for f in otras)
+    assert cliente.peticiones.index(('DELETE', 'x')) > 0
+    assert cliente.solapadas == 0
+    assert planificador.esperar(2)
+
+
+def test_reintenta_fallos_transitorios():
+    planificador = PlanificadorEscrituras(concurrencia=2, reintentos=3, espera_base=0.001, espera_maxima=0.01,
+                                          reintentable=lambda r: r.status == 503, anulada=ANULADA)
+    cliente = ClienteFalso({'x': [Respuesta(503, False), Respuesta(503, False)],
+                            'y': [Respuesta(400, False)],
+                            'z': [Respuesta(503, False)] * 4})
+    x, y, z = (enviar(planificador, cliente, 'POST', nombre) for nombre in 'xyz')
+    assert x.result(2).ok
+    # Un error definitivo no se reintenta; uno transitorio, hasta agotar los reintentos
+    assert y.result(2).status == 400
+    assert z.result(2).status == 503
+    assert cliente.peticiones.count(('POST', 'x')) == 3
+    assert cliente.peticiones.count(('POST', 'y')) == 1
+    assert cliente.peticiones.count(('POST', 'z')) == 4
+    estado = planificador.estado()
+    assert estado["reintentos"] == 5 and estado["fallidas"] == 2 and estado["completadas"] == 1
+
+
+def test_tope_de_peticiones_por_segundo():
+    planificador = PlanificadorEscrituras(concurrencia=4, tasa=100, rafaga=1, anulada=ANULADA)
+    cliente = ClienteFalso()
+    inicio = time.monotonic()
+    futuros = [enviar(planificador, cliente, 'POST', f'f{i}') for i in range(11)]
+    assert all(f.result(2).ok for f in futuros)
+    # 11 peticiones a 100/s sin ráfaga: al menos 10 intervalos de 10 ms
+    assert time.monotonic() - inicio >= 0.09
+
+
+def test_combinar_futuros_devuelve_el_primer_fallo():
+    futuros = [Future() for _ in range(3)]
+    combinado = combinar_futuros(futuros)
+    futuros[0].set_result(OK)
+    futuros[2].set_result(Respuesta(404, False))
+    assert not combinado.done()
+    futuros[1].set_result(Respuesta(500, False))
+    assert combinado.result(0).status == 500
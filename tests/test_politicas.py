@@ -0,0 +1,94 @@
+# Motor de políticas con bitsets: matriz compilada, consultas, simulación y diferencia
+from types import SimpleNamespace
+
+import pytest
+
+from politicas import MatrizPoliticas, PoliticaCurso, bitset, contar, indices
+
+SERVICIOS = [('Servidor 1', 'ssh'), ('Servidor 1', 'web'), ('Servidor 2', 'ftp')]
+
+
+def matriz():
+    codigos = ['a0', 'a1', 'a2', 'a3']
+    politicas = {
+        'redes': PoliticaCurso('redes', 'DICTANDO', bitset([0, 1]), bitset([0, 1])),
+        'sistemas': PoliticaCurso('sistemas', 'DICTANDO', bitset([1, 2]), bitset([2])),
+        'pendiente': PoliticaCurso('pendiente', 'PENDIENTE', bitset([3]), bitset([0])),
+    }
+    return MatrizPoliticas(codigos, SERVICIOS, politicas)
+
+
+def test_bitsets():
+    assert bitset([]) == 0
+    assert bitset([0, 3, 9]) == 0b1000001001
+    posiciones = [0, 7, 8, 63, 64, 1000]
+    assert indices(bitset(posiciones)) == posiciones
+    assert indices(0) == []
+    assert contar(bitset(posiciones)) == len(posiciones)
+
+
+def test_consultas():
+    m = matriz()
+    assert m.permitido('a1', 'servidor 1', 'SSH')
+    assert m.permitido('a1', 'Servidor 2', 'ftp')
+    assert not m.permitido('a0', 'Servidor 2', 'ftp')
+    # Un curso que no se está dictando no da acceso
+    assert not m.permitido('a3', 'Servidor 1', 'ssh')
+    assert not m.permitido('a9', 'Servidor 1', 'ssh') and not m.permitido('a0', 'Servidor 9', 'ssh')
+    assert m.permitidos([('a0', 'Servidor 1', 'web'), ('a2', 'Servidor 1', 'web')]) == [True, False]
+    assert m.quienes('Servidor 1', 'ssh') == ['a0', 'a1']
+    assert m.accesos('a1') == SERVICIOS
+    assert m.cursos_que_autorizan('a1', 'Servidor 1', 'ssh') == ['redes']
+    assert m.resumen() == [('Servidor 1', 'ssh', 2), ('Servidor 1', 'web', 2), ('Servidor 2', 'ftp', 2)]
+    assert m.total() == 6 == len(list(m.pares()))
+
+
+def test_simular_no_toca_la_matriz_original():
+    m = matriz()
+    simulada = m.simular(estados={'pendiente': 'DICTANDO', 'sistemas': 'TERMINADO'},
+                         altas=[('redes', 'nuevo')], bajas=[('redes', 'a0')])
+    assert simulada.permitido('a3', 'Servidor 1', 'ssh')
+    assert simulada.permitido('nuevo', 'Servidor 1', 'web')
+    assert not simulada.permitido('a0', 'Servidor 1', 'ssh')
+    assert not simulada.permitido('a2', 'Servidor 2', 'ftp')
+    # Los índices existentes se comparten y el alumno nuevo va al final
+    assert simulada.codigos[:4] == m.codigos and simulada.codigos[4] == 'nuevo'
+    assert m.permitido('a0', 'Servidor 1', 'ssh') and not m.permitido('nuevo', 'Servidor 1', 'web')
+    assert m.politicas['sistemas'].estado == 'DICTANDO'
+    with pytest.raises(LookupError):
+        m.simular(altas=[('inexistente', 'a0')])
+
+
+def test_diferencia_de_accesos():
+    m = matriz()
+    simulada = m.simular(estados={'pendiente': 'DICTANDO'}, altas=[('sistemas', 'nuevo')],
+                         bajas=[('redes', 'a0'), ('sistemas', 'a1')])
+    ganados, perdidos = m.diferencia(simulada)
+    assert sorted(ganados) == [('a3', 'Servidor 1', 'ssh'), ('nuevo', 'Servidor 2', 'ftp')]
+    # a1 sigue en redes (ssh, web) pero pierde ftp; a0 pierde todo lo de redes
+    assert sorted(perdidos) == [('a0', 'Servidor 1', 'ssh'), ('a0', 'Servidor 1', 'web'),
+                                ('a1', 'Servidor 2', 'ftp')]
+    assert m.diferencia(m.simular()) == ([], [])
+
+
+class CursoFalso:
+    def __init__(self, codigo, estado, alumnos, permisos):
+        self.codigo, self.estado = codigo, estado
+        self.alumnos = [SimpleNamespace(codigo=c) for c in alumnos]
+        self.servidores = [SimpleNamespace(nombre=s, servicios=[SimpleNamespace(nombre=n) for n in ns])
+                           for s, ns in permisos]
+
+    def servicios_de(self, servidor):
+        return servidor.servicios
+
+
+def test_desde_cursos_comparte_indices():
+    cursos = [CursoFalso(1, 'DICTANDO', [20, 21], [('Servidor 1', ['ssh', 'web'])]),
+              CursoFalso(2, 'DICTANDO', [21, 22], [('servidor 1', ['SSH']), ('Servidor 2', ['ftp'])])]
+    m = MatrizPoliticas.desde_cursos(cursos)
+    # Alumnos y servicios repetidos entre cursos ocupan una sola posición
+    assert m.codigos == ['20', '21', '22']
+    assert m.servicios == SERVICIOS
+    assert m.quienes('Servidor 1', 'ssh') == ['20', '21', '22']
+    assert m.quienes('Servidor 2', 'ftp') == ['21', '22']
+    assert m.cursos_que_autorizan('21', 'Servidor 1', 'ssh') == ['1', '2']
@@ -0,0 +1,66 @@
+# Reconciliación con el static flow pusher contra el Floodlight simulado del benchmark,
+# incluidos los cambios que otros hilos hacen en el registro mientras se compara
+import pytest
+
+import benchmark
+import main
+
+
+@pytest.fixture
+def floodlight(tmp_path, monkeypatch, capsys):
+    falso = benchmark.FloodlightFalso(hosts=40, servidores=3, switches=4)
+    anterior = main.controlador.base_url
+    main.configurar_controlador(falso.iniciar(), timeout=10)
+    monkeypatch.setattr(main.escrituras, 'tasa', 0)
+    ruta = str(tmp_path / 'datos.yaml')
+    benchmark.generar_yaml(ruta, 40, 3, 3, 20)
+    assert main.cargar_datos(ruta)
+    yield falso
+    for registro in (main.alumnos, main.servidores, main.cursos, main.conexiones):
+        registro.reemplazar([])
+    main.configurar_controlador(anterior)
+    falso.detener()
+
+
+def tabla_igual_al_registro(falso):
+    return set(falso.flows) == {nombre for conexion in main.conexiones for nombre in conexion.flows}
+
+
+def test_repara_y_adopta(floodlight):
+    solicitudes = main.solicitudes_de_cursos()
+    main.crear_conexiones_masivas(solicitudes[:10])
+    conexiones = list(main.conexiones)
+    faltante = conexiones[0].flows[0]
+    del floodlight.flows[faltante]
+    # Flows de una conexión que el registro local perdió (p. ej. tras un reinicio)
+    perdida = conexiones[1]
+    main.conexiones.quitar(perdida)
+
+    resultado = main.reconciliar()
+    assert [flow['name'] for flow in resultado['agregar']] == [faltante]
+    assert resultado['adoptadas'] == [perdida.handler] and not resultado['fallidos']
+    assert sorted(main.conexiones.get(perdida.handler).flows) == sorted(perdida.flows)
+    assert tabla_igual_al_registro(floodlight)
+
+
+def test_respeta_los_cambios_hechos_durante_la_comparacion(floodlight, monkeypatch):
+    solicitudes = main.solicitudes_de_cursos()
+    main.crear_conexiones_masivas(solicitudes[:10])
+    quitada = list(main.conexiones)[0].handler
+    flows_de_conexion = main.flows_de_conexion
+    cambios = []
+
+    # Mientras se calculan los flows esperados otro hilo quita una conexión y crea otra
+    def concurrente(*args, **kwargs):
+        if not cambios:
+            cambios.append(main.desconectar(quitada))
+            cambios.append(main.conectar(*solicitudes[15]))
+        return flows_de_conexion(*args, **kwargs)
+
+    monkeypatch.setattr(main, 'flows_de_conexion', concurrente)
+    resultado = main.reconciliar()
+    assert cambios[0] == (True, None) and cambios[1][1] is None
+    assert not resultado['fallidos']
+    assert not main.conexiones.tiene(quitada)
+    assert main.conexiones.tiene(cambios[1][0].handler)
+    assert tabla_igual_al_registro(floodlight)
@@ -0,0 +1,90 @@
+# Ida y vuelta del snapshot binario: guardar, volver a cargar y comparar, sin ninguna
+# llamada al controlador
+import struct
+
+import pytest
+
+import main
+import snapshot
+
+
+class ControladorProhibido:
+    def __getattr__(self, nombre):
+        raise AssertionError(f"llamada al controlador: {nombre}")
+
+
+@pytest.fixture
+def estado(monkeypatch):
+    monkeypatch.setattr(main, 'controlador', ControladorProhibido())
+    web = main.Servicio('web', 'TCP', 80)
+    ssh = main.Servicio('ssh', 'TCP', 22)
+    servidor = main.Servidor('Servidor 1', '10.0.0.3', [web, ssh])
+    otro = main.Servidor('Servidor 2', '10.0.0.4', [main.Servicio('ftp', 'TCP', 21)])
+    ana = main.Alumno('Ana', 20210001, 'fa:16:3e:00:00:01')
+    luis = main.Alumno('Luis', 20210002, 'fa:16:3e:00:00:02')
+    curso = main.Curso('Redes', 'DICTANDO', 'TEL354')
+    curso.add_alumno(ana)
+    curso.add_alumno(luis)
+    curso.add_servidor(servidor, ['web'])
+    curso.add_servidor(otro)
+    main.alumnos.reemplazar([ana, luis])
+    main.servidores.reemplazar([servidor, otro])
+    main.cursos.reemplazar([curso])
+    main.indice_autorizacion.construir(main.cursos)
+    conexion = main.Conexion('20210001-Servidor 1-web', ana, servidor, web,
+                             ['20210001-Servidor 1-web.0.ida', '20210001-Servidor 1-web.0.vuelta'])
+    main.conexiones.reemplazar([conexion])
+    yield
+    for registro in (main.alumnos, main.servidores, main.cursos, main.conexiones):
+        registro.reemplazar([])
+
+
+def test_ida_y_vuelta(estado, tmp_path):
+    ruta = str(tmp_path / 'estado.snap')
+    antes = main.secciones_estado()
+    assert main.guardar_datos(ruta, 'snap')
+    for registro in (main.alumnos, main.servidores, main.cursos, main.conexiones):
+        registro.reemplazar([])
+
+    assert main.cargar_datos(ruta)
+    assert main.secciones_estado() == antes
+    conexion = main.conexiones.get('20210001-Servidor 1-web')
+    assert conexion.flows == ['20210001-Servidor 1-web.0.ida', '20210001-Servidor 1-web.0.vuelta']
+    # Las referencias apuntan a los objetos recargados y el índice de autorización se
+    # reconstruye
+    assert conexion.servidor is main.servidores.get('Servidor 1')
+    assert conexion.servicio in list(conexion.servidor.servicios)
+    luis = next(a for a in main.alumnos if str(a.codigo) == '20210002')
+    assert main.autorizar(luis, 'Servidor 1', 'web')
+    assert not main.autorizar(luis, 'Servidor 1', 'ssh')
+
+
+def test_rechaza_otra_version_de_python(estado, tmp_path):
+    ruta = tmp_path / 'estado.snap'
+    main.guardar_datos(str(ruta), 'snap')
+    datos = bytearray(ruta.read_bytes())
+    magic, version, cantidad, mayor, menor = snapshot._CABECERA.unpack_from(datos, 0)
+    snapshot._CABECERA.pack_into(datos, 0, magic, version, cantidad, mayor, menor + 1)
+    ruta.write_bytes(bytes(datos))
+
+    with pytest.raises(snapshot.ErrorSnapshot, match='Python'):
+        snapshot.Snapshot(str(ruta))
+    assert not main.cargar_datos(str(ruta))
+
+
+def test_curso_con_servidor_inexistente(estado, tmp_path):
+    ruta = str(tmp_path / 'estado.snap')
+    secciones = main.secciones_estado()
+    secciones['servidores'] = tuple(s for s in secciones['servidores'] if s[0] != 'Servidor 2')
+    snapshot.escribir_snapshot(ruta, secciones)
+
+    with snapshot.Snapshot(ruta) as snap, pytest.raises(snapshot.ErrorSnapshot, match='corrupto'):
+        main.leer_datos_snapshot(snap)
+    assert not main.cargar_datos(ruta)
+
+
+def test_cabecera_truncada(tmp_path):
+    ruta = tmp_path / 'estado.snap'
+    ruta.write_bytes(snapshot.MAGIC + struct.pack('<H', snapshot.VERSION))
+    with pytest.raises(snapshot.ErrorSnapshot, match='truncada'):
+        snapshot.Snapshot(str(ruta))
@@ -0,0 +1,114 @@
+# Rutas calculadas con la topología en memoria (BFS) y refresco incremental de enlaces
+from collections import namedtuple
+
+from topologia import Topologia
+
+Respuesta = namedtuple('Respuesta', 'status datos')
+Respuesta.ok = property(lambda r: r.status == 200)
+
+S1, S2, S3, S4 = (f"00:00:00:00:00:00:00:0{n}" for n in range(1, 5))
+
+
+def enlace(src, src_port, dst, dst_port):
+    return {"src-switch": src, "src-port": src_port, "dst-switch": dst, "dst-port": dst_port,
+            "direction": "bidirectional"}
+
+
+class ControladorFalso:
+    def __init__(self, switches, enlaces):
+        self.switches = switches
+        self.enlaces = list(enlaces)
+        self.consultas = []
+
+    def get(self, ruta):
+        self.consultas.append(ruta)
+        if ruta == '/wm/core/controller/switches/json':
+            return Respuesta(200, [{"switchDPID": dpid} for dpid in self.switches])
+        if ruta == '/wm/topology/links/json':
+            return Respuesta(200, self.enlaces)
+        return Respuesta(404, None)
+
+
+# Dos caminos de dos saltos entre S1 y S3: por S2 (puertos 2) y por S4 (puertos 3)
+def cuadrado():
+    return ControladorFalso([S1, S2, S3, S4], [enlace(S1, 2, S2, 1), enlace(S2, 2, S3, 1),
+                                               enlace(S1, 3, S4, 1), enlace(S4, 2, S3, 3)])
+
+
+def saltos(ruta):
+    return [(paso['switch'], paso['port']['shortPortNumber']) for paso in ruta]
+
+
+def test_ruta_con_el_formato_de_floodlight():
+    topologia = Topologia()
+    assert topologia.cargar(cuadrado())
+    # Con dos caminos iguales gana el vecino de menor DPID
+    assert saltos(topologia.ruta(S1, 10, S3, 20)) == [(S1, 10), (S1, 2), (S2, 1), (S2, 2), (S3, 1), (S3, 20)]
+    assert saltos(topologia.ruta(S1, 10, S1, 11)) == [(S1, 10), (S1, 11)]
+
+
+def test_la_ruta_se_recalcula_cuando_cae_un_enlace():
+    controlador = cuadrado()
+    topologia = Topologia()
+    topologia.cargar(controlador)
+    topologia.ruta(S1, 10, S3, 20)
+
+    del controlador.enlaces[0]  # cae S1-S2
+    assert topologia.refrescar(controlador) == (0, 1)
+    assert saltos(topologia.ruta(S1, 10, S3, 20)) == [(S1, 10), (S1, 3), (S4, 1), (S4, 2), (S3, 3), (S3, 20)]
+
+    controlador.enlaces.append(enlace(S1, 2, S2, 1))
+    assert topologia.refrescar(controlador) == (1, 0)
+    assert saltos(topologia.ruta(S1, 10, S3, 20))[2] == (S2, 1)
+
+
+def test_solo_se_descartan_los_arboles_que_usaban_el_enlace_caido():
+    # Triángulo: el árbol hacia S1 llega a S2 y S3 directo, sin usar S2-S3
+    controlador = ControladorFalso([S1, S2, S3], [enlace(S1, 2, S2, 1), enlace(S1, 3, S3, 1),
+                                                  enlace(S2, 3, S3, 2)])
+    topologia = Topologia()
+    topologia.cargar(controlador)
+    topologia.ruta(S2, 10, S1, 20)
+    topologia.ruta(S1, 10, S2, 20)
+    arbol_s1 = topologia.arboles[S1]
+
+    controlador.enlaces.pop()  # cae S2-S3
+    topologia.refrescar(controlador)
+    assert topologia.arboles.get(S1) is arbol_s1
+    # El árbol hacia S2 llegaba a S3 por ese enlace
+    assert S2 not in topologia.arboles
+    assert saltos(topologia.ruta(S3, 10, S2, 20)) == [(S3, 10), (S3, 1), (S1, 3), (S1, 2), (S2, 1), (S2, 20)]
+
+
+def test_sin_camino_o_switch_desconocido():
+    controlador = ControladorFalso([S1, S2, S3], [enlace(S1, 2, S2, 1)])
+    topologia = Topologia()
+    topologia.cargar(controlador)
+    assert topologia.ruta(S1, 1, S3, 1) is None
+    assert topologia.ruta(S1, 1, "00:00:00:00:00:00:00:09", 1) is None
+
+
+def test_enlaces_paralelos_usan_el_de_menor_puerto():
+    controlador = ControladorFalso([S1, S2], [enlace(S1, 5, S2, 6), enlace(S1, 2, S2, 3)])
+    topologia = Topologia()
+    topologia.cargar(controlador)
+    assert saltos(topologia.ruta(S1, 1, S2, 1)) == [(S1, 1), (S1, 2), (S2, 3), (S2, 1)]
+
+
+def test_asegurar_refresca_solo_cuando_vence_el_intervalo():
+    controlador = cuadrado()
+    topologia = Topologia(intervalo=3600)
+    topologia.asegurar(controlador)
+    topologia.asegurar(controlador)
+    assert controlador.consultas == ['/wm/core/controller/switches/json', '/wm/topology/links/json']
+    topologia.intervalo = 0
+    topologia.asegurar(controlador)
+    assert controlador.consultas[-1] == '/wm/topology/links/json' and len(controlador.consultas) == 3
+
+
+def test_falla_la_carga():
+    controlador = cuadrado()
+    controlador.get = lambda ruta: Respuesta(500, None)
+    topologia = Topologia()
+    assert not topologia.cargar(controlador)
+    assert not topologia.cargada and topologia.ruta(S1, 1, S3, 1) is None
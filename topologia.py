@@ -0,0 +1,157 @@
+# Topología local del controlador: grafo de switches y enlaces en memoria y
+# cálculo de rutas más cortas (BFS) sin consultar /wm/topology/route por cada ruta
+import threading
+import time
+from collections import deque
+
+
+def _dpid_switch(switch):
+    return switch.get('switchDPID') or switch.get('dpid')
+
+
+class Topologia:
+    def __init__(self, intervalo=10):
+        self.intervalo = intervalo # segundos entre refrescos incrementales de los enlaces
+        self.switches = set()
+        self.adyacencia = {}       # dpid -> {vecino: (puerto local, puerto del vecino)}
+        self.enlaces = set()       # (src, src_port, dst, dst_port)
+        self.arboles = {}          # dpid destino -> {dpid: (siguiente dpid, puerto de salida)}
+        self.cargada = False
+        self.actualizada = None
+        self.ultimo_intento = None
+        self.lock = threading.Lock()
+        self.lock_carga = threading.Lock() # una sola carga/refresco a la vez
+
+    # Carga completa: lista de switches y de enlaces (dos llamadas)
+    def cargar(self, cliente):
+        response = cliente.get('/wm/core/controller/switches/json')
+        if not response.ok:
+            print(f"Error al consultar los switches | STATUS: {response.status}")
+            return False
+        enlaces = self._consultar_enlaces(cliente)
+        if enlaces is None:
+            return False
+        with self.lock:
+            self.switches = {_dpid_switch(s) for s in response.datos or [] if _dpid_switch(s)}
+            self.enlaces = set()
+            self.adyacencia = {dpid: {} for dpid in self.switches}
+            self.arboles.clear()
+            self._aplicar(enlaces, set())
+            self.cargada = True
+            self.actualizada = time.monotonic()
+        return True
+
+    def _consultar_enlaces(self, cliente):
+        response = cliente.get('/wm/topology/links/json')
+        if not response.ok:
+            print(f"Error al consultar los enlaces | STATUS: {response.status}")
+            return None
+        return {(e['src-switch'], int(e['src-port']), e['dst-switch'], int(e['dst-port']))
+                for e in response.datos or []}
+
+    def _reconstruir_adyacencia(self, switches_afectados):
+        for dpid in switches_afectados:
+            self.adyacencia[dpid] = {}
+        for src, src_port, dst, dst_port in sorted(self.enlaces):
+            # Con enlaces paralelos se queda el de menor puerto (orden determinista)
+            if src in switches_afectados:
+                self.adyacencia[src].setdefault(dst, (src_port, dst_port))
+            if dst in switches_afectados:
+                self.adyacencia[dst].setdefault(src, (dst_port, src_port))
+
+    def _aplicar(self, agregados, eliminados):
+        self.enlaces -= eliminados
+        self.enlaces |= agregados
+        afectados = set()
+        for src, _, dst, _ in agregados | eliminados:
+            afectados.update((src, dst))
+        self.switches |= afectados
+        self._reconstruir_adyacencia(afectados)
+
+        if agregados:
+            # Un enlace nuevo puede acortar cualquier ruta
+            self.arboles.clear()
+        elif eliminados:
+            # Solo se descartan los árboles que usaban algún enlace eliminado
+            pares = {(src, dst) for src, _, dst, _ in eliminados}
+            pares |= {(dst, src) for src, dst in pares}
+            for destino in list(self.arboles):
+                arbol = self.arboles[destino]
+                if any((dpid, siguiente) in pares for dpid, (siguiente, _) in arbol.items()):
+                    del self.arboles[destino]
+
+    # Refresco incremental: una consulta de enlaces y solo se aplican las diferencias.
+    # Devuelve (enlaces agregados, enlaces eliminados)
+    def refrescar(self, cliente):
+        if not self.cargada:
+            return (len(self.enlaces), 0) if self.cargar(cliente) else (0, 0)
+        enlaces = self._consultar_enlaces(cliente)
+        if enlaces is None:
+            return 0, 0
+        with self.lock:
+            agregados = enlaces - self.enlaces
+            eliminados = self.enlaces - enlaces
+            if agregados or eliminados:
+                self._aplicar(agregados, eliminados)
+            self.actualizada = time.monotonic()
+        return len(agregados), len(eliminados)
+
+    def _vencida(self, marca):
+        return marca is None or time.monotonic() - marca >= self.intervalo
+
+    # Carga la topología si hace falta o la refresca si venció el intervalo. Si la carga
+    # falla no se reintenta hasta el siguiente intervalo
+    def asegurar(self, cliente):
+        if self.cargada and not self._vencida(self.actualizada):
+            return
+        with self.lock_carga:
+            if not self.cargada:
+                if self._vencida(self.ultimo_intento):
+                    self.ultimo_intento = time.monotonic()
+                    self.cargar(cliente)
+            elif self._vencida(self.actualizada):
+                self.refrescar(cliente)
+
+    def invalidar(self):
+        with self.lock:
+            self.cargada = False
+            self.ultimo_intento = None
+            self.arboles.clear()
+
+    # Árbol de caminos más cortos hacia un destino (BFS sobre el grafo no dirigido)
+    def _arbol(self, destino):
+        arbol = self.arboles.get(destino)
+        if arbol is not None:
+            return arbol
+        arbol = {destino: (None, None)}
+        cola = deque([destino])
+        while cola:
+            actual = cola.popleft()
+            for vecino in sorted(self.adyacencia.get(actual, {})):
+                if vecino not in arbol:
+                    puerto_vecino, _ = self.adyacencia[vecino][actual]
+                    arbol[vecino] = (actual, puerto_vecino)
+                    cola.append(vecino)
+        self.arboles[destino] = arbol
+        return arbol
+
+    # Misma forma que devuelve /wm/topology/route: pares (switch, puerto de entrada),
+    # (switch, puerto de salida) desde el origen hasta el destino. None si no hay camino
+    def ruta(self, src_dpid, src_port, dst_dpid, dst_port):
+        with self.lock:
+            if src_dpid not in self.switches or dst_dpid not in self.switches:
+                return None
+            arbol = self._arbol(dst_dpid)
+            if src_dpid not in arbol:
+                return None
+            ruta = []
+            actual, entrada = src_dpid, int(src_port)
+            while actual != dst_dpid:
+                siguiente, salida = arbol[actual]
+                ruta.append({'switch': actual, 'port': {'shortPortNumber': entrada}})
+                ruta.append({'switch': actual, 'port': {'shortPortNumber': salida}})
+                entrada = self.adyacencia[siguiente][actual][0]
+                actual = siguiente
+            ruta.append({'switch': dst_dpid, 'port': {'shortPortNumber': entrada}})
+            ruta.append({'switch': dst_dpid, 'port': {'shortPortNumber': int(dst_port)}})
+            return ruta